@@ -3,6 +3,17 @@ ASGI config for abc_recon project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Under ASGI the async list endpoints (recon/async/...) wait on the database without
+holding a worker per request, and the progress endpoint (recon/progress/<id>/) streams
+Server-Sent Events as a run goes; through WSGI it can only answer with the events so far.
+The other views run in a thread pool as under WSGI.
+Serve it with uvicorn workers, e.g.:
+
+    gunicorn abc_recon.asgi:application -k uvicorn.workers.UvicornWorker -w 4
+
+or ``uvicorn abc_recon.asgi:application --workers 4``. ``manage.py benchmark_async``
+compares the concurrent throughput of both entry points.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
@@ -51,6 +51,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'recon.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -97,10 +98,116 @@ DATABASES = {
         'USER': str(os.getenv('USER')),
         'PASSWORD': str(os.getenv('PASSWORD')),
         'HOST': str(os.getenv('HOST')),
-        "OPTIONS": {"driver": "ODBC Driver 17 for SQL Server"},
+        # Persistent connections: keep a connection open for CONN_MAX_AGE seconds instead of
+        # a new ODBC handshake per request, and check it is still usable before reusing it
+        'CONN_MAX_AGE': int(os.getenv('CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': os.getenv('CONN_HEALTH_CHECKS', 'True') == 'True',
+        # The ODBC options only apply to mssql-django
+        "OPTIONS": {
+            "driver": os.getenv('DRIVER', "ODBC Driver 17 for SQL Server"),
+            "connection_timeout": int(os.getenv('CONNECTION_TIMEOUT', 0)),
+            "connection_retries": int(os.getenv('CONNECTION_RETRIES', 5)),
+            "connection_retry_backoff_time": int(os.getenv('CONNECTION_RETRY_BACKOFF_TIME', 5)),
+        } if 'mssql' in str(os.getenv('ENGINE')) else {},
     },
 }
 
+# Optional read replica for the heavy read-only queries, see recon.routers.ReplicaRouter.
+# Unset REPLICA_* values fall back to the primary's.
+if os.getenv('REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': str(os.getenv('REPLICA_NAME', os.getenv('NAME'))),
+        'USER': str(os.getenv('REPLICA_USER', os.getenv('USER'))),
+        'PASSWORD': str(os.getenv('REPLICA_PASSWORD', os.getenv('PASSWORD'))),
+        'HOST': str(os.getenv('REPLICA_HOST')),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['recon.routers.ReplicaRouter']
+
+# ODBC driver manager pooling, read by mssql-django
+DATABASE_CONNECTION_POOLING = os.getenv('DATABASE_CONNECTION_POOLING', 'True') == 'True'
+
+# Rows per bulk_create when ingesting uploaded workbooks into Recon
+RECON_INGEST_BATCH_SIZE = int(os.getenv('RECON_INGEST_BATCH_SIZE', 1000))
+
+
+# Transactions extract planner (recon.extract): parallel queries per worker, and how many
+# missing days between two uploaded days are still fetched in a single query
+RECON_EXTRACT_WORKERS = int(os.getenv('RECON_EXTRACT_WORKERS', 4))
+RECON_EXTRACT_MAX_GAP_DAYS = int(os.getenv('RECON_EXTRACT_MAX_GAP_DAYS', 0))
+# Clean the upload on a worker thread while the extract runs (recon.index), 0 to run them in sequence
+RECON_OVERLAP_UPLOAD = os.getenv('RECON_OVERLAP_UPLOAD', '1') == '1'
+# Memory bound in MB of each worker's cache of cleaned extracts of closed days (recon.extract_cache),
+# 0 to disable. Closed days of Transactions are assumed not to change afterwards.
+RECON_EXTRACT_CACHE_MB = int(os.getenv('RECON_EXTRACT_CACHE_MB', 256))
+
+# Streaming zip exports (recon.exports): rows per CSV chunk and threads rendering chunks
+RECON_EXPORT_CHUNK_ROWS = int(os.getenv('RECON_EXPORT_CHUNK_ROWS', 50000))
+RECON_EXPORT_WORKERS = int(os.getenv('RECON_EXPORT_WORKERS', 2))
+
+# Local memory is per process: with several workers, point CACHE_BACKEND/CACHE_LOCATION at a
+# shared cache (Redis, Memcached, database) so invalidation reaches every worker. Until then
+# RECON_RESPONSE_CACHE_TIMEOUT bounds how long another worker can serve a stale list. The
+# exclusion rules do not depend on it, see RECON_RULES_CHECK_SECONDS.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'recon'),
+    }
+}
+
+# Seconds the exceptions and stats lists stay cached per bank (recon.cache)
+RECON_RESPONSE_CACHE_TIMEOUT = int(os.getenv('RECON_RESPONSE_CACHE_TIMEOUT', 60))
+
+# Seconds a worker keeps using its compiled exclusion rules before it checks their version in the
+# database again (recon.rules): the longest a rule edited through another worker goes unseen
+RECON_RULES_CHECK_SECONDS = int(os.getenv('RECON_RULES_CHECK_SECONDS', 5))
+
+# Where the merged frame of each reconciliation run is kept (recon.artifacts)
+RECON_ARTIFACTS_DIR = os.getenv('RECON_ARTIFACTS_DIR', BASE_DIR / 'artifacts')
+
+# Out-of-core reconciliation (recon.external): memory budget per side for buffered rows before
+# a sorted run is spilled, and where runs are spilled (the system temp directory when unset)
+RECON_EXTERNAL_MEMORY_MB = int(os.getenv('RECON_EXTERNAL_MEMORY_MB', 256))
+RECON_EXTERNAL_SPILL_DIR = os.getenv('RECON_EXTERNAL_SPILL_DIR')
+
+# One reconciliation per bank at a time (recon.locks): the lease in seconds, renewed while the run
+# goes, after which a lock left by a crashed worker can be taken over, and how long a request
+# waits for a running one
+RECON_RUN_LOCK_TTL = int(os.getenv('RECON_RUN_LOCK_TTL', 900))
+RECON_RUN_LOCK_WAIT = float(os.getenv('RECON_RUN_LOCK_WAIT', 0))
+
+# Admission control of reconciliation and settlement uploads (recon.admission): concurrent runs
+# over all workers and per bank (0 for no limit), keep the global one below the worker count.
+# A request waits RECON_ADMISSION_WAIT seconds for a slot, then gets a 429 with this Retry-After.
+RECON_HEAVY_RUNS = int(os.getenv('RECON_HEAVY_RUNS', 2))
+RECON_HEAVY_RUNS_PER_BANK = int(os.getenv('RECON_HEAVY_RUNS_PER_BANK', 1))
+RECON_ADMISSION_WAIT = float(os.getenv('RECON_ADMISSION_WAIT', 0))
+RECON_ADMISSION_RETRY_AFTER = int(os.getenv('RECON_ADMISSION_RETRY_AFTER', 30))
+
+# Progress of reconciliation and settlement runs (recon.progress), kept in the cache, which must
+# be shared by the workers (see CACHES): seconds between two published updates of a loop, and how
+# long the events are kept. Events are streamed as they come only under ASGI (abc_recon.asgi); a
+# stream ends after RECON_PROGRESS_STREAM_SECONDS and the client reconnects. Under WSGI a progress
+# request returns the events so far and the client reconnects after RECON_PROGRESS_POLL_SECONDS.
+RECON_PROGRESS_INTERVAL = float(os.getenv('RECON_PROGRESS_INTERVAL', 0.5))
+RECON_PROGRESS_TIMEOUT = int(os.getenv('RECON_PROGRESS_TIMEOUT', 3600))
+RECON_PROGRESS_STREAM_SECONDS = int(os.getenv('RECON_PROGRESS_STREAM_SECONDS', 300))
+RECON_PROGRESS_POLL_SECONDS = float(os.getenv('RECON_PROGRESS_POLL_SECONDS', 2))
+
+# Chunked uploads (recon.uploads): where chunks are kept and files assembled, on a disk every worker
+# sees; the default chunk size, the largest file accepted, and how long an upload is kept.
+RECON_UPLOADS_DIR = os.getenv('RECON_UPLOADS_DIR', BASE_DIR / 'chunked_uploads')
+RECON_UPLOAD_CHUNK_MB = int(os.getenv('RECON_UPLOAD_CHUNK_MB', 8))
+RECON_UPLOAD_MAX_MB = int(os.getenv('RECON_UPLOAD_MAX_MB', 1024))
+RECON_UPLOAD_TTL_HOURS = int(os.getenv('RECON_UPLOAD_TTL_HOURS', 24))
+
+# Response compression (recon.middleware): zlib level, 1 to 9, and the smallest body compressed
+RECON_COMPRESS_LEVEL = int(os.getenv('RECON_COMPRESS_LEVEL', 1))
+RECON_COMPRESS_MIN_BYTES = int(os.getenv('RECON_COMPRESS_MIN_BYTES', 1024))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -126,7 +233,11 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_PERMISSION_CLASSES':[
         'rest_framework.permissions.DjangoModelPermissionsOrAnonReadOnly'
-    ]
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'recon.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
 SIMPLE_JWT = {
@@ -169,6 +280,24 @@ SIMPLE_JWT = {
     #"SLIDING_TOKEN_REFRESH_SERIALIZER": "rest_framework_simplejwt.serializers.TokenRefreshSlidingSerializer",
 }
 
+# Logging
+# https://docs.djangoproject.com/en/4.2/topics/logging/
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'simple': {'format': '%(asctime)s %(levelname)s %(name)s: %(message)s'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'simple'},
+    },
+    'root': {
+        'handlers': ['console'],
+        'level': os.getenv('LOG_LEVEL', 'INFO'),
+    },
+}
+
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
 
@@ -2,7 +2,7 @@ from django.contrib import admin
 
 # Register your models here.
 from django.contrib import admin
-from .models import Bank,UserBankMapping,Recon
+from .models import Bank,UserBankMapping,Recon,ExclusionRule,ExclusionCondition
 
 # Register your models here.
 class BankAdmin(admin.ModelAdmin):
@@ -17,9 +17,19 @@ class ReconciliationAdmin(admin.ModelAdmin):
 class UploadedFilesAdmin(admin.ModelAdmin):
     list_display = ["file","time"]
 
+class ExclusionConditionInline(admin.TabularInline):
+    model = ExclusionCondition
+    extra = 1
+
+class ExclusionRuleAdmin(admin.ModelAdmin):
+    list_display = ["use_case","name","kind","active"]
+    list_filter = ["use_case","active"]
+    inlines = [ExclusionConditionInline]
+
 admin.site.register(UserBankMapping,MappedUserAdmin)
 admin.site.register(Bank,BankAdmin)
 admin.site.register(Recon,ReconciliationAdmin)
+admin.site.register(ExclusionRule,ExclusionRuleAdmin)
 
 
 
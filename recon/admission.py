@@ -0,0 +1,95 @@
+import random
+import time
+
+from django.conf import settings
+from rest_framework.exceptions import Throttled
+
+from .locks import acquire_lock, release_lock
+from .progress import request_reporter
+
+
+def acquire_slot(prefix, limit, ttl):
+    """
+    Try once to take one of `limit` lock rows named '{prefix}:0' .. '{prefix}:{limit - 1}'.
+
+    Returns:
+    (str, str): The slot name and owner token, or None when every slot is held.
+    """
+    # From a random slot, so that concurrent callers do not all race for slot 0
+    start = random.randrange(limit)
+    for i in range(limit):
+        name = f"{prefix}:{(start + i) % limit}"
+        owner = acquire_lock(name, ttl)
+        if owner is not None:
+            return name, owner
+    return None
+
+
+class AdmissionControlMixin:
+    """
+    Admit the heavy requests of an APIView (reconciliation, settlement) only while a slot is
+    free: at most RECON_HEAVY_RUNS runs at once over all workers, and RECON_HEAVY_RUNS_PER_BANK
+    for one bank. Slots are lock rows (recon.locks), shared by every worker and released when
+    the response is returned, or closed for a streamed one, or by their lease when a worker dies.
+
+    A request waits up to RECON_ADMISSION_WAIT seconds for a slot, then gets a 429 with a
+    Retry-After. Other requests are not limited, so the list and token endpoints keep the
+    workers the heavy runs would otherwise take.
+
+    Views set bank_code_from_request to the function mapping a request to its bank code, or to
+    None for users of no bank, who only take a global slot.
+    """
+    bank_code_from_request = None
+    heavy_methods = ('POST',)
+
+    def initial(self, request, *args, **kwargs):
+        # After authentication, the bank is the user's
+        super().initial(request, *args, **kwargs)
+        if request.method in self.heavy_methods:
+            try:
+                self.admit(type(self).bank_code_from_request(request))
+            except Throttled as e:
+                # The run will not start, a client following its progress is told so
+                request_reporter(request).finish('rejected', detail=str(e.detail), retry_after=e.wait)
+                raise
+
+    def admit(self, bank_code):
+        ttl = settings.RECON_RUN_LOCK_TTL
+        scopes = [("heavy:all", settings.RECON_HEAVY_RUNS, "all banks")]
+        if bank_code is not None:
+            # The bank's own slot first, a bank over its quota does not take a global slot
+            scopes.insert(0, (f"heavy:bank:{bank_code}", settings.RECON_HEAVY_RUNS_PER_BANK, f"bank {bank_code}"))
+        self._admission_slots = []
+        deadline = time.monotonic() + settings.RECON_ADMISSION_WAIT
+        for prefix, limit, label in scopes:
+            if limit <= 0:
+                continue
+            slot = acquire_slot(prefix, limit, ttl)
+            while slot is None and time.monotonic() < deadline:
+                time.sleep(0.5)
+                slot = acquire_slot(prefix, limit, ttl)
+            if slot is None:
+                self.release_admission()
+                raise Throttled(
+                    wait=settings.RECON_ADMISSION_RETRY_AFTER,
+                    detail=f"Too many reconciliation and settlement runs for {label}, retry later.",
+                )
+            self._admission_slots.append(slot)
+
+    def release_admission(self):
+        for name, owner in getattr(self, '_admission_slots', ()):
+            release_lock(name, owner)
+        self._admission_slots = []
+
+    def dispatch(self, request, *args, **kwargs):
+        response = None
+        try:
+            response = super().dispatch(request, *args, **kwargs)
+            return response
+        finally:
+            if response is not None and response.streaming:
+                # A streamed body (the settlement zips) is generated after dispatch returns, the
+                # slots are held until the server closes the response
+                response._resource_closers.append(self.release_admission)
+            else:
+                self.release_admission()
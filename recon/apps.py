@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ReconConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recon'
+
+    def ready(self):
+        # Connects the signals invalidating the compiled exclusion rules, registers the system checks
+        from . import checks, rules  # noqa: F401
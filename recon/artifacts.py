@@ -0,0 +1,136 @@
+import re
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import ReconArtifact
+
+MERGED = 'merged'
+PROFILE = 'profile'
+ALLOCATIONS = 'allocations'
+
+RECON_STATUSES = ['Reconciled', 'succunreconciled', 'Unreconciled']
+
+# Rows per Parquet row group. The file is sorted by TRN_REF, so a reference lookup only
+# decodes the row groups whose min/max statistics can contain it.
+ROW_GROUP_SIZE = 64 * 1024
+
+
+def artifact_path(recon_log, kind, suffix='.parquet'):
+    return Path(settings.RECON_ARTIFACTS_DIR) / str(recon_log.bank_id) / f"{recon_log.id}-{kind}{suffix}"
+
+
+def save_merged_artifact(recon_log, merged_df):
+    """
+    Keep the merged frame of a reconciliation run as a Parquet file linked to its ReconLog.
+
+    Parameters:
+    recon_log (ReconLog): The run.
+    merged_df (pandas.DataFrame): The outer merge returned by process_reconciliation.
+
+    Returns:
+    ReconArtifact: The recorded artifact.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # After pre_processing the columns are strings with NaN for the side a row is missing from;
+    # mixed objects (the backed up references) and categoricals are written as plain strings
+    df = merged_df.astype({
+        column: 'string' for column, dtype in merged_df.dtypes.items() if dtype == object or dtype == 'category'
+    })
+    df = df.sort_values('TRN_REF', kind='stable')
+
+    path = artifact_path(recon_log, MERGED)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), path,
+                   compression='zstd', row_group_size=ROW_GROUP_SIZE)
+
+    return ReconArtifact.objects.create(recon_log=recon_log, kind=MERGED, path=str(path), size=path.stat().st_size)
+
+
+def save_profile_artifacts(profiler, recon_log=None, batch=None):
+    """
+    Keep the .prof and the allocation report of a profiled request (see recon.profiling.RunProfiler),
+    linked to the run it recorded or, for settlements, to the batch.
+
+    Returns:
+    list of ReconArtifact: The profile and the allocation report.
+    """
+    if recon_log is None:
+        stamp = timezone.now().strftime('%Y%m%d%H%M%S%f')
+        label = re.sub(r'[^0-9a-zA-Z_-]', '', str(batch or '')) or 'request'
+
+    artifacts = []
+    for kind, suffix, data in [
+        (PROFILE, '.prof', profiler.profile_data()),
+        (ALLOCATIONS, '.txt', profiler.allocations_report().encode()),
+    ]:
+        if recon_log is not None:
+            path = artifact_path(recon_log, kind, suffix)
+        else:
+            path = Path(settings.RECON_ARTIFACTS_DIR) / 'profiles' / f"{stamp}-{label}-{kind}{suffix}"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        artifacts.append(ReconArtifact.objects.create(
+            recon_log=recon_log, batch=batch, kind=kind, path=str(path), size=len(data)
+        ))
+    return artifacts
+
+
+def normalize_ref(value):
+    # The same cleaning pre_processing applies to TRN_REF, see utils.normalize_refs
+    import pandas as pd
+    from recon.utils import normalize_refs
+
+    return normalize_refs(pd.Series([value], dtype=object)).iloc[0]
+
+
+def read_run_results(artifact):
+    """
+    Rebuild the reconciled and succunreconciled result frames of a run from its merged artifact,
+    as the reconciliation response returns them.
+
+    Returns:
+    tuple of pandas.DataFrame: The projected reconciled and succunreconciled rows.
+    """
+    import numpy as np
+    from recon.utils import RECONCILED_COLUMNS, SUCCUNRECONCILED_COLUMNS, project
+
+    merged_df = read_merged_artifact(artifact)
+    # Objects with NaN for the missing side, as process_reconciliation left them, in the key order of
+    # its outer merge rather than the TRN_REF order of the file
+    merged_df = merged_df.astype(object).where(merged_df.notna(), np.nan)
+    merged_df = merged_df.sort_values(['DATE_TIME', 'TRN_REF', 'AMOUNT'], kind='stable')
+
+    reconciled_data = merged_df[merged_df['Recon Status'] == 'Reconciled']
+    succunreconciled_data = merged_df[(merged_df['Recon Status'] == 'succunreconciled') & (merged_df['RESPONSE_CODE'] != '00')]
+    return (project(reconciled_data, RECONCILED_COLUMNS, dates=['DATE_TIME']),
+            project(succunreconciled_data, SUCCUNRECONCILED_COLUMNS))
+
+
+def read_merged_artifact(artifact, ref=None, status=None):
+    """
+    Read back the merged frame of a run, optionally only the rows of a reference and/or a recon status.
+
+    The reference is matched on the cleaned TRN_REF and on the references as uploaded or extracted
+    (Original_* columns). Filters are pushed down to the Parquet reader.
+
+    Returns:
+    pandas.DataFrame: The matching rows.
+    """
+    import pyarrow.parquet as pq
+
+    columns = set(pq.read_schema(artifact.path).names)
+    status_filter = [('Recon Status', '=', status)] if status else []
+
+    filters = None
+    if ref:
+        ref_filters = [('TRN_REF', '=', normalize_ref(ref))]
+        ref_filters += [(column, '=', str(ref)) for column in sorted(columns) if column.startswith('Original_')]
+        filters = [[ref_filter, *status_filter] for ref_filter in ref_filters]
+    elif status_filter:
+        filters = [status_filter]
+
+    return pq.read_table(artifact.path, filters=filters).to_pandas()
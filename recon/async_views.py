@@ -0,0 +1,122 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_cache_control
+from django.views import View
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from .cache import bank_cache_version, etag_matches, list_cache_key, list_etag
+from .models import UserBankMapping
+from .serializers import LogSerializer, ReconciliationSerializer, TransactionSerializer
+from .views import exceptions_queryset, recon_stats_queryset, reversals_queryset
+
+
+class AsyncBankListView(View):
+    """
+    Async version of a per-bank list endpoint, for ASGI deployments (see abc_recon/asgi.py).
+
+    The rows are read with the async ORM and streamed as a JSON array in chunks, serialized with
+    the same serializer as the DRF view, so the body is the same. With `cached`, the list is kept
+    like BankCachedListMixin does: a poll whose If-None-Match still matches gets a 304 without a query.
+
+    Under ASGI, Django runs each request's ORM calls on a thread of its own, so requests waiting on
+    the database no longer hold a worker each.
+    """
+    serializer_class = None
+    cached = False
+    chunk_size = 500
+
+    def get_queryset(self, bank_code):
+        raise NotImplementedError
+
+    async def authenticate(self, request):
+        # simplejwt is synchronous (it loads the user)
+        result = await sync_to_async(JWTAuthentication().authenticate)(request)
+        return result[0] if result else None
+
+    async def get(self, request):
+        try:
+            user = await self.authenticate(request)
+        except (AuthenticationFailed, InvalidToken) as e:
+            return JsonResponse({"detail": str(e.detail)}, status=401)
+        if user is None or not user.is_active:
+            return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+
+        mapping = await UserBankMapping.objects.select_related('bank').filter(user=user).afirst()
+        if mapping is None:
+            return JsonResponse({"detail": "No bank is mapped to this user."}, status=403)
+        bank_code = mapping.bank.bank_code
+
+        key = None
+        if self.cached:
+            version = await sync_to_async(bank_cache_version)(bank_code)
+            key = list_cache_key(type(self).__name__, bank_code, version, request.get_full_path())
+            cached = await cache.aget(key)
+            if cached is not None:
+                etag, data = cached
+                if etag_matches(request, etag):
+                    response = HttpResponse(status=304)
+                else:
+                    response = JsonResponse(data, safe=False, encoder=JSONEncoder)
+                response['ETag'] = etag
+                patch_cache_control(response, private=True, no_cache=True)
+                return response
+
+        # Compiling the exclusion rules may query the database
+        queryset = await sync_to_async(self.get_queryset)(bank_code)
+        response = StreamingHttpResponse(self.stream(queryset, key), content_type='application/json')
+        if self.cached:
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    async def stream(self, queryset, key):
+        data = []
+        chunk = []
+        yield b'['
+        async for row in queryset.aiterator(chunk_size=self.chunk_size):
+            chunk.append(row)
+            if len(chunk) == self.chunk_size:
+                yield self.render(self.serializer_class(chunk, many=True).data, first=not data, rendered=data)
+                chunk = []
+        if chunk:
+            yield self.render(self.serializer_class(chunk, many=True).data, first=not data, rendered=data)
+        yield b']'
+
+        if key is not None:
+            # Complete list only, the next poll gets it with its ETag
+            await cache.aset(key, (list_etag(data), data), settings.RECON_RESPONSE_CACHE_TIMEOUT)
+
+    @staticmethod
+    def render(rows, first, rendered):
+        body = json.dumps(rows, cls=JSONEncoder)[1:-1]
+        rendered.extend(rows)
+        return (body if first else ',' + body).encode()
+
+
+class AsyncExceptionsView(AsyncBankListView):
+    serializer_class = ReconciliationSerializer
+    cached = True
+
+    def get_queryset(self, bank_code):
+        return exceptions_queryset(bank_code)
+
+
+class AsyncReconStatsView(AsyncBankListView):
+    serializer_class = LogSerializer
+    cached = True
+
+    def get_queryset(self, bank_code):
+        return recon_stats_queryset(bank_code)
+
+
+class AsyncReversalsView(AsyncBankListView):
+    serializer_class = TransactionSerializer
+
+    def get_queryset(self, bank_code):
+        return reversals_queryset(bank_code)
@@ -0,0 +1,96 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def _version_key(bank_code):
+    return f"recon:bank-version:{bank_code}"
+
+
+def bank_cache_version(bank_code):
+    """
+    The current cache generation of a bank. Cached responses are keyed by it, so bumping it
+    (invalidate_banks) retires every cached response of the bank at once.
+    """
+    key = _version_key(bank_code)
+    # Start from the clock, an evicted counter must not come back to a generation already used
+    cache.add(key, time.time_ns(), None)
+    return cache.get(key)
+
+
+def invalidate_banks(bank_codes):
+    """
+    Retire the cached responses of the given banks.
+
+    Parameters:
+    bank_codes (iterable of str): Bank codes whose data changed. Empty values are ignored.
+    """
+    for bank_code in {str(code) for code in bank_codes if code}:
+        try:
+            cache.incr(_version_key(bank_code))
+        except ValueError:
+            cache.set(_version_key(bank_code), time.time_ns(), None)
+
+
+def list_cache_key(view_name, bank_code, version, full_path):
+    return "recon:list:{}:{}:{}:{}".format(
+        view_name, bank_code, version, hashlib.sha1(full_path.encode()).hexdigest(),
+    )
+
+
+def list_etag(data):
+    return quote_etag(hashlib.sha1(json.dumps(data, cls=JSONEncoder).encode()).hexdigest())
+
+
+def etag_matches(request, etag):
+    # A weak comparison: the compression middleware sends the ETag of a compressed response as weak
+    if_none_match = request.headers.get('If-None-Match')
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == '*' or etag.removeprefix('W/') in (tag.removeprefix('W/') for tag in parse_etags(if_none_match))
+
+
+class BankCachedListMixin:
+    """
+    Cache the serialized list of a ListAPIView per bank, and answer polls whose If-None-Match
+    still matches with 304 Not Modified.
+
+    Views set bank_code_from_request to the function mapping a request to its bank code;
+    writers call invalidate_banks() for the banks they touch.
+    """
+    bank_code_from_request = None
+
+    def get_bank_code(self):
+        # Looked up once per request, the permission check already calls get_queryset()
+        if not hasattr(self, '_bank_code'):
+            self._bank_code = type(self).bank_code_from_request(self.request)
+        return self._bank_code
+
+    def list(self, request, *args, **kwargs):
+        bank_code = self.get_bank_code()
+        key = list_cache_key(type(self).__name__, bank_code, bank_cache_version(bank_code), request.get_full_path())
+
+        cached = cache.get(key)
+        if cached is None:
+            data = self.get_serializer(self.filter_queryset(self.get_queryset()), many=True).data
+            cached = (list_etag(data), data)
+            cache.set(key, cached, settings.RECON_RESPONSE_CACHE_TIMEOUT)
+
+        etag, data = cached
+        if etag_matches(request, etag):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(data)
+
+        response['ETag'] = etag
+        # Per user, and always revalidated with the ETag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
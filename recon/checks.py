@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+# Backends whose entries only the process that wrote them can read
+LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches)
+def shared_cache_check(app_configs, **kwargs):
+    if settings.CACHES['default']['BACKEND'] not in LOCAL_CACHES:
+        return []
+    return [Warning(
+        "The default cache is local to each process.",
+        hint=(
+            "The progress of a run (recon.progress) is only seen by the worker running it, and the "
+            "bank lists are invalidated in that worker only. With more than one worker, set "
+            "CACHE_BACKEND and CACHE_LOCATION to a shared cache (Redis, Memcached, database)."
+        ),
+        id='recon.W001',
+    )]
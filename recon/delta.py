@@ -0,0 +1,108 @@
+from .artifacts import MERGED
+from .models import ReconArtifact, ReconLog
+
+DELTAS = ['newly_reconciled', 'newly_unmatched', 'resolved_exceptions']
+
+# The only columns read to compare two runs
+KEY_COLUMNS = ['TRN_REF', 'DATE_TIME', 'Recon Status', 'RESPONSE_CODE']
+
+
+def date_overlap(range_a, range_b):
+    """
+    The days two runs both requested, from their ReconLog.rq_date_range ('YYYY-MM-DD,YYYY-MM-DD').
+
+    Returns:
+    (str, str): First and last day as YYYYMMDD, the format of the merged DATE_TIME column, or None.
+    """
+    starts, ends = [], []
+    for date_range in (range_a, range_b):
+        start, _, end = (date_range or '').partition(',')
+        if not start or not end:
+            return None
+        starts.append(start.replace('-', ''))
+        ends.append(end.replace('-', ''))
+    start, end = max(starts), min(ends)
+    return (start, end) if start <= end else None
+
+
+def previous_run(recon_log):
+    """
+    The latest earlier run of the same bank with a kept merged frame whose dates overlap the run's.
+
+    Returns:
+    (ReconLog, ReconArtifact, (str, str)): The run, its merged artifact and the overlap, or None.
+    """
+    earlier = ReconLog.objects.filter(
+        bank_id=recon_log.bank_id, id__lt=recon_log.id, artifacts__kind=MERGED,
+    ).order_by('-id')
+    for candidate in earlier.iterator():
+        overlap = date_overlap(recon_log.rq_date_range, candidate.rq_date_range)
+        if overlap is not None:
+            return candidate, ReconArtifact.objects.filter(recon_log=candidate, kind=MERGED).first(), overlap
+    return None
+
+
+def read_run(artifact, overlap, columns=None):
+    import pyarrow.parquet as pq
+
+    start, end = overlap
+    return pq.read_table(artifact.path, columns=columns, filters=[('DATE_TIME', '>=', start), ('DATE_TIME', '<=', end)])
+
+
+def run_keys(table):
+    """
+    The distinct reference keys of a run, by outcome.
+
+    Parameters:
+    table (pyarrow.Table): Rows of a merged frame, at least KEY_COLUMNS.
+
+    Returns:
+    dict of pyarrow.Array: 'refs' (every key), 'reconciled' and 'exceptions' (reconciled with a failed response).
+    """
+    import pyarrow.compute as pc
+
+    reconciled = pc.fill_null(pc.equal(table['Recon Status'], 'Reconciled'), False)
+    failed = pc.not_equal(pc.fill_null(table['RESPONSE_CODE'], ''), '00')
+    return {
+        'refs': pc.unique(table['TRN_REF']),
+        'reconciled': pc.unique(pc.filter(table['TRN_REF'], reconciled)),
+        'exceptions': pc.unique(pc.filter(table['TRN_REF'], pc.and_(reconciled, failed))),
+    }
+
+
+def run_delta(artifact, previous_artifact, overlap):
+    """
+    What changed between two runs of a bank on the days both covered, computed on their reference
+    keys: references reconciled now and not before, references not reconciled now that were
+    reconciled or absent before, and exceptions of the previous run reconciled with a success now
+    or no longer reconciled.
+
+    Only the key columns of the previous run are read, and only the changed rows of the run are
+    converted to pandas.
+
+    Parameters:
+    artifact (ReconArtifact): The merged frame of the run.
+    previous_artifact (ReconArtifact): The merged frame of the earlier run.
+    overlap ((str, str)): First and last day, see date_overlap.
+
+    Returns:
+    dict of pandas.DataFrame: The rows of the run for each of DELTAS.
+    """
+    import pyarrow.compute as pc
+
+    table = read_run(artifact, overlap)
+    current = run_keys(table)
+    previous = run_keys(read_run(previous_artifact, overlap, columns=KEY_COLUMNS))
+
+    def isin(keys):
+        return pc.is_in(table['TRN_REF'], value_set=keys)
+
+    reconciled = isin(current['reconciled'])
+    previous_unmatched = pc.filter(previous['refs'], pc.invert(pc.is_in(previous['refs'], value_set=previous['reconciled'])))
+    masks = {
+        'newly_reconciled': pc.and_(reconciled, pc.invert(isin(previous['reconciled']))),
+        'newly_unmatched': pc.and_(pc.invert(reconciled), pc.invert(isin(previous_unmatched))),
+        # Rows of the run only, an exception missing from the new upload is not resolved
+        'resolved_exceptions': pc.and_(isin(previous['exceptions']), pc.invert(isin(current['exceptions']))),
+    }
+    return {name: table.filter(masks[name]).to_pandas() for name in DELTAS}
@@ -0,0 +1,92 @@
+import io
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from zipfile import ZIP_DEFLATED, ZipFile
+
+
+class _ZipSink(io.RawIOBase):
+    """
+    Write-only, non-seekable target for ZipFile. ZipFile then writes data descriptors
+    after each member instead of seeking back, so the archive can be sent as it is built.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _render_csv_chunk(df, start, chunk_rows):
+    return df.iloc[start:start + chunk_rows].to_csv(index=False, header=start == 0).encode()
+
+
+def stream_zip_csv(members, chunk_rows=50000, workers=2):
+    """
+    Build a zip archive with one CSV member per DataFrame and yield its bytes as they are produced.
+
+    Each frame is rendered `chunk_rows` rows at a time. Chunks are rendered ahead on a thread
+    pool (at most 2 * workers in flight) and written to the archive in order, so memory stays
+    bounded by a few chunks instead of every CSV plus the whole archive.
+
+    Parameters:
+    members (iterable of (str, pandas.DataFrame)): Member names and the frames to write.
+    chunk_rows (int): Rows per CSV chunk.
+    workers (int): Threads rendering CSV chunks.
+    """
+    tasks = (
+        (name, df, start)
+        for name, df in members
+        for start in range(0, max(len(df), 1), chunk_rows)
+    )
+    sink = _ZipSink()
+    executor = ThreadPoolExecutor(max_workers=workers)
+    pending = deque()
+
+    def submit_next():
+        task = next(tasks, None)
+        if task is not None:
+            name, df, start = task
+            pending.append((name, executor.submit(_render_csv_chunk, df, start, chunk_rows)))
+
+    member_name = None
+    try:
+        for _ in range(2 * workers):
+            submit_next()
+
+        zf = ZipFile(sink, 'w', compression=ZIP_DEFLATED)
+        member = None
+        while pending:
+            name, future = pending.popleft()
+            submit_next()
+            if name != member_name:
+                if member is not None:
+                    member.close()
+                # The size is not known up front, zip64 lets a member pass 2 GiB
+                member_name, member = name, zf.open(name, 'w', force_zip64=True)
+            member.write(future.result())
+            data = sink.drain()
+            if data:
+                yield data
+        if member is not None:
+            member.close()
+        # Central directory, written when the archive is closed
+        zf.close()
+        yield sink.drain()
+    except Exception as e:
+        # The headers are sent: without a central directory the client sees a broken archive, not a complete one
+        logging.error(f"Zip export failed while writing {member_name}: {str(e)}")
+        raise
+    finally:
+        # Chunks rendered ahead are dropped when the export fails or the client goes away
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,224 @@
+import heapq
+import tempfile
+from operator import itemgetter
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+# Join key of process_reconciliation
+KEY_COLUMNS = ['TRN_REF', 'DATE_TIME', 'AMOUNT']
+
+# The uploaded columns as process_reconciliation renames them
+UPLOADED_COLUMNS = {'Date': 'DATE_TIME', 'ABC Reference': 'TRN_REF', 'Amount': 'AMOUNT'}
+
+_SEQ = '_SEQ'
+
+
+class _SortedSpill:
+    """
+    One side of the reconciliation as sorted runs on disk.
+
+    Frames are buffered until they reach the memory budget, then sorted by (TRN_REF, arrival order)
+    and written as a Parquet run. Reading the runs back through a k-way merge gives every TRN_REF
+    once, with the values of its first row, which is what drop_duplicates(keep='first') keeps.
+    """
+
+    def __init__(self, directory, name, memory_budget):
+        self.directory = Path(directory)
+        self.name = name
+        self.memory_budget = memory_budget
+        self.columns = None
+        self.runs = []
+        self.buffer = []
+        self.buffered_bytes = 0
+        self.rows = 0
+        self.bytes = 0
+
+    def add(self, df):
+        if self.columns is None:
+            # Key columns first, the row tuples are compared on them
+            self.columns = KEY_COLUMNS + [column for column in df.columns if column not in KEY_COLUMNS]
+        df = df[self.columns].assign(**{_SEQ: np.arange(self.rows, self.rows + len(df))})
+        size = int(df.memory_usage(deep=True).sum())
+        self.buffer.append(df)
+        self.buffered_bytes += size
+        self.rows += len(df)
+        self.bytes += size
+        if self.buffered_bytes >= self.memory_budget:
+            self.flush()
+
+    def flush(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if not self.buffer:
+            return
+        run = pd.concat(self.buffer, ignore_index=True)
+        self.buffer, self.buffered_bytes = [], 0
+
+        run = run.sort_values(['TRN_REF', _SEQ], kind='stable').drop_duplicates('TRN_REF', keep='first')
+        # Mixed objects (the backed up references) are spilled as strings
+        run = run.astype({column: 'string' for column, dtype in run.dtypes.items() if dtype == object})
+
+        path = self.directory / f"{self.name}-{len(self.runs):05d}.parquet"
+        pq.write_table(pa.Table.from_pandas(run, preserve_index=False), path)
+        self.runs.append(path)
+
+    def iter_rows(self, batch_rows):
+        """
+        Yield (TRN_REF, DATE_TIME, AMOUNT, *other columns) tuples sorted by TRN_REF, one per TRN_REF.
+        """
+        import pyarrow.parquet as pq
+
+        def read_run(path):
+            for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_rows, columns=[_SEQ, *self.columns]):
+                yield from zip(*(batch.column(i).to_pylist() for i in range(batch.num_columns)))
+
+        last_ref = None
+        for row in heapq.merge(*(read_run(path) for path in self.runs), key=itemgetter(1, 0)):
+            if row[1] != last_ref:
+                last_ref = row[1]
+                yield row[1:]
+
+
+class _PartitionWriter:
+    """
+    Write the merged rows as numbered Parquet partitions of `partition_rows` rows.
+    """
+
+    def __init__(self, directory, columns, partition_rows):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.columns = columns
+        self.partition_rows = partition_rows
+        self.rows = []
+        self.partitions = []
+
+    def write(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.partition_rows:
+            self.flush()
+
+    def flush(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if not self.rows:
+            return
+        # pre_processing leaves strings only, the same schema in every partition
+        values = list(zip(*self.rows))
+        self.rows = []
+        table = pa.Table.from_arrays([pa.array(column, pa.string()) for column in values], names=self.columns)
+        path = self.directory / f"part-{len(self.partitions):05d}.parquet"
+        pq.write_table(table, path)
+        self.partitions.append(str(path))
+
+
+def external_reconciliation(uploaded_chunks, db_chunks, output_dir, memory_budget=None, partition_rows=100000):
+    """
+    Out-of-core equivalent of process_reconciliation for windows too large to merge in memory.
+
+    Both sides are spilled to disk as runs sorted by TRN_REF, each run at most about `memory_budget`
+    bytes. The runs are then k-way merged, deduplicated on TRN_REF (first row wins) and joined on
+    (TRN_REF, DATE_TIME, AMOUNT) in a single streaming pass. The merged rows, with the same `_merge`
+    and `Recon Status` values as the in-memory path, are written as Parquet partitions.
+
+    Parameters:
+    uploaded_chunks (iterable of pandas.DataFrame): The uploaded rows, after pre_processing. Consumed first.
+    db_chunks (iterable of pandas.DataFrame): The Transactions extract, after pre_processing.
+    output_dir (str): Directory receiving the part-NNNNN.parquet partitions.
+    memory_budget (int): Bytes of buffered frames per side, RECON_EXTERNAL_MEMORY_MB by default.
+    partition_rows (int): Rows per result partition.
+
+    Returns:
+    dict: The partitions, the runs spilled per side and the row counts per classification.
+    """
+    if memory_budget is None:
+        memory_budget = settings.RECON_EXTERNAL_MEMORY_MB * 1024 * 1024
+
+    with tempfile.TemporaryDirectory(prefix='recon-spill-', dir=settings.RECON_EXTERNAL_SPILL_DIR) as spill_dir:
+        left = _SortedSpill(spill_dir, 'uploaded', memory_budget)
+        for chunk in uploaded_chunks:
+            left.add(chunk.rename(columns=UPLOADED_COLUMNS))
+        left.flush()
+
+        right = _SortedSpill(spill_dir, 'db', memory_budget)
+        for chunk in db_chunks:
+            right.add(chunk)
+        right.flush()
+
+        # Rows read ahead per run while merging; Python tuples take several times their pandas size
+        runs = max(len(left.runs) + len(right.runs), 1)
+        row_bytes = max((left.bytes + right.bytes) / max(left.rows + right.rows, 1), 1)
+        batch_rows = max(int(memory_budget / (runs * row_bytes * 4)), 1024)
+
+        left_extra = left.columns[len(KEY_COLUMNS):] if left.columns else []
+        right_extra = right.columns[len(KEY_COLUMNS):] if right.columns else []
+        # pandas suffixes the non-key columns present on both sides
+        shared = set(left_extra) & set(right_extra)
+        columns = (
+            KEY_COLUMNS
+            + [f"{column}_x" if column in shared else column for column in left_extra]
+            + [f"{column}_y" if column in shared else column for column in right_extra]
+            + ['_merge', 'Recon Status']
+        )
+        left_code = left_extra.index('Response_code') if 'Response_code' in left_extra else None
+        right_code = right_extra.index('RESPONSE_CODE') if 'RESPONSE_CODE' in right_extra else None
+        missing_left, missing_right = (None,) * len(left_extra), (None,) * len(right_extra)
+
+        writer = _PartitionWriter(output_dir, columns, partition_rows)
+        # Row counts of the merge indicator and of the frames process_reconciliation returns
+        counts = {'both': 0, 'Bank_only': 0, 'ABC_only': 0, 'reconciled': 0, 'succunreconciled': 0,
+                  'unreconciled': 0, 'exceptions': 0}
+
+        def emit(key, left_values, right_values, merge):
+            response_code = right_values[right_code] if right_code is not None else None
+            if merge == 'both':
+                recon_status = 'Reconciled'
+            elif response_code == '00' or (left_code is not None and left_values[left_code] == '00'):
+                recon_status = 'succunreconciled'
+            else:
+                recon_status = 'Unreconciled'
+
+            counts[merge] += 1
+            counts['reconciled'] += recon_status == 'Reconciled'
+            counts['succunreconciled'] += recon_status == 'succunreconciled' and response_code != '00'
+            counts['unreconciled'] += recon_status == 'Unreconciled'
+            counts['exceptions'] += recon_status == 'Reconciled' and response_code != '00'
+            writer.write((*key, *left_values, *right_values, merge, recon_status))
+
+        left_rows = left.iter_rows(batch_rows)
+        right_rows = right.iter_rows(batch_rows)
+        l, r = next(left_rows, None), next(right_rows, None)
+        while l is not None or r is not None:
+            l_key = l[:3] if l is not None else None
+            r_key = r[:3] if r is not None else None
+            if r is None or (l is not None and l_key < r_key):
+                emit(l_key, l[3:], missing_right, 'Bank_only')
+                l = next(left_rows, None)
+            elif l is None or r_key < l_key:
+                emit(r_key, missing_left, r[3:], 'ABC_only')
+                r = next(right_rows, None)
+            else:
+                emit(l_key, l[3:], r[3:], 'both')
+                l, r = next(left_rows, None), next(right_rows, None)
+        writer.flush()
+
+        return {
+            'partitions': writer.partitions,
+            'runs': {'uploaded': len(left.runs), 'db': len(right.runs)},
+            'rows_read': {'uploaded': left.rows, 'db': right.rows},
+            'merge_batch_rows': batch_rows,
+            'counts': counts,
+        }
+
+
+def read_partitions(output_dir, filters=None):
+    """
+    Read the merged rows written by external_reconciliation back into a DataFrame.
+    """
+    import pyarrow.parquet as pq
+
+    return pq.read_table(output_dir, filters=filters).to_pandas()
@@ -0,0 +1,126 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils import timezone
+
+
+class FrameLRU:
+    """
+    A least recently used cache of DataFrames bounded by their total size in bytes.
+
+    Lives in one worker process, entries are not shared between workers.
+
+    Parameters:
+    max_bytes (int): The size bound. RECON_EXTRACT_CACHE_MB when None, read on every insert
+    so that the setting can change at runtime; 0 disables the cache.
+    """
+
+    def __init__(self, max_bytes=None):
+        self._max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def max_bytes(self):
+        if self._max_bytes is not None:
+            return self._max_bytes
+        return settings.RECON_EXTRACT_CACHE_MB * 1024 * 1024
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size):
+        with self._lock:
+            if key in self._entries:
+                self.bytes -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                # Larger than the whole cache, would only flush it
+                return False
+            self._entries[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+# Cleaned DB-side frames of reconcileMain, keyed by (bank_code, day, exclusion rules version)
+extract_cache = FrameLRU()
+
+
+def frame_size(frame, requested):
+    return int(frame.memory_usage(deep=True).sum()) + requested.nbytes if frame is not None else requested.nbytes
+
+
+def cached_extract_days(bank_code, dates, rules_version):
+    """
+    Look the days of a reconciliation up in the extract cache. Only closed days (before today,
+    in the local time zone) are looked up or stored: rows of the current day are still arriving.
+    Entries extracted under other exclusion rules (recon.rules.rules_version) are not used.
+
+    Returns:
+    (dict, list): The cached entries by day, and the days to extract, in order.
+    """
+    today = timezone.localdate()
+    cached, missing = {}, []
+    for day in sorted(set(dates)):
+        entry = extract_cache.get((bank_code, day, rules_version)) if day < today else None
+        if entry is None:
+            missing.append(day)
+        else:
+            cached[day] = entry
+    return cached, missing
+
+
+def store_extract_day(bank_code, day, entry, rules_version):
+    # entry: (cleaned frame or None when the day has no rows, requested mask)
+    if day < timezone.localdate():
+        extract_cache.put((bank_code, day, rules_version), entry, frame_size(*entry))
+
+
+def split_extract_days(extract, days):
+    """
+    Split an extract (fetch_extract) by the local day of its rows.
+
+    Returns:
+    dict: For each of `days`, its rows (possibly none).
+    """
+    import pandas as pd
+
+    stamps = pd.to_datetime(extract['date_time'], utc=settings.USE_TZ)
+    if settings.USE_TZ:
+        stamps = stamps.dt.tz_convert(str(timezone.get_current_timezone()))
+    row_days = stamps.dt.date
+    return {day: extract[(row_days == day).to_numpy()] for day in days}
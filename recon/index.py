@@ -1,17 +1,94 @@
+import numpy as np
 import pandas as pd
-from django.db.models import Q
 import os
 import logging
-from datetime import datetime, timedelta
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
-from .models import Transactions
-from .utils import  backup_refs, date_range, pre_processing, process_reconciliation,insert_recon_stats, remove_duplicates, update_reconciliation, use_cols, use_cols_succunr
+from django.conf import settings
+
+from .artifacts import save_merged_artifact
+from .extract import fetch_extract
+from .progress import ProgressReporter
+from .extract_cache import cached_extract_days, extract_cache, split_extract_days, store_extract_day
+from .rules import rules_version
+from .utils import  backup_refs, date_range, pre_processing, process_reconciliation,insert_recon_stats, remove_duplicates, update_reconciliation, project, RECONCILED_COLUMNS, SUCCUNRECONCILED_COLUMNS
  
 
-def reconcileMain(path, bank_code, user):
+@contextmanager
+def stage(stages, name):
+    # Wall time of a step of the run, in seconds
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages[name] = round(time.perf_counter() - started, 3)
+
+
+def prepare_upload(uploaded_df, stages):
+    with stage(stages, 'clean_upload'):
+        # Create a copy of the 4th column (index 3) and store it as a new column
+        uploaded_df = backup_refs(uploaded_df, uploaded_df.columns[3])
+
+        # Add a new column 'Response_code' with success_code
+        uploaded_df['Response_code'] = '00'
+
+        # Clean and format columns in the uploaded dataset
+        return pre_processing(uploaded_df)
+
+
+def clean_extract(dbextract):
+    """
+    Clean the Transactions rows of one day as the reconciliation needs them.
+
+    Returns:
+    (pandas.DataFrame, numpy.ndarray): The cleaned rows, and which of them count as requested
+    (successful, non-zero amount), computed before cleaning as the amounts are then text.
+    """
+    new_column_names = {
+        'date_time': 'DATE_TIME', 'batch': 'BATCH', 'trn_ref': 'TRN_REF', 'txn_type': 'TXN_TYPE', 'issuer_code': 'ISSUER_CODE',
+        'acquirer_code': 'ACQUIRER_CODE', 'amount': 'AMOUNT', 'response_code': 'RESPONSE_CODE'
+    }
+    dbextract = dbextract.rename(columns=new_column_names)
+
+    unique_dbextract = remove_duplicates(dbextract, 'TRN_REF')
+    datadump = backup_refs(unique_dbextract, 'TRN_REF')
+    requested = ((datadump['RESPONSE_CODE'] == '00') & (datadump['AMOUNT'] != 0)).to_numpy()
+
+    # Clean and format columns in the datadump
+    return pre_processing(datadump), requested
+
+
+def combine_extract_days(entries):
+    """
+    Put the cleaned days of an extract back together, keeping the first row of a reference
+    seen on several days as remove_duplicates does over the whole extract.
+
+    Returns:
+    (pandas.DataFrame, int): The DB side of the reconciliation (None without rows), and the requested rows.
+    """
+    days = [entries[day] for day in sorted(entries) if entries[day][0] is not None]
+    if not days:
+        return None, 0
+    db_preprocessed = pd.concat([frame for frame, _ in days])
+    requested = np.concatenate([requested for _, requested in days])
+    first = ~db_preprocessed['Original_TRN_REF'].duplicated(keep='first').to_numpy()
+    return db_preprocessed[first], int(requested[first].sum())
+
+
+def reconcileMain(path, bank_code, user, stats=None, progress=None):
+    # stats: optional dict the caller passes in to receive details of the run (the ReconLog id, the extract plan,
+    # the time of each stage)
+    # progress: optional ProgressReporter the stages are reported to as they complete
+    progress = progress or ProgressReporter()
+    stages = {}
+    if stats is not None:
+        stats['stages'] = stages
     try:
         # Read the uploaded dataset from Excel
-        uploaded_df = pd.read_excel(path, usecols=[0, 1, 2, 3], skiprows=0)
+        with stage(stages, 'read_upload'):
+            uploaded_df = pd.read_excel(path, usecols=[0, 1, 2, 3], skiprows=0)
         
         if uploaded_df.empty:
             raise ValueError("Your uploaded file is empty")
@@ -20,67 +97,80 @@ def reconcileMain(path, bank_code, user):
         unique_uploaded_df = uploaded_df.drop_duplicates(subset=uploaded_df.columns[3], keep='first')
         min_date, max_date = date_range(unique_uploaded_df.iloc[:, 0])
 
-        # Assuming min_date and max_date are strings in 'YYYY-MM-DD' format
-        min_date_time = datetime.strptime(min_date, '%Y-%m-%d')
-        max_date_time = datetime.strptime(max_date, '%Y-%m-%d') + timedelta(days=1, seconds=-1)
+        # The distinct days in the upload, the extract only covers those
+        upload_dates = pd.to_datetime(unique_uploaded_df.iloc[:, 0]).dropna().dt.date.unique()
 
         date_range_str = f"{min_date},{max_date}"
+        UploadedRows = len(uploaded_df)
+        progress.stage('parsed', rows=UploadedRows, date_range=date_range_str)
 
-        # Create a copy of the 4th column (index 3) and store it as a new column
-        uploaded_df = backup_refs(uploaded_df, uploaded_df.columns[3])
+        # The upload is cleaned on a worker thread while this thread waits on the extract, which only
+        # needs the dates. The queries stay on the request's connection (and transaction).
+        with stage(stages, 'extract_and_clean'), ThreadPoolExecutor(max_workers=1) as executor:
+            if settings.RECON_OVERLAP_UPLOAD:
+                upload_future = executor.submit(prepare_upload, uploaded_df, stages)
+            else:
+                upload_future = None
+                uploaded_df_processed = prepare_upload(uploaded_df, stages)
 
-        # Add a new column 'Response_code' with success_code
-        uploaded_df['Response_code'] = '00'
-        UploadedRows = len(uploaded_df)
+            # Closed days cleaned by a previous run of this worker come from the extract cache
+            # Read before the extract: entries stored under it are never served once the rules change
+            version = rules_version()
+            extract_days, missing_days = cached_extract_days(bank_code, upload_dates, version)
 
-        # Clean and format columns in the uploaded dataset
-        uploaded_df_processed = pre_processing(uploaded_df)
-        
-        # Query the database for transactions
-        extract = Transactions.objects.filter(
-            Q(issuer_code=bank_code) | Q(acquirer_code=bank_code),
-            date_time__range=(min_date_time, max_date_time),
-            request_type='1200',
-        ).exclude(
-            Q(txn_type__in=['BI', 'MINI']) & ~Q(amount=0) & ~Q(processing_code__in=['320000', '340000', '510000', '370000', '180000', '360000'])
-        ).values(
-            'date_time', 'batch', 'trn_ref', 'txn_type', 'issuer_code', 'acquirer_code', 'amount', 'response_code',
-        ).distinct()
-
-        dbextract = pd.DataFrame.from_records(extract)        
-        new_column_names = {
-            'date_time': 'DATE_TIME', 'batch': 'BATCH', 'trn_ref': 'TRN_REF', 'txn_type': 'TXN_TYPE', 'issuer_code': 'ISSUER_CODE',
-            'acquirer_code': 'ACQUIRER_CODE', 'amount': 'AMOUNT', 'response_code': 'RESPONSE_CODE'
-        }
-
-        dbextract = dbextract.rename(columns=new_column_names)
-        
-        if not dbextract.empty:                
-            unique_dbextract = remove_duplicates(dbextract, 'TRN_REF')
-            datadump = backup_refs(unique_dbextract, 'TRN_REF')
-            requestedRows = len(datadump[(datadump['RESPONSE_CODE'] == '00') & (datadump['AMOUNT'] != 0)])        
+            # Query the database for transactions, one bounded query per run of the other days
+            with stage(stages, 'extract'):
+                dbextract = fetch_extract(bank_code, missing_days, stats=stats)
+            progress.stage('extracted', rows=len(dbextract), cached_days=len(upload_dates) - len(missing_days))
+
+            with stage(stages, 'clean_extract'):
+                for day, day_extract in split_extract_days(dbextract, missing_days).items():
+                    entry = clean_extract(day_extract) if not day_extract.empty else (None, np.zeros(0, dtype=bool))
+                    store_extract_day(bank_code, day, entry, version)
+                    extract_days[day] = entry
+                db_preprocessed, requestedRows = combine_extract_days(extract_days)
+
+            if stats is not None:
+                stats['extract']['cached_days'] = len(upload_dates) - len(missing_days)
+                stats['extract']['cache'] = extract_cache.stats()
 
-            # Clean and format columns in the datadump
-            db_preprocessed = pre_processing(datadump)
+            if upload_future is not None:
+                uploaded_df_processed = upload_future.result()
 
-            merged_df, reconciled_data, succunreconciled_data, exceptions = process_reconciliation(uploaded_df_processed, db_preprocessed)
+        # Time the overlap saved over running the same stages one after the other
+        stages['overlap_saved'] = round(max(
+            stages['clean_upload'] + stages['extract'] + stages['clean_extract'] - stages['extract_and_clean'], 0
+        ), 3)
+
+        if db_preprocessed is not None:
+            with stage(stages, 'reconcile'):
+                merged_df, reconciled_data, succunreconciled_data, exceptions = process_reconciliation(uploaded_df_processed, db_preprocessed)
+            progress.stage('matched', reconciled=len(reconciled_data), unreconciled=len(succunreconciled_data),
+                           exceptions=len(exceptions))
             
             if not reconciled_data.empty: 
-                # List of dataframes to process
-                datafiles = [reconciled_data, exceptions]
-                # Apply the use_cols function to each dataframe in the list
-                for i in range(len(datafiles)):
-                    datafiles[i] = use_cols(datafiles[i])
-                succunreconciled_data= use_cols_succunr(succunreconciled_data)
-                # Extract dataframes after applying use_cols
-                reconciled_data, exceptions = datafiles                          
+                # Result columns, typed; they are only formatted as text when the response is serialized
+                reconciled_data = project(reconciled_data, RECONCILED_COLUMNS, dates=['DATE_TIME'])
+                # The exceptions are the reconciled rows with a failed response, no need to project them again
+                exceptions = reconciled_data[reconciled_data['RESPONSE_CODE'] != '00']
+                succunreconciled_data = project(succunreconciled_data, SUCCUNRECONCILED_COLUMNS)
          
-                feedback = update_reconciliation(reconciled_data, bank_code)
-                insert_recon_stats(
-                    bank_code,user, len(reconciled_data), len(succunreconciled_data), len(exceptions), feedback,
-                    requestedRows, UploadedRows, date_range_str
-                )
-                
+                with stage(stages, 'write'):
+                    feedback = update_reconciliation(reconciled_data, bank_code, progress=progress)
+                    recon_log = insert_recon_stats(
+                        bank_code,user, len(reconciled_data), len(succunreconciled_data), len(exceptions), feedback,
+                        requestedRows, UploadedRows, date_range_str
+                    )
+                if stats is not None:
+                    stats['recon_log'] = recon_log.id
+
+                # Keep the merged frame so the run can be queried later without re-uploading
+                try:
+                    save_merged_artifact(recon_log, merged_df)
+                except Exception as e:
+                    logging.error(f"Could not persist the merged frame of run {recon_log.id}: {str(e)}")
+
+                progress.finish(recon_log=recon_log.id, feedback=feedback)
                 return merged_df, reconciled_data, succunreconciled_data, exceptions, feedback, requestedRows, UploadedRows, date_range_str          
                 
             else:
@@ -95,6 +185,7 @@ def reconcileMain(path, bank_code, user):
     except Exception as e:
         feedback_error = (f"An error occurred:102 {str(e)}")
 
+    progress.finish('failed', feedback=feedback_error)
     return None, None, None, None, feedback_error, None, None, None
     
     
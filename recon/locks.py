@@ -0,0 +1,149 @@
+import datetime as dt
+import logging
+import math
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import IntegrityError, connections, router, transaction
+from django.utils import timezone
+
+from .models import ReconRunLock
+
+
+class LockNotAcquired(Exception):
+    def __init__(self, name, retry_after):
+        self.name = name
+        # Seconds until the current holder's lease runs out
+        self.retry_after = retry_after
+        super().__init__(f"'{name}' is held by another run, retry in {retry_after}s.")
+
+
+def acquire_lock(name, ttl):
+    """
+    Try once to take an advisory lock row.
+
+    Parameters:
+    name (str): The lock name, e.g. 'bank:130447'.
+    ttl (int): Lease in seconds. After it, another caller may take the lock over.
+
+    Returns:
+    str: The owner token to release the lock with, or None when it is held.
+    """
+    using = router.db_for_write(ReconRunLock)
+    now = timezone.now()
+    owner = uuid.uuid4().hex
+    expires_at = now + dt.timedelta(seconds=ttl)
+    try:
+        with transaction.atomic(using=using):
+            ReconRunLock.objects.using(using).create(name=name, owner=owner, acquired_at=now, expires_at=expires_at)
+        return owner
+    except IntegrityError:
+        # Held: take it over only if the lease ran out. The row lock of the UPDATE lets a single caller win.
+        taken = ReconRunLock.objects.using(using).filter(name=name, expires_at__lt=now).update(
+            owner=owner, acquired_at=now, expires_at=expires_at
+        )
+        return owner if taken else None
+
+
+def release_lock(name, owner):
+    # Only our own lease, the lock may have expired and been taken over
+    using = router.db_for_write(ReconRunLock)
+    deleted, _ = ReconRunLock.objects.using(using).filter(name=name, owner=owner).delete()
+    if not deleted:
+        logging.error(f"Lock '{name}' was lost before it was released: its lease ran out and it may have been taken over.")
+
+
+def renew_lock(name, owner, ttl):
+    """
+    Extend a lease still held by `owner` to `ttl` seconds from now.
+
+    Returns:
+    bool: False when the lease was lost.
+    """
+    using = router.db_for_write(ReconRunLock)
+    return bool(ReconRunLock.objects.using(using).filter(name=name, owner=owner).update(
+        expires_at=timezone.now() + dt.timedelta(seconds=ttl)
+    ))
+
+
+class LeaseRenewer(threading.Thread):
+    """
+    Renew a lease every third of its ttl until stopped, so that a block running longer than the
+    ttl keeps its lock; only a holder that died stops renewing and can be taken over.
+    """
+
+    def __init__(self, name, owner, ttl):
+        super().__init__(name=f"lease {name}", daemon=True)
+        self.lock_name = name
+        self.owner = owner
+        self.ttl = ttl
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.ttl / 3):
+                if not renew_lock(self.lock_name, self.owner, self.ttl):
+                    logging.error(f"Lock '{self.lock_name}' was lost while held, its lease could not be renewed.")
+                    return
+        finally:
+            # The connections of this thread
+            connections.close_all()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def lock_retry_after(name):
+    """
+    Seconds until the lease of a held lock runs out (at least 1).
+    """
+    using = router.db_for_write(ReconRunLock)
+    expires_at = ReconRunLock.objects.using(using).filter(name=name).values_list('expires_at', flat=True).first()
+    if expires_at is None:
+        return 1
+    return max(math.ceil((expires_at - timezone.now()).total_seconds()), 1)
+
+
+@contextmanager
+def db_lock(name, ttl, wait=0, poll_interval=0.5):
+    """
+    Hold an advisory lock row for the duration of the block, across threads and worker processes.
+
+    Parameters:
+    name (str): The lock name.
+    ttl (int): Lease in seconds, renewed while the block runs: how long a lock left by a dead
+        worker stays held.
+    wait (float): Seconds to keep retrying while the lock is held elsewhere.
+
+    Raises:
+    LockNotAcquired: When the lock is still held after `wait` seconds.
+    """
+    deadline = time.monotonic() + wait
+    owner = acquire_lock(name, ttl)
+    while owner is None:
+        if time.monotonic() >= deadline:
+            raise LockNotAcquired(name, lock_retry_after(name))
+        time.sleep(poll_interval)
+        owner = acquire_lock(name, ttl)
+    renewer = LeaseRenewer(name, owner, ttl)
+    renewer.start()
+    try:
+        yield owner
+    finally:
+        renewer.stop()
+        release_lock(name, owner)
+
+
+def bank_run_lock(bank_code, wait=None):
+    """
+    The per-bank reconciliation lock: one run writing a bank's results at a time.
+    """
+    return db_lock(
+        f"bank:{bank_code}",
+        ttl=settings.RECON_RUN_LOCK_TTL,
+        wait=settings.RECON_RUN_LOCK_WAIT if wait is None else wait,
+    )
@@ -0,0 +1,125 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.asgi import get_asgi_application
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test.client import RequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+
+ENDPOINTS = {
+    'exceptions': ('/recon/exceptions/', '/recon/async/exceptions/'),
+    'reconstats': ('/recon/reconstats/', '/recon/async/reconstats/'),
+    'reversals': ('/recon/reversals/', '/recon/async/reversals/'),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the concurrent throughput of a list endpoint served through the WSGI handler "
+        "(a thread per request) with its async version served through the ASGI handler. "
+        "Point ENGINE/NAME at a local SQLite file to use it as a stand-in for SQL Server; "
+        "--latency-ms adds a delay to every query to model the network round trip."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoint', choices=sorted(ENDPOINTS), default='exceptions')
+        parser.add_argument('--username', required=True, help="A user mapped to a bank.")
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--wsgi-threads', type=int, default=8, help="Worker threads of the WSGI path.")
+        parser.add_argument('--latency-ms', type=float, default=20)
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options['username'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"No user {options['username']}")
+        authorization = f"Bearer {AccessToken.for_user(user)}"
+        wsgi_path, asgi_path = ENDPOINTS[options['endpoint']]
+
+        delay = options['latency_ms'] / 1000
+
+        def slow_query(execute, sql, params, many, context):
+            time.sleep(delay)
+            return execute(sql, params, many, context)
+
+        def add_latency(connection, **kwargs):
+            connection.execute_wrappers.append(slow_query)
+
+        # Measure the queries, not cache hits
+        timeout = settings.RECON_RESPONSE_CACHE_TIMEOUT
+        settings.RECON_RESPONSE_CACHE_TIMEOUT = 0
+        connections.close_all()
+        connection_created.connect(add_latency, weak=False, dispatch_uid='benchmark_latency')
+        try:
+            for label, run, path in (
+                (f"wsgi ({options['wsgi_threads']} threads)", self.run_wsgi, wsgi_path),
+                ("asgi", self.run_asgi, asgi_path),
+            ):
+                elapsed, statuses = run(path, authorization, options)
+                failed = sum(1 for code in statuses if code != 200)
+                self.stdout.write(
+                    f"{label:<20} {path:<28} requests={len(statuses)} concurrency={options['concurrency']} "
+                    f"failed={failed} elapsed={elapsed:.2f}s throughput={len(statuses) / elapsed:.1f} req/s"
+                )
+        finally:
+            connection_created.disconnect(dispatch_uid='benchmark_latency')
+            settings.RECON_RESPONSE_CACHE_TIMEOUT = timeout
+            connections.close_all()
+
+    def run_wsgi(self, path, authorization, options):
+        # A thread per in-flight request, as gunicorn's gthread workers
+        handler = WSGIHandler()
+        environ = RequestFactory()._base_environ(
+            PATH_INFO=path, REQUEST_METHOD='GET', HTTP_AUTHORIZATION=authorization,
+        )
+
+        def one(_):
+            statuses = []
+            response = handler(dict(environ), lambda status, headers: statuses.append(int(status.split()[0])))
+            b"".join(response)
+            response.close()
+            # The handler closes the connection at request_finished, except on the worker's thread
+            connections.close_all()
+            return statuses[0]
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=min(options['wsgi_threads'], options['concurrency'])) as pool:
+            statuses = list(pool.map(one, range(options['requests'])))
+        return time.perf_counter() - started, statuses
+
+    def run_asgi(self, path, authorization, options):
+        application = get_asgi_application()
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+            'headers': [(b'host', b'testserver'), (b'authorization', authorization.encode())],
+            'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+        }
+
+        async def one(semaphore):
+            async with semaphore:
+                messages = []
+
+                async def receive():
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+                async def send(message):
+                    messages.append(message)
+
+                await application(dict(scope), receive, send)
+                return next(m['status'] for m in messages if m['type'] == 'http.response.start')
+
+        async def run():
+            semaphore = asyncio.Semaphore(options['concurrency'])
+            return await asyncio.gather(*(one(semaphore) for _ in range(options['requests'])))
+
+        started = time.perf_counter()
+        statuses = asyncio.run(run())
+        return time.perf_counter() - started, statuses
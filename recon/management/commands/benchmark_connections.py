@@ -0,0 +1,63 @@
+import statistics
+import time
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test.client import RequestFactory
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare request latency with and without persistent database connections. "
+        "Point ENGINE/NAME at a local SQLite file to use it as a stand-in for SQL Server; "
+        "--handshake-ms adds a delay to every new connection to model the ODBC login."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--path', default='/recon/health/db/')
+        parser.add_argument('--conn-max-age', type=int, default=60)
+        parser.add_argument('--handshake-ms', type=float, default=0)
+
+    def handle(self, *args, **options):
+        if options['handshake_ms']:
+            delay = options['handshake_ms'] / 1000
+            connection_created.connect(lambda **kwargs: time.sleep(delay), weak=False, dispatch_uid='benchmark_handshake')
+
+        for label, conn_max_age in (("per-request connections", 0), ("persistent connections", options['conn_max_age'])):
+            latencies, opened = self.run(options['path'], options['requests'], conn_max_age)
+            latencies.sort()
+            self.stdout.write(
+                f"{label:<24} CONN_MAX_AGE={conn_max_age:<4} requests={len(latencies)} new_connections={opened} "
+                f"mean={statistics.mean(latencies):.3f}ms p50={latencies[len(latencies) // 2]:.3f}ms "
+                f"p95={latencies[int(len(latencies) * 0.95) - 1]:.3f}ms"
+            )
+
+    def run(self, path, requests, conn_max_age):
+        connections.close_all()
+        connection.settings_dict['CONN_MAX_AGE'] = conn_max_age
+
+        opened = []
+        def count(**kwargs):
+            opened.append(1)
+        connection_created.connect(count, weak=False, dispatch_uid='benchmark_count')
+
+        # Drive the real WSGI handler so request_started/request_finished close connections
+        # exactly as they do under gunicorn (the test client disables that)
+        handler = WSGIHandler()
+        environ = RequestFactory()._base_environ(PATH_INFO=path, REQUEST_METHOD='GET')
+        latencies = []
+        try:
+            for _ in range(requests):
+                started = time.perf_counter()
+                response = handler(dict(environ), lambda status, headers: None)
+                b"".join(response)
+                response.close()
+                latencies.append((time.perf_counter() - started) * 1000)
+        finally:
+            connection_created.disconnect(dispatch_uid='benchmark_count')
+            connections.close_all()
+
+        return latencies, len(opened)
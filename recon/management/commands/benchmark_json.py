@@ -0,0 +1,79 @@
+import json
+import time
+import zlib
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from recon.management.commands.benchmark_projection import make_processed_frames
+from recon.middleware import ENCODINGS
+from recon.renderers import dumps
+from recon.utils import RECONCILED_COLUMNS, SUCCUNRECONCILED_COLUMNS, process_reconciliation, project
+
+
+def result_records(df, text=False):
+    # How the response built its records before the renderer took the frames, kept for comparison:
+    # one list per column, zipped, every value as text for the succunreconciled rows
+    if text:
+        df = df.astype(str)
+    columns = list(df.columns)
+    return [dict(zip(columns, row)) for row in zip(*(df[column].tolist() for column in columns))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the reconciliation JSON body as it was encoded (result_records, then JSONRenderer) with "
+        "the orjson renderer encoding the frames directly, and the size and time of each compression level."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=500000)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--levels', type=int, nargs='+', default=[1, 6])
+
+    def best(self, run, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = run()
+            timings.append(time.perf_counter() - started)
+        return result, min(timings)
+
+    def handle(self, *args, **options):
+        uploaded, db = make_processed_frames(options['rows'])
+        _, reconciled_data, succunreconciled_data, _ = process_reconciliation(uploaded, db)
+        reconciled_data = project(reconciled_data, RECONCILED_COLUMNS, dates=['DATE_TIME'])
+        succunreconciled_data = project(succunreconciled_data, SUCCUNRECONCILED_COLUMNS)
+
+        def legacy():
+            return JSONRenderer().render({
+                "reconciled_data": result_records(reconciled_data),
+                "succunreconciled_data": result_records(succunreconciled_data, text=True),
+            })
+
+        def direct():
+            return dumps({
+                "reconciled_data": reconciled_data,
+                "succunreconciled_data": succunreconciled_data.astype(str),
+            })
+
+        legacy_body, legacy_time = self.best(legacy, options['repeat'])
+        body, direct_time = self.best(direct, options['repeat'])
+        if json.loads(body) != json.loads(legacy_body):
+            raise CommandError("The orjson renderer does not produce the legacy body.")
+        self.stdout.write(
+            f"rows={len(reconciled_data) + len(succunreconciled_data)} bytes={len(body)}\n"
+            f"result_records + JSONRenderer: best {legacy_time:.2f}s of {options['repeat']}\n"
+            f"frames + orjson: best {direct_time:.2f}s of {options['repeat']}"
+        )
+
+        for encoding, wbits in ENCODINGS.items():
+            for level in options['levels']:
+                def compress():
+                    compressor = zlib.compressobj(level, zlib.DEFLATED, wbits)
+                    return compressor.compress(body) + compressor.flush()
+
+                compressed, elapsed = self.best(compress, options['repeat'])
+                self.stdout.write(
+                    f"{encoding} level {level}: {elapsed:.2f}s bytes={len(compressed)} ({len(compressed) / len(body):.1%})"
+                )
@@ -0,0 +1,131 @@
+import json
+import time
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from recon.renderers import dumps
+from recon.utils import (
+    CustomTypeError, CustomValueError, RECONCILED_COLUMNS, SUCCUNRECONCILED_COLUMNS, process_reconciliation, project
+)
+
+
+# The post-processing chain project and the renderer replaced, kept verbatim for comparison
+def legacy_use_cols(df):
+    try:
+        # Rename columns
+        df = df.rename(columns={'TXN_TYPE_x': 'TXN_TYPE', 'Original_TRN_REF': 'ABC REFERENCE', '_merge': 'MERGE',
+                                'Recon Status': 'STATUS'})
+
+        # Convert 'DATE_TIME' to datetime
+        df['DATE_TIME'] = pd.to_datetime(df['DATE_TIME'].astype(str), format='%Y%m%d')
+
+        # Select and retain only the desired columns
+        selected_columns = ['DATE_TIME', 'ABC REFERENCE', 'BATCH','AMOUNT', 'ISSUER_CODE', 'ACQUIRER_CODE', 'RESPONSE_CODE',
+                            'MERGE', 'STATUS']
+        df_selected = df[selected_columns]
+
+        return df_selected
+    except KeyError:
+        raise CustomTypeError("Missing columns in the DataFrame")
+    except (ValueError, TypeError):
+        raise CustomTypeError("Invalid data format")
+
+
+def legacy_use_cols_succunr(df):
+    columns_to_select = ['DATE_TIME', 'Transaction type', 'AMOUNT', 'TRN_REF', '_merge', 'Recon Status']
+    if not all(col in df.columns for col in columns_to_select):
+        raise CustomValueError("Missing columns in the DataFrame")
+    new_df = df[columns_to_select]
+    new_df = new_df.apply(lambda col: col.astype(str).fillna("NULL"))
+    return new_df.rename(columns={
+        'DATE_TIME': 'DATE',
+        'Transaction type': 'TXN TYPE',
+        'AMOUNT': 'AMOUNT',
+        'TRN_REF': 'TRN_REF',
+        '_merge': 'MERGE',
+        'Recon Status': 'STATUS'
+    })
+
+
+def legacy_results(reconciled_data, succunreconciled_data, exceptions):
+    # The JSON body as the legacy chain and JSONRenderer produced it
+    reconciled_data, exceptions = legacy_use_cols(reconciled_data), legacy_use_cols(exceptions)
+    succunreconciled_data = legacy_use_cols_succunr(succunreconciled_data)
+    return JSONRenderer().render({
+        "exceptionsRows": len(exceptions),
+        "reconciled_data": reconciled_data.to_dict(orient='records'),
+        "succunreconciled_data": succunreconciled_data.to_dict(orient='records'),
+    })
+
+
+def projected_results(reconciled_data, succunreconciled_data, exceptions):
+    # The JSON body as reconcileMain and ReconcileView produce it: projected frames, encoded by the renderer
+    reconciled_data = project(reconciled_data, RECONCILED_COLUMNS, dates=['DATE_TIME'])
+    exceptions = reconciled_data[reconciled_data['RESPONSE_CODE'] != '00']
+    succunreconciled_data = project(succunreconciled_data, SUCCUNRECONCILED_COLUMNS)
+    return dumps({
+        "exceptionsRows": len(exceptions),
+        "reconciled_data": reconciled_data,
+        "succunreconciled_data": succunreconciled_data.astype(str),
+    })
+
+
+def make_processed_frames(rows, seed=3):
+    """
+    Uploaded and extracted frames as pre_processing leaves them (text columns), about 60% matching,
+    20% on the bank side only and 20% in Transactions only, 10% of the extract with a failed response.
+    """
+    rng = np.random.default_rng(seed)
+    refs = pd.Series(np.arange(rows)).map('{:012d}'.format)
+    dates = pd.Series(pd.Timestamp('2023-09-01') + pd.to_timedelta(rng.integers(0, 90, rows), unit='D')).dt.strftime('%Y%m%d')
+    amounts = pd.Series(rng.integers(1, 5000, rows) * 100).astype(str)
+    side = rng.random(rows)
+
+    uploaded_rows = side < 0.8
+    uploaded = pd.DataFrame({
+        'Date': dates[uploaded_rows], 'Transaction type': 'CWD', 'Amount': amounts[uploaded_rows],
+        'ABC Reference': refs[uploaded_rows], 'Original_ABC Reference': refs[uploaded_rows], 'Response_code': '00',
+    })
+    db_rows = (side < 0.6) | (side >= 0.8)
+    db = pd.DataFrame({
+        'DATE_TIME': dates[db_rows], 'TRN_REF': refs[db_rows], 'AMOUNT': amounts[db_rows], 'BATCH': '1',
+        'TXN_TYPE': 'CWD', 'ISSUER_CODE': '130447', 'ACQUIRER_CODE': '730147',
+        'RESPONSE_CODE': np.where(rng.random(int(db_rows.sum())) < 0.1, '05', '00'), 'Original_TRN_REF': refs[db_rows],
+    })
+    return uploaded.reset_index(drop=True), db.reset_index(drop=True)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the legacy use_cols/use_cols_succunr chain with the typed projection on a large reconciliation, "
+        "from the result frames to the JSON body."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        uploaded, db = make_processed_frames(options['rows'])
+        started = time.perf_counter()
+        _, reconciled_data, succunreconciled_data, exceptions = process_reconciliation(uploaded, db)
+        self.stdout.write(
+            f"process_reconciliation: {time.perf_counter() - started:.2f}s, reconciled={len(reconciled_data)} "
+            f"succunreconciled={len(succunreconciled_data)} exceptions={len(exceptions)}"
+        )
+
+        results = {}
+        for name, run in [('legacy', legacy_results), ('projection', projected_results)]:
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                results[name] = run(reconciled_data, succunreconciled_data, exceptions)
+                timings.append(time.perf_counter() - started)
+            self.stdout.write(f"{name}: best {min(timings):.2f}s of {options['repeat']}")
+
+        if json.loads(results['legacy']) != json.loads(results['projection']):
+            raise CommandError("The projection does not produce the legacy output.")
+        self.stdout.write("outputs identical")
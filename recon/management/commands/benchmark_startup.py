@@ -0,0 +1,57 @@
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Runs in a fresh interpreter: time to a first (light) response, then the deferred cost
+# of loading the data-processing stack the first reconcile/settlement request pays
+COLD_REQUEST_SCRIPT = """
+import json, os, sys, time
+started = time.perf_counter()
+import django
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'abc_recon.settings')
+django.setup()
+from django.test import Client
+Client().get('/recon/health/db/')
+first_response = time.perf_counter()
+heavy_loaded = [name for name in ('pandas', 'openpyxl', 'recon.index', 'recon.setlement_') if name in sys.modules]
+import recon.index, recon.setlement_
+stack_loaded = time.perf_counter()
+print(json.dumps({
+    'first_response_ms': (first_response - started) * 1000,
+    'processing_stack_ms': (stack_loaded - first_response) * 1000,
+    'heavy_loaded_before_first_use': heavy_loaded,
+}))
+"""
+
+
+class Command(BaseCommand):
+    help = "Measure `manage.py check` wall time and a cold first request in fresh interpreters."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5)
+
+    def handle(self, *args, **options):
+        manage_py = str(settings.BASE_DIR / 'manage.py')
+
+        check_times = []
+        for _ in range(options['runs']):
+            started = time.perf_counter()
+            subprocess.run([sys.executable, manage_py, 'check'], check=True, capture_output=True, cwd=settings.BASE_DIR)
+            check_times.append((time.perf_counter() - started) * 1000)
+        self.stdout.write(f"manage.py check: mean={statistics.mean(check_times):.0f}ms min={min(check_times):.0f}ms")
+
+        cold_runs = []
+        for _ in range(options['runs']):
+            result = subprocess.run([sys.executable, '-c', COLD_REQUEST_SCRIPT], check=True, capture_output=True,
+                                    text=True, cwd=settings.BASE_DIR)
+            cold_runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+        self.stdout.write(
+            f"cold first request: mean={statistics.mean(run['first_response_ms'] for run in cold_runs):.0f}ms, "
+            f"processing stack loaded on first use: mean={statistics.mean(run['processing_stack_ms'] for run in cold_runs):.0f}ms, "
+            f"heavy modules loaded before first use: {cold_runs[-1]['heavy_loaded_before_first_use'] or 'none'}"
+        )
@@ -0,0 +1,86 @@
+import datetime as dt
+import json
+
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+from django.db import router, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from recon.models import TransactionRefKey, Transactions
+from recon.utils import normalize_refs
+
+# Keys looked up per IN (...) query, below SQL Server's 2100 parameters per statement
+LOOKUP_CHUNK = 1000
+
+
+def parse_since(value):
+    since = parse_datetime(value)
+    if since is None:
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f"--since is not a date or datetime: {value}")
+        since = dt.datetime.combine(day, dt.time())
+    return timezone.make_aware(since) if timezone.is_naive(since) else since
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill TransactionRefKey with the normalized reference of the Transactions rows added since the "
+        "last build (the latest DATE_TIME already keyed), or since --since."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help="Rescan from this date or datetime, refreshing keys of changed references.")
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        using = router.db_for_write(TransactionRefKey)
+        keys = TransactionRefKey.objects.using(using)
+        if options['since']:
+            since = parse_since(options['since'])
+        else:
+            since = keys.aggregate(Max('date_time'))['date_time__max']
+
+        rows = Transactions.objects.all()
+        if since is not None:
+            # Rows sharing the latest timestamp may have arrived after the previous build
+            rows = rows.filter(date_time__gte=since)
+        # In date order, so an interrupted build resumes from where it stopped
+        rows = rows.order_by('date_time').values_list('txn_id', 'trn_ref', 'date_time')
+
+        counts = {'since': since.isoformat() if since else None, 'scanned': 0, 'created': 0, 'updated': 0}
+
+        def flush(batch):
+            known = {}
+            for start in range(0, len(batch), LOOKUP_CHUNK):
+                chunk = [txn_id for txn_id, _, _ in batch[start:start + LOOKUP_CHUNK]]
+                known.update(keys.filter(txn_id__in=chunk).values_list('txn_id', 'trn_ref'))
+
+            ref_keys = normalize_refs(pd.Series([trn_ref for _, trn_ref, _ in batch], dtype=object)).tolist()
+            created, updated = [], []
+            for (txn_id, trn_ref, date_time), ref_key in zip(batch, ref_keys):
+                key = TransactionRefKey(txn_id=txn_id, ref_key=ref_key, trn_ref=trn_ref, date_time=date_time)
+                if txn_id not in known:
+                    created.append(key)
+                elif known[txn_id] != trn_ref:
+                    updated.append(key)
+
+            with transaction.atomic(using=using):
+                keys.bulk_create(created, batch_size=LOOKUP_CHUNK)
+                keys.bulk_update(updated, ['ref_key', 'trn_ref', 'date_time'], batch_size=LOOKUP_CHUNK)
+            counts['scanned'] += len(batch)
+            counts['created'] += len(created)
+            counts['updated'] += len(updated)
+
+        batch = []
+        for row in rows.iterator(chunk_size=options['batch_size']):
+            batch.append(row)
+            if len(batch) == options['batch_size']:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+
+        self.stdout.write(json.dumps(counts))
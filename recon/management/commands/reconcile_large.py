@@ -0,0 +1,66 @@
+import json
+
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+from openpyxl import load_workbook
+
+from recon.external import external_reconciliation
+from recon.extract import iter_extract
+from recon.utils import backup_refs, pre_processing
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconcile a bank statement against Transactions out of core (recon.external), for windows "
+        "too large to merge in memory. Writes the merged rows as Parquet partitions; Recon and "
+        "ReconLog are not updated."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help="The bank's statement, laid out like a reconcile upload.")
+        parser.add_argument('--bank', required=True, help="Bank code.")
+        parser.add_argument('--output', required=True, help="Directory receiving the result partitions.")
+        parser.add_argument('--memory-mb', type=int, help="Memory budget per side, RECON_EXTERNAL_MEMORY_MB by default.")
+        parser.add_argument('--chunk-rows', type=int, default=50000)
+
+    def handle(self, *args, **options):
+        chunk_rows = options['chunk_rows']
+        upload_dates = set()
+
+        def prepare_upload(rows, columns):
+            chunk = pd.DataFrame(rows, columns=columns)
+            upload_dates.update(pd.to_datetime(chunk.iloc[:, 0], errors='coerce').dropna().dt.date)
+            chunk = backup_refs(chunk, chunk.columns[3])
+            chunk['Response_code'] = '00'
+            return pre_processing(chunk)
+
+        def uploaded_chunks():
+            # Same columns as reconcileMain reads: the first four, named by the header row
+            wb = load_workbook(options['file'], read_only=True, data_only=True)
+            try:
+                rows = wb.active.iter_rows(max_col=4, values_only=True)
+                columns = list(next(rows, ()))
+                if len(columns) < 4:
+                    raise CommandError("The statement needs date, transaction type, amount and reference columns.")
+                chunk = []
+                for row in rows:
+                    if all(value is None for value in row):
+                        continue
+                    chunk.append(row)
+                    if len(chunk) == chunk_rows:
+                        yield prepare_upload(chunk, columns)
+                        chunk = []
+                if chunk:
+                    yield prepare_upload(chunk, columns)
+            finally:
+                wb.close()
+
+        def db_chunks():
+            # Started once the upload is consumed, upload_dates is complete by then
+            for chunk in iter_extract(options['bank'], upload_dates, chunk_rows):
+                chunk = backup_refs(chunk.rename(columns=str.upper), 'TRN_REF')
+                yield pre_processing(chunk)
+
+        memory_budget = options['memory_mb'] * 1024 * 1024 if options['memory_mb'] else None
+        stats = external_reconciliation(uploaded_chunks(), db_chunks(), options['output'], memory_budget=memory_budget)
+        self.stdout.write(json.dumps(stats, indent=2))
@@ -0,0 +1,96 @@
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+# zlib window bits of each content coding, gzip preferred when the client accepts both
+ENCODINGS = {'gzip': 16 + zlib.MAX_WBITS, 'deflate': zlib.MAX_WBITS}
+
+# Compressed formats (zip, parquet) gain nothing, and an event stream must reach the client as sent
+COMPRESSIBLE_TYPES = ('application/json', 'text/csv', 'text/html', 'text/plain', 'application/vnd.apache.arrow.stream')
+
+
+def accepted_encoding(accept_encoding):
+    """
+    The content coding to use for an Accept-Encoding header, gzip or deflate, or None.
+    """
+    accepted = set()
+    for item in accept_encoding.lower().split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = params.strip()
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip())
+    return next((coding for coding in ENCODINGS if coding in accepted or '*' in accepted), None)
+
+
+def compressor(encoding):
+    return zlib.compressobj(settings.RECON_COMPRESS_LEVEL, zlib.DEFLATED, ENCODINGS[encoding])
+
+
+def compress_chunks(chunks, encoding):
+    # Each chunk is flushed, so that a streamed list still reaches the client as it is produced
+    compress = compressor(encoding)
+    for chunk in chunks:
+        data = compress.compress(chunk) + compress.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compress.flush()
+
+
+async def acompress_chunks(chunks, encoding):
+    compress = compressor(encoding)
+    async for chunk in chunks:
+        data = compress.compress(chunk) + compress.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compress.flush()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Compress responses with gzip or deflate, as the client's Accept-Encoding allows. Streaming
+    responses (the async lists, the artifact downloads) are compressed chunk by chunk as they are
+    sent; other responses from RECON_COMPRESS_MIN_BYTES on. Only the COMPRESSIBLE_TYPES are.
+
+    Unlike django.middleware.gzip.GZipMiddleware it speaks deflate too and uses
+    RECON_COMPRESS_LEVEL: the default level 6 takes twice as long as level 1 on the
+    reconciliation results for a gain of a fifth. No random padding is added, the results
+    carry no secret from the request.
+    """
+
+    def process_response(self, request, response):
+        if response.has_header('Content-Encoding') or response.status_code == 206:
+            return response
+        if response.get('Content-Type', '').split(';')[0].strip() not in COMPRESSIBLE_TYPES:
+            return response
+        if not response.streaming and len(response.content) < settings.RECON_COMPRESS_MIN_BYTES:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = accepted_encoding(request.headers.get('Accept-Encoding', ''))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = acompress_chunks(response.streaming_content, encoding)
+            else:
+                response.streaming_content = compress_chunks(response.streaming_content, encoding)
+            del response.headers['Content-Length']
+        else:
+            compress = compressor(encoding)
+            response.content = compress.compress(response.content) + compress.flush()
+            response.headers['Content-Length'] = str(len(response.content))
+
+        # The compressed bytes differ, the ETag only stands for the same content
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-19 04:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recon', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReconUpload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(db_column='DIGEST', max_length=64, unique=True)),
+                ('bank_id', models.CharField(blank=True, db_column='BANK_ID', max_length=15, null=True)),
+                ('result', models.TextField(db_column='RESULT')),
+                ('date_time', models.DateTimeField(db_column='DATE_TIME', default=django.utils.timezone.now)),
+                ('recon_log', models.ForeignKey(blank=True, db_column='RECON_LOG_ID', null=True, on_delete=django.db.models.deletion.SET_NULL, to='recon.reconlog')),
+            ],
+            options={
+                'db_table': 'ReconUpload',
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-19 04:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recon', '0002_reconupload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReconArtifact',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(db_column='KIND', max_length=20)),
+                ('path', models.CharField(db_column='PATH', max_length=500)),
+                ('size', models.BigIntegerField(db_column='SIZE')),
+                ('date_time', models.DateTimeField(db_column='DATE_TIME', default=django.utils.timezone.now)),
+                ('recon_log', models.ForeignKey(db_column='RECON_LOG_ID', on_delete=django.db.models.deletion.CASCADE, related_name='artifacts', to='recon.reconlog')),
+            ],
+            options={
+                'db_table': 'ReconArtifact',
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.7 on 2026-10-19 04:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recon', '0003_reconartifact'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reconartifact',
+            name='batch',
+            field=models.CharField(blank=True, db_column='BATCH', max_length=100, null=True),
+        ),
+        migrations.AlterField(
+            model_name='reconartifact',
+            name='recon_log',
+            field=models.ForeignKey(blank=True, db_column='RECON_LOG_ID', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='artifacts', to='recon.reconlog'),
+        ),
+    ]
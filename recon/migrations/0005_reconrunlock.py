@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-19 04:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recon', '0004_reconartifact_batch_alter_reconartifact_recon_log'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReconRunLock',
+            fields=[
+                ('name', models.CharField(db_column='NAME', max_length=100, primary_key=True, serialize=False)),
+                ('owner', models.CharField(db_column='OWNER', max_length=32)),
+                ('acquired_at', models.DateTimeField(db_column='ACQUIRED_AT')),
+                ('expires_at', models.DateTimeField(db_column='EXPIRES_AT')),
+            ],
+            options={
+                'db_table': 'ReconRunLock',
+            },
+        ),
+    ]
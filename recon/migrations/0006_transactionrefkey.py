@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-19 04:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recon', '0005_reconrunlock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionRefKey',
+            fields=[
+                ('txn_id', models.CharField(db_column='TXN_ID', max_length=255, primary_key=True, serialize=False)),
+                ('ref_key', models.CharField(db_column='REF_KEY', db_index=True, max_length=12)),
+                ('trn_ref', models.CharField(blank=True, db_column='TRN_REF', max_length=255, null=True)),
+                ('date_time', models.DateTimeField(blank=True, db_column='DATE_TIME', db_index=True, null=True)),
+            ],
+            options={
+                'db_table': 'TransactionRefKey',
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-19 04:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recon', '0006_transactionrefkey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExclusionRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('use_case', models.CharField(choices=[('reconcile', 'Reconciliation extract'), ('reversals', 'Reversals'), ('settlement', 'Settlement file')], db_column='USE_CASE', max_length=20)),
+                ('name', models.CharField(db_column='NAME', max_length=100)),
+                ('kind', models.CharField(choices=[('include', 'Include'), ('exclude', 'Exclude')], db_column='KIND', default='exclude', max_length=10)),
+                ('active', models.BooleanField(db_column='ACTIVE', default=True)),
+            ],
+            options={
+                'db_table': 'ExclusionRule',
+                'unique_together': {('use_case', 'name')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ExclusionCondition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(db_column='FIELD', max_length=50)),
+                ('values', models.TextField(db_column='VALUES')),
+                ('negate', models.BooleanField(db_column='NEGATE', default=False)),
+                ('rule', models.ForeignKey(db_column='RULE_ID', on_delete=django.db.models.deletion.CASCADE, related_name='conditions', to='recon.exclusionrule')),
+            ],
+            options={
+                'db_table': 'ExclusionCondition',
+            },
+        ),
+    ]
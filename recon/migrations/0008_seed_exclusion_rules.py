@@ -0,0 +1,46 @@
+from django.db import migrations
+
+INQUIRY_PROCESSING_CODES = '320000,340000,510000,370000,180000,360000'
+
+# The sets previously hard-coded in transactions_extract, ReversalsView and select_setle_file:
+# (use case, rule, kind, [(field, values, negate), ...])
+RULES = [
+    ('reconcile', 'authorizations', 'include', [('request_type', '1200', False)]),
+    ('reconcile', 'paid balance inquiries', 'exclude', [
+        ('txn_type', 'BI,MINI', False), ('amount', '0', True), ('processing_code', INQUIRY_PROCESSING_CODES, True),
+    ]),
+    ('reversals', 'reversal requests', 'include', [('request_type', '1420,1421', False)]),
+    ('reversals', 'balance inquiries', 'exclude', [('txn_type', 'BI,MINI', False)]),
+    ('reversals', 'inquiry processing codes', 'exclude', [('processing_code', INQUIRY_PROCESSING_CODES, False)]),
+    ('reversals', 'zero amounts', 'exclude', [('amount', '0', False)]),
+    ('settlement', 'agent float', 'include', [('issuer_code', '730147', False), ('txn_type', 'ACI,AGENTFLOATINQ', False)]),
+    ('settlement', 'reversals', 'exclude', [('request_type', '1420,1421', False)]),
+]
+
+
+def seed_rules(apps, schema_editor):
+    ExclusionRule = apps.get_model('recon', 'ExclusionRule')
+    ExclusionCondition = apps.get_model('recon', 'ExclusionCondition')
+    using = schema_editor.connection.alias
+    for use_case, name, kind, conditions in RULES:
+        rule = ExclusionRule.objects.using(using).create(use_case=use_case, name=name, kind=kind)
+        for field, values, negate in conditions:
+            ExclusionCondition.objects.using(using).create(rule=rule, field=field, values=values, negate=negate)
+
+
+def remove_rules(apps, schema_editor):
+    ExclusionRule = apps.get_model('recon', 'ExclusionRule')
+    using = schema_editor.connection.alias
+    for use_case, name, _, _ in RULES:
+        ExclusionRule.objects.using(using).filter(use_case=use_case, name=name).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recon', '0007_exclusionrules'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_rules, remove_rules),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-19 05:15
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recon', '0008_seed_exclusion_rules'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChunkedUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(db_column='FILENAME', max_length=255)),
+                ('size', models.BigIntegerField(db_column='SIZE')),
+                ('sha256', models.CharField(db_column='SHA256', max_length=64)),
+                ('chunk_size', models.IntegerField(db_column='CHUNK_SIZE')),
+                ('path', models.CharField(blank=True, db_column='PATH', max_length=500, null=True)),
+                ('created_at', models.DateTimeField(db_column='CREATED_AT', db_index=True, default=django.utils.timezone.now)),
+                ('completed_at', models.DateTimeField(blank=True, db_column='COMPLETED_AT', null=True)),
+                ('user', models.ForeignKey(db_column='USER_ID', on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'ChunkedUpload',
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-19 05:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recon', '0009_chunkedupload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExclusionRulesVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(db_column='VERSION', default=0)),
+            ],
+            options={
+                'db_table': 'ExclusionRulesVersion',
+            },
+        ),
+    ]
@@ -1,4 +1,6 @@
 # Create your models here.
+import uuid
+
 from django.utils import timezone
 
 from django.db import models
@@ -35,7 +37,133 @@ class ReconLog(models.Model):
 
     class Meta:
         db_table = 'ReconLog'
-                
+
+
+class ReconUpload(models.Model):
+    # sha256 of the bank code, the rules version and the uploaded file bytes, see utils.upload_digest
+    digest = models.CharField(db_column='DIGEST', max_length=64, unique=True)
+    bank_id = models.CharField(db_column='BANK_ID', max_length=15, blank=True, null=True)
+    recon_log = models.ForeignKey(ReconLog, db_column='RECON_LOG_ID', on_delete=models.SET_NULL, blank=True, null=True)
+    # The response summary as JSON, the rows are read back from the run's merged artifact
+    result = models.TextField(db_column='RESULT')
+    date_time = models.DateTimeField(db_column='DATE_TIME', default=timezone.now)
+
+    class Meta:
+        db_table = 'ReconUpload'
+
+
+class ReconArtifact(models.Model):
+    # A file kept for a reconciliation run, e.g. its merged frame (see recon.artifacts).
+    # Profiles of settlement requests have no run and carry the batch instead.
+    recon_log = models.ForeignKey(ReconLog, db_column='RECON_LOG_ID', on_delete=models.CASCADE, related_name='artifacts',
+                                  blank=True, null=True)
+    batch = models.CharField(db_column='BATCH', max_length=100, blank=True, null=True)
+    kind = models.CharField(db_column='KIND', max_length=20)
+    path = models.CharField(db_column='PATH', max_length=500)
+    size = models.BigIntegerField(db_column='SIZE')
+    date_time = models.DateTimeField(db_column='DATE_TIME', default=timezone.now)
+
+    class Meta:
+        db_table = 'ReconArtifact'
+
+
+class ReconRunLock(models.Model):
+    # Advisory lock rows shared by every worker, see recon.locks. A lock whose lease
+    # has expired (its holder died) can be taken over.
+    name = models.CharField(db_column='NAME', max_length=100, primary_key=True)
+    owner = models.CharField(db_column='OWNER', max_length=32)
+    acquired_at = models.DateTimeField(db_column='ACQUIRED_AT')
+    expires_at = models.DateTimeField(db_column='EXPIRES_AT')
+
+    class Meta:
+        db_table = 'ReconRunLock'
+
+
+class TransactionRefKey(models.Model):
+    # The normalized 12-character reference (utils.normalize_refs) of each Transactions row,
+    # indexed for lookups. Transactions is not ours to alter; filled by build_ref_keys.
+    txn_id = models.CharField(db_column='TXN_ID', max_length=255, primary_key=True)
+    ref_key = models.CharField(db_column='REF_KEY', max_length=12, db_index=True)
+    trn_ref = models.CharField(db_column='TRN_REF', max_length=255, blank=True, null=True)
+    date_time = models.DateTimeField(db_column='DATE_TIME', blank=True, null=True, db_index=True)
+
+    class Meta:
+        db_table = 'TransactionRefKey'
+
+
+class ExclusionRule(models.Model):
+    # Which Transactions rows take part in a use case, see recon.rules. A row matches a rule when it
+    # matches all of its conditions. The rows kept match every 'include' rule and no 'exclude' rule.
+    RECONCILE = 'reconcile'
+    REVERSALS = 'reversals'
+    SETTLEMENT = 'settlement'
+    USE_CASES = [(RECONCILE, 'Reconciliation extract'), (REVERSALS, 'Reversals'), (SETTLEMENT, 'Settlement file')]
+    INCLUDE = 'include'
+    EXCLUDE = 'exclude'
+    KINDS = [(INCLUDE, 'Include'), (EXCLUDE, 'Exclude')]
+
+    use_case = models.CharField(db_column='USE_CASE', max_length=20, choices=USE_CASES)
+    name = models.CharField(db_column='NAME', max_length=100)
+    kind = models.CharField(db_column='KIND', max_length=10, choices=KINDS, default=EXCLUDE)
+    active = models.BooleanField(db_column='ACTIVE', default=True)
+
+    class Meta:
+        db_table = 'ExclusionRule'
+        unique_together = [('use_case', 'name')]
+
+    def __str__(self) -> str:
+        return f"{self.use_case}: {self.kind} {self.name}"
+
+
+class ExclusionCondition(models.Model):
+    rule = models.ForeignKey(ExclusionRule, db_column='RULE_ID', on_delete=models.CASCADE, related_name='conditions')
+    # A Transactions field name, e.g. txn_type
+    field = models.CharField(db_column='FIELD', max_length=50)
+    # Comma separated
+    values = models.TextField(db_column='VALUES')
+    # The condition holds when the field is NOT one of the values
+    negate = models.BooleanField(db_column='NEGATE', default=False)
+
+    class Meta:
+        db_table = 'ExclusionCondition'
+
+    def value_list(self):
+        return [value.strip() for value in self.values.split(',') if value.strip()]
+
+    def clean(self):
+        field_names = {field.name for field in Transactions._meta.concrete_fields}
+        if self.field not in field_names:
+            raise ValidationError({'field': f"Transactions has no field '{self.field}'."})
+        if not self.value_list():
+            raise ValidationError({'values': "At least one value is required."})
+
+
+class ExclusionRulesVersion(models.Model):
+    # A single row, incremented when a rule or a condition changes: every worker compares it with the
+    # version its compiled rules were built from, see recon.rules
+    version = models.BigIntegerField(db_column='VERSION', default=0)
+
+    class Meta:
+        db_table = 'ExclusionRulesVersion'
+
+
+class ChunkedUpload(models.Model):
+    # A statement sent in chunks and assembled on local disk once complete, see recon.uploads
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, db_column='USER_ID', on_delete=models.CASCADE)
+    filename = models.CharField(db_column='FILENAME', max_length=255)
+    size = models.BigIntegerField(db_column='SIZE')
+    # Hex sha256 of the whole file, checked when it is assembled
+    sha256 = models.CharField(db_column='SHA256', max_length=64)
+    chunk_size = models.IntegerField(db_column='CHUNK_SIZE')
+    # The assembled file, set once complete
+    path = models.CharField(db_column='PATH', max_length=500, blank=True, null=True)
+    created_at = models.DateTimeField(db_column='CREATED_AT', default=timezone.now, db_index=True)
+    completed_at = models.DateTimeField(db_column='COMPLETED_AT', blank=True, null=True)
+
+    class Meta:
+        db_table = 'ChunkedUpload'
+
 
 class Recon(models.Model):
     date_time = models.DateTimeField(db_column='DATE_TIME',blank=True, null=True,default=timezone.now)  # Field name made lowercase.
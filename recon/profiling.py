@@ -0,0 +1,82 @@
+import cProfile
+import marshal
+import threading
+import time
+import tracemalloc
+
+# cProfile and tracemalloc are process wide, one profiled request at a time
+_profiling = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+class RunProfiler:
+    """
+    Run a block under cProfile and tracemalloc.
+
+    Only the calling thread is profiled (threads started inside the block are not), while
+    allocations are traced for the whole process. Views only create one when a staff user
+    asks for it, so requests without the flag pay nothing.
+
+    Raises:
+    ProfilerBusy: On entering, when another request is being profiled.
+    """
+
+    def __init__(self, top=50, frames=10):
+        self.top = top
+        self.frames = frames
+
+    def __enter__(self):
+        if not _profiling.acquire(blocking=False):
+            raise ProfilerBusy("Another request is being profiled, try again when it completes.")
+        # Leave tracemalloc running afterwards if it was started outside (PYTHONTRACEMALLOC)
+        self.tracing_before = tracemalloc.is_tracing()
+        if not self.tracing_before:
+            tracemalloc.start(self.frames)
+        tracemalloc.reset_peak()
+        self.profile = cProfile.Profile()
+        self.started = time.perf_counter()
+        self.profile.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.profile.disable()
+            self.elapsed_seconds = round(time.perf_counter() - self.started, 3)
+            self.snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+            ])
+            self.peak_memory_bytes = tracemalloc.get_traced_memory()[1]
+            if not self.tracing_before:
+                tracemalloc.stop()
+        finally:
+            _profiling.release()
+        return False
+
+    def profile_data(self):
+        """
+        The profile in the .prof format of cProfile.Profile.dump_stats (pstats, snakeviz).
+        """
+        self.profile.create_stats()
+        return marshal.dumps(self.profile.stats)
+
+    def allocations_report(self):
+        """
+        The top allocation sites still held when the block ended, as text.
+        """
+        statistics = self.snapshot.statistics('lineno')
+        lines = [
+            f"elapsed: {self.elapsed_seconds}s, peak traced memory: {self.peak_memory_bytes / 1024 / 1024:.1f} MiB",
+            f"top {min(self.top, len(statistics))} of {len(statistics)} allocation sites by size:",
+            "",
+        ]
+        for stat in statistics[:self.top]:
+            frame = stat.traceback[0]
+            lines.append(f"{stat.size / 1024:10.1f} KiB {stat.count:8d} blocks  {frame.filename}:{frame.lineno}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        return {"elapsed_seconds": self.elapsed_seconds, "peak_memory_bytes": self.peak_memory_bytes}
@@ -0,0 +1,162 @@
+import asyncio
+import json
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.utils.encoders import JSONEncoder
+
+# Events kept per run, a client reconnecting further behind gets the latest ones
+MAX_EVENTS = 200
+KEEPALIVE_SECONDS = 15
+
+
+def progress_key(progress_id):
+    return f"recon:progress:{progress_id}"
+
+
+def get_progress(progress_id):
+    """
+    The reported state of a run: {'user': id, 'events': [...], 'done': bool}, or None.
+    """
+    return cache.get(progress_key(progress_id))
+
+
+class ProgressReporter:
+    """
+    Publish the progress of a long run (reconcileMain, setleSabs) to the cache, where the
+    progress endpoint of any worker reads it (see recon.views.ProgressView).
+
+    Each event is {'seq': n, 'stage': name, ...data}. stage() always publishes; update() is
+    for loops and publishes at most every RECON_PROGRESS_INTERVAL seconds, so a call costs a
+    clock read. A reporter without a progress id does nothing.
+
+    Parameters:
+    progress_id (str): The id the client chose for the run, None to report nothing.
+    user_id (int): The user allowed to read the progress.
+    """
+
+    def __init__(self, progress_id=None, user_id=None):
+        self.progress_id = progress_id
+        self.user_id = user_id
+        self.events = []
+        self.seq = 0
+        self._last_publish = 0.0
+        self._pending = None
+
+    def stage(self, name, **data):
+        if self.progress_id is None:
+            return
+        self._flush_pending()
+        self._append(name, data)
+        self.publish()
+
+    def update(self, name, **data):
+        if self.progress_id is None:
+            return
+        now = time.monotonic()
+        if now - self._last_publish < settings.RECON_PROGRESS_INTERVAL:
+            self._pending = (name, data)
+            return
+        self._append(name, data)
+        self.publish()
+
+    def finish(self, name='done', **data):
+        if self.progress_id is None:
+            return
+        self._flush_pending()
+        self._append(name, data)
+        self.publish(done=True)
+
+    def _flush_pending(self):
+        # The last throttled update, e.g. upserted n of n, goes out before the next stage
+        if self._pending is not None:
+            self._append(*self._pending)
+
+    def _append(self, name, data):
+        self.seq += 1
+        self._pending = None
+        self.events.append({"seq": self.seq, "stage": name, **data})
+        del self.events[:-MAX_EVENTS]
+
+    def publish(self, done=False):
+        self._last_publish = time.monotonic()
+        cache.set(
+            progress_key(self.progress_id),
+            {"user": self.user_id, "events": self.events, "done": done},
+            settings.RECON_PROGRESS_TIMEOUT,
+        )
+
+
+def request_reporter(request):
+    """
+    A reporter for the progress_id a request carries, read before the request data is validated,
+    e.g. to report a request rejected before its view runs. An invalid id reports nothing.
+    """
+    try:
+        progress_id = str(uuid.UUID(str(request.data.get('progress_id'))))
+    except (AttributeError, ValueError):
+        progress_id = None
+    return ProgressReporter(progress_id, request.user.id)
+
+
+def events_after(state, seq):
+    return [event for event in state["events"] if event["seq"] > seq]
+
+
+def _sse(event, data, seq=None):
+    lines = [f"id: {seq}"] if seq is not None else []
+    lines += [f"event: {event}", f"data: {json.dumps(data, cls=JSONEncoder)}"]
+    return ("\n".join(lines) + "\n\n").encode()
+
+
+def _stream_step(state, user_id, after):
+    # The frames to send for the current state, the last sequence number sent, and whether to stop
+    if state is None:
+        return [], after, False
+    if state["user"] != user_id:
+        return [_sse("error", {"detail": "Not found."})], after, True
+    frames = []
+    for event in events_after(state, after):
+        frames.append(_sse("progress", event, seq=event["seq"]))
+        after = event["seq"]
+    if state["done"]:
+        frames.append(_sse("end", {"seq": after}))
+    return frames, after, state["done"]
+
+
+def event_snapshot(progress_id, user_id, after=0):
+    """
+    The events of a run after `after` as a single Server-Sent Events body, for WSGI workers, where
+    a stream would hold a worker thread for as long as it is open. EventSource reconnects after
+    the retry hint with Last-Event-ID, which turns the stream into polling.
+    """
+    frames, _, _ = _stream_step(get_progress(progress_id), user_id, after)
+    return b"".join([f"retry: {int(settings.RECON_PROGRESS_POLL_SECONDS * 1000)}\n\n".encode(), *frames])
+
+
+async def aevent_stream(progress_id, user_id, after=0):
+    """
+    The events of a run after `after` as Server-Sent Events, until the run is done or
+    RECON_PROGRESS_STREAM_SECONDS have passed; the client then reconnects with Last-Event-ID.
+    The run may not have started yet, the stream waits for it. For ASGI servers only, where
+    waiting does not take a worker thread.
+    """
+    deadline = time.monotonic() + settings.RECON_PROGRESS_STREAM_SECONDS
+    last_sent = time.monotonic()
+    # Tell EventSource how soon to reconnect when the stream ends early
+    yield f"retry: {int(settings.RECON_PROGRESS_INTERVAL * 1000) or 500}\n\n".encode()
+    while True:
+        frames, after, stop = _stream_step(await cache.aget(progress_key(progress_id)), user_id, after)
+        for frame in frames:
+            yield frame
+        if stop or time.monotonic() >= deadline:
+            return
+        if frames:
+            last_sent = time.monotonic()
+        elif time.monotonic() - last_sent >= KEEPALIVE_SECONDS:
+            # A comment, so that proxies do not close an idle connection
+            yield b": keepalive\n\n"
+            last_sent = time.monotonic()
+        await asyncio.sleep(settings.RECON_PROGRESS_INTERVAL)
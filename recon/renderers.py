@@ -0,0 +1,158 @@
+import json
+import sys
+
+import orjson
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+_encoder = JSONEncoder()
+
+
+def _default(obj):
+    # Only called for what orjson does not encode itself, datetimes included, so that they come
+    # out as with JSONEncoder. pandas is only looked at when a view already imported it.
+    pd = sys.modules.get('pandas')
+    if pd is not None:
+        if isinstance(obj, pd.DataFrame):
+            return frame_records(obj)
+        if obj is pd.NaT or obj is pd.NA:
+            return None
+    return _encoder.default(obj)
+
+
+def dumps(data, indent=False):
+    """
+    Encode data as JSON with orjson, as JSONRenderer would, except that NaN and Infinity are
+    encoded as null and DataFrames as a list of records (see frame_records).
+
+    Returns:
+    bytes: The UTF-8 encoded JSON.
+    """
+    option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+    if indent:
+        option |= orjson.OPT_INDENT_2
+    return orjson.dumps(data, default=_default, option=option)
+
+
+def frame_records(df):
+    """
+    The rows of a DataFrame as DataFrame.to_dict(orient='records') gives them, built one column at a
+    time: naive datetime columns are formatted at once, as JSONEncoder formats a datetime, instead of
+    going through the encoder value by value, and missing dates become None.
+    """
+    import numpy as np
+
+    columns = list(df.columns)
+    values = []
+    for position in range(len(columns)):
+        series = df.iloc[:, position]
+        if series.dtype.kind == 'M' and series.dt.tz is None:
+            text = np.datetime_as_string(series.to_numpy(), unit='s')
+            fraction = (series.dt.microsecond != 0).to_numpy()
+            if fraction.any():
+                # Microseconds, only on the values that have some
+                text = np.where(fraction, np.datetime_as_string(series.to_numpy(), unit='us'), text)
+            values.append(np.where(series.isna().to_numpy(), None, text).tolist())
+        else:
+            values.append(series.tolist())
+    return [dict(zip(columns, row)) for row in zip(*values)]
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    The default JSON renderer (REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES']), on orjson. Views may put
+    DataFrames in the data, which are encoded as records; NaN and Infinity are encoded as null where
+    JSONRenderer would raise.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return dumps(data, indent=bool(self.get_indent(accepted_media_type, renderer_context or {})))
+
+
+class DataFrameRenderer(BaseRenderer):
+    """
+    Base for the columnar formats. Views hand it {'frames': {name: DataFrame}, 'metadata': {...}};
+    the frames are stacked into one Arrow table with a FRAME column naming the source frame,
+    and the metadata travels as JSON in the schema metadata under b'recon'.
+
+    Anything else (validation errors, a failed run without frames) is rendered as JSON.
+    """
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        frames = data.get('frames') if isinstance(data, dict) else None
+        if not frames:
+            response = (renderer_context or {}).get('response')
+            if response is not None:
+                response['Content-Type'] = JSONRenderer.media_type
+            return FastJSONRenderer().render(data.get('metadata', data) if isinstance(data, dict) else data)
+
+        table = frames_to_table(frames, data.get('metadata'))
+        return self.write(table)
+
+    def write(self, table):
+        raise NotImplementedError('DataFrameRenderer subclasses must implement .write()')
+
+
+class ArrowStreamRenderer(DataFrameRenderer):
+    media_type = 'application/vnd.apache.arrow.stream'
+    format = 'arrow'
+
+    def write(self, table):
+        import pyarrow as pa
+
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+
+class ParquetRenderer(DataFrameRenderer):
+    media_type = 'application/vnd.apache.parquet'
+    format = 'parquet'
+
+    def write(self, table):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        sink = pa.BufferOutputStream()
+        pq.write_table(table, sink)
+        return sink.getvalue().to_pybytes()
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Lets a view accept text/event-stream. Views stream the events themselves (recon.progress);
+    what goes through the renderer (errors) is sent as a single 'error' event.
+    """
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return f"event: error\ndata: {json.dumps(data, cls=JSONEncoder)}\n\n".encode()
+
+
+def frames_to_table(frames, metadata=None):
+    """
+    Stack named DataFrames column-wise into a single Arrow table, without going through
+    Python objects per row. Columns missing from a frame are null for its rows.
+    """
+    import pyarrow as pa
+
+    tables = []
+    for name, df in frames.items():
+        # Categoricals (e.g. the merge indicator) would carry a different dictionary per frame
+        categorical = [column for column, dtype in df.dtypes.items() if dtype == 'category']
+        if categorical:
+            df = df.astype({column: object for column in categorical})
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        tables.append(table.append_column('FRAME', pa.array([name] * table.num_rows, pa.string())))
+
+    table = pa.concat_tables(tables, promote_options='permissive')
+    if metadata is not None:
+        table = table.replace_schema_metadata({b'recon': json.dumps(metadata, cls=JSONEncoder).encode()})
+    return table
@@ -0,0 +1,35 @@
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class ReplicaRouter:
+    """
+    Sends reads of the heavy read-only model, the Transactions extracts, to the `replica`
+    database when one is configured.
+
+    Every other read and all writes stay on the primary. That includes Recon and ReconLog,
+    which are read right after they are written (a run just made, a list refilled once
+    invalidated) and would lag behind on the replica.
+    """
+    read_models = {'transactions'}
+
+    def __init__(self, primary=DEFAULT_DB_ALIAS, replica='replica'):
+        self.primary = primary
+        self.replica = replica
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == 'recon' and model._meta.model_name in self.read_models and self.replica in connections:
+            return self.replica
+        return self.primary
+
+    def db_for_write(self, model, **hints):
+        return self.primary
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica is a copy of the primary, rows from either may reference each other
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica follows the primary, never migrate it directly
+        if db == self.replica:
+            return False
+        return None
@@ -0,0 +1,142 @@
+import threading
+import time
+from functools import reduce
+from operator import and_
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import ExclusionCondition, ExclusionRule, ExclusionRulesVersion, Transactions
+
+# Compiled rules of this worker: use case -> (version, CompiledRules)
+_compiled = {}
+_compiled_lock = threading.Lock()
+
+# The version last read by this worker, and when: (version, time.monotonic())
+_version = None
+
+
+def rules_version():
+    """
+    The current generation of the exclusion rules, read from the ExclusionRulesVersion row so that
+    every worker sees a change. A worker reads it again after RECON_RULES_CHECK_SECONDS, which bounds
+    how long it keeps extracting with rules changed in another worker.
+    """
+    global _version
+    if _version is not None and time.monotonic() - _version[1] < settings.RECON_RULES_CHECK_SECONDS:
+        return _version[0]
+    version = ExclusionRulesVersion.objects.filter(pk=1).values_list('version', flat=True).first()
+    if version is None:
+        version = ExclusionRulesVersion.objects.get_or_create(pk=1)[0].version
+    _version = (version, time.monotonic())
+    return version
+
+
+def invalidate_rules():
+    global _version
+    if not ExclusionRulesVersion.objects.filter(pk=1).update(version=F('version') + 1):
+        ExclusionRulesVersion.objects.get_or_create(pk=1, defaults={'version': 1})
+    _version = None
+    _compiled.clear()
+
+
+@receiver(post_save, sender=ExclusionRule)
+@receiver(post_delete, sender=ExclusionRule)
+@receiver(post_save, sender=ExclusionCondition)
+@receiver(post_delete, sender=ExclusionCondition)
+def rules_changed(sender, using, **kwargs):
+    # After the commit, a worker recompiling earlier would cache the old rules under the new version
+    transaction.on_commit(invalidate_rules, using=using)
+
+
+class CompiledRules:
+    """
+    The active rules of a use case, as an ORM filter and as a DataFrame mask.
+
+    Parameters:
+    rules (list of (str, list of (str, list of str, bool))): (kind, [(field, values, negate), ...]) per rule.
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.q = self._compile_q()
+
+    @staticmethod
+    def _condition_q(field, values, negate):
+        condition = Q(**{f"{field}__in": values})
+        return ~condition if negate else condition
+
+    def _compile_q(self):
+        q = Q()
+        for kind, conditions in self.rules:
+            matches = reduce(and_, [self._condition_q(*condition) for condition in conditions])
+            q &= matches if kind == ExclusionRule.INCLUDE else ~matches
+        return q
+
+    def mask(self, df, columns=None):
+        """
+        The rows of a DataFrame the rules keep, the same rows the ORM filter would.
+
+        Parameters:
+        df (pandas.DataFrame): Transactions rows, with columns named after the fields or their db columns.
+        columns (dict): Column of each field, when named otherwise.
+
+        Returns:
+        numpy.ndarray: A boolean mask.
+        """
+        import numpy as np
+        import pandas as pd
+
+        columns = columns or {}
+
+        def column(field):
+            model_field = Transactions._meta.get_field(field)
+            name = columns.get(field, field if field in df.columns else model_field.column)
+            return df[name], model_field
+
+        def condition_mask(field, values, negate):
+            series, model_field = column(field)
+            if model_field.get_internal_type() in ('DecimalField', 'FloatField', 'IntegerField', 'BigIntegerField'):
+                # Decimal('0.00') is the value '0' of the SQL comparison
+                matches = pd.to_numeric(series, errors='coerce').isin(pd.to_numeric(pd.Series(values), errors='coerce'))
+            else:
+                matches = series.astype(object).where(series.notna(), None).isin(values)
+            matches = matches.to_numpy(dtype=bool)
+            # A missing value is not one of the values, as for Django's ~Q on a nullable field
+            return ~matches if negate else matches
+
+        keep = np.ones(len(df), dtype=bool)
+        for kind, conditions in self.rules:
+            matches = reduce(np.logical_and, [condition_mask(*condition) for condition in conditions])
+            keep &= matches if kind == ExclusionRule.INCLUDE else ~matches
+        return keep
+
+
+def compiled_rules(use_case):
+    """
+    The compiled active rules of a use case. Compiled once per worker and kept until a rule
+    or a condition is saved or deleted, in this worker or, after RECON_RULES_CHECK_SECONDS, in another.
+
+    Returns:
+    CompiledRules: The rules; the filter of a use case without rules keeps every row.
+    """
+    version = rules_version()
+    entry = _compiled.get(use_case)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+
+    with _compiled_lock:
+        rules = []
+        for rule in ExclusionRule.objects.filter(use_case=use_case, active=True).prefetch_related('conditions').order_by('id'):
+            conditions = [
+                (condition.field, condition.value_list(), condition.negate)
+                for condition in rule.conditions.all() if condition.value_list()
+            ]
+            if conditions:
+                rules.append((rule.kind, conditions))
+        compiled = CompiledRules(rules)
+        _compiled[use_case] = (version, compiled)
+    return compiled
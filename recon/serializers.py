@@ -1,4 +1,6 @@
+from django.conf import settings
 from rest_framework import serializers
+from .artifacts import RECON_STATUSES
 from .models import Bank,Recon,ReconLog,UploadedFile,Transactions
 
 class TransactionSerializer(serializers.ModelSerializer):
@@ -25,14 +27,63 @@ class UploadedFileSerializer(serializers.ModelSerializer):
         model = UploadedFile
         fields = ["id","file"]
         
+def validate_file_or_upload(attrs):
+    # A statement comes either as a multipart file or as a chunked upload already assembled
+    if bool(attrs.get('file')) == bool(attrs.get('upload_id')):
+        raise serializers.ValidationError({'file': ["Send either a file or the upload_id of a complete chunked upload."]})
+    return attrs
+
 class ReconcileSerializer(serializers.Serializer):
-    file = serializers.FileField()
+    file = serializers.FileField(required=False)
+    # A complete chunked upload (uploads/) to reconcile instead of a file
+    upload_id = serializers.UUIDField(required=False)
+    fuzzy_match = serializers.BooleanField(required=False, default=False)
+    date_tolerance_days = serializers.IntegerField(required=False, default=1, min_value=0, max_value=31)
+    amount_tolerance = serializers.IntegerField(required=False, default=0, min_value=0)
+    # Re-run even if the same file was already reconciled for this bank
+    force = serializers.BooleanField(required=False, default=False)
+    # Staff only: run under cProfile/tracemalloc and keep the trace, see recon.profiling
+    profile = serializers.BooleanField(required=False, default=False)
+    # Id chosen by the client to follow the run at progress/<id>/, see recon.progress
+    progress_id = serializers.UUIDField(required=False)
     #swift_code = serializers.CharField(max_length=200)
 
+    def validate(self, attrs):
+        return validate_file_or_upload(attrs)
+
 
 class SabsSerializer(serializers.Serializer):
-    file = serializers.FileField()
+    file = serializers.FileField(required=False)
+    upload_id = serializers.UUIDField(required=False)
     batch_number = serializers.CharField(max_length=100)
+    progress_id = serializers.UUIDField(required=False)
+
+    def validate(self, attrs):
+        return validate_file_or_upload(attrs)
 
 class SettlementSerializer(serializers.Serializer):
-    batch_number = serializers.CharField(max_length=100)
\ No newline at end of file
+    batch_number = serializers.CharField(max_length=100)
+    profile = serializers.BooleanField(required=False, default=False)
+
+class RunQuerySerializer(serializers.Serializer):
+    ref = serializers.CharField(max_length=255, required=False)
+    status = serializers.ChoiceField(choices=RECON_STATUSES, required=False)
+
+class RunDeltaQuerySerializer(serializers.Serializer):
+    # Compare with this run instead of the latest earlier overlapping one
+    previous = serializers.IntegerField(required=False)
+
+class ProgressQuerySerializer(serializers.Serializer):
+    # Events after this sequence number, for polling clients
+    after = serializers.IntegerField(required=False, default=0, min_value=0)
+
+class ChunkedUploadSerializer(serializers.Serializer):
+    filename = serializers.CharField(max_length=255)
+    size = serializers.IntegerField(min_value=1)
+    sha256 = serializers.RegexField(r'^[0-9a-fA-F]{64}$')
+    chunk_size = serializers.IntegerField(required=False, min_value=256 * 1024, max_value=64 * 1024 * 1024)
+
+    def validate_size(self, value):
+        if value > settings.RECON_UPLOAD_MAX_MB * 1024 * 1024:
+            raise serializers.ValidationError(f"Files are limited to {settings.RECON_UPLOAD_MAX_MB} MB.")
+        return value
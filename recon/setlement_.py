@@ -3,10 +3,10 @@ import logging
 from .utils import convert_batch_to_int,  add_payer_beneficiary, combine_transactions, pre_processing, pre_processing_amt, read_excel_file, select_setle_file, merge, select_setle_file
 import glob
 
+from .progress import ProgressReporter
+
 def settle(batch):
     try:
-        logging.basicConfig(filename='settlement.log', level=logging.ERROR)
-
         # Execute the SQL query
         datadump = select_setle_file(batch)
         
@@ -32,10 +32,12 @@ def settle(batch):
     return setlement_result
 
 
-def setleSabs(path, batch):
-
+def setleSabs(path, batch, progress=None):
+    # progress: optional ProgressReporter the stages are reported to as they complete
+    progress = progress or ProgressReporter()
     try:     
         datadump = select_setle_file(batch)
+        progress.stage('extracted', rows=len(datadump) if datadump is not None else 0)
 
         # Check if datadump is not None and not empty
         if datadump is not None and not datadump.empty:
@@ -49,12 +51,12 @@ def setleSabs(path, batch):
             else:
                 matching_file = excel_files[0]
                 SABSfile_ = read_excel_file(matching_file, 'Transaction Report')
+                progress.stage('parsed', rows=len(SABSfile_) if SABSfile_ is not None else 0)
                 SABSfile_ = pre_processing_amt(SABSfile_)
                 SABSfile_ = pre_processing(SABSfile_)
 
             merged_setle, matched_setle, unmatched_setle, unmatched_setlesabs = merge(SABSfile_, datadump)
-
-            logging.basicConfig(filename='settlement_recon.log', level=logging.ERROR)
+            progress.stage('matched', matched=len(matched_setle), unmatched=len(unmatched_setle))
 
             print('Settlement Report has been generated')                
         
@@ -63,7 +65,10 @@ def setleSabs(path, batch):
         
     except Exception as e:
         logging.error(f"Error: {str(e)}")
+        progress.finish('failed', feedback=str(e))
+        raise
 
+    progress.finish()
     return merged_setle, matched_setle, unmatched_setle, unmatched_setlesabs
 
 
@@ -1,3 +1,2120 @@
-from django.test import TestCase
+import datetime as dt
+import hashlib
+import io
+import json
+import logging
+import os
+import pstats
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import tracemalloc
+import zipfile
+import zlib
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.handlers.asgi import ASGIRequest
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, connections
+from django.db.models import F, Q
+from django.http import StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from openpyxl import Workbook
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, force_authenticate
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .admission import acquire_slot
+from .checks import shared_cache_check
+from .artifacts import normalize_ref, read_merged_artifact, save_merged_artifact
+from .exports import stream_zip_csv
+from .middleware import CompressionMiddleware
+from .management.commands.benchmark_projection import legacy_results, make_processed_frames, projected_results
+from .external import external_reconciliation, read_partitions
+from .extract_cache import FrameLRU, cached_extract_days, extract_cache, store_extract_day
+from .index import reconcileMain
+from .extract import fetch_extract, iter_extract, plan_date_runs
+from .models import Bank, ChunkedUpload, ExclusionCondition, ExclusionRule, ExclusionRulesVersion, Recon, ReconArtifact, ReconLog, ReconRunLock, ReconUpload, TransactionRefKey, Transactions, UploadedFile, UserBankMapping
+from .locks import LockNotAcquired, acquire_lock, bank_run_lock, db_lock, release_lock
+from .profiling import ProfilerBusy, RunProfiler, _profiling
+from .progress import ProgressReporter, get_progress
+from .renderers import dumps
+from .routers import ReplicaRouter
+from .rules import compiled_rules, invalidate_rules, rules_version
+from .views import CustomReconciliationError, ProgressView, ReferenceLookupView, current_day
+from .utils import (
+    CustomTypeError, RECONCILED_COLUMNS, SUCCUNRECONCILED_COLUMNS, backup_refs, fuzzy_match_unmatched,
+    ingest_recon_workbook, insert_recon_stats, normalize_refs, pre_processing, select_setle_file, process_reconciliation, project, update_reconciliation,
+    upload_digest
+)
+
+logger = logging.getLogger(__name__)
+
+
+def create_transactions_table(alias='default'):
+    # Transactions is unmanaged (and uses a SQL Server collation), create an untyped SQLite stand-in.
+    # Amounts get numeric affinity, so they compare with Django's Decimal parameters as numbers.
+    def column(field):
+        affinity = ' NUMERIC' if field.get_internal_type() == 'DecimalField' else ''
+        return f'"{field.column}"{affinity} PRIMARY KEY' if field.primary_key else f'"{field.column}"{affinity}'
+
+    columns = ", ".join(column(field) for field in Transactions._meta.concrete_fields)
+    with connections[alias].cursor() as cursor:
+        cursor.execute(f'CREATE TABLE IF NOT EXISTS "{Transactions._meta.db_table}" ({columns})')
+
+
+def make_uploaded_df(rows):
+    # rows: (date, transaction type, amount, reference) as they come out of the bank's Excel file
+    df = pd.DataFrame(rows, columns=['Date', 'Transaction type', 'Amount', 'ABC Reference'])
+    df['Date'] = pd.to_datetime(df['Date'])
+    df = backup_refs(df, 'ABC Reference')
+    df['Response_code'] = '00'
+    return pre_processing(df)
+
+
+def make_db_df(rows):
+    # rows: (date, trn_ref, amount, response_code) as extracted from Transactions
+    df = pd.DataFrame(rows, columns=['DATE_TIME', 'TRN_REF', 'AMOUNT', 'RESPONSE_CODE'])
+    df['DATE_TIME'] = pd.to_datetime(df['DATE_TIME'])
+    df['BATCH'] = '1'
+    df['TXN_TYPE'] = 'CWD'
+    df['ISSUER_CODE'] = '130447'
+    df['ACQUIRER_CODE'] = '730147'
+    df = backup_refs(df, 'TRN_REF')
+    return pre_processing(df)
+
+
+class FuzzyMatchTests(SimpleTestCase):
+
+    def test_exact_matches_are_left_alone(self):
+        uploaded = make_uploaded_df([('2023-11-01', 'CWD', 5000, 'REF000000001')])
+        db = make_db_df([('2023-11-01', 'REF000000001', 5000, '00')])
+        merged_df, _, _, _ = process_reconciliation(uploaded, db)
+
+        candidates = fuzzy_match_unmatched(merged_df)
+
+        self.assertTrue(candidates.empty)
+
+    def test_date_off_by_one_day_is_a_candidate(self):
+        uploaded = make_uploaded_df([('2023-11-01', 'CWD', 5000, 'REF000000001')])
+        db = make_db_df([('2023-11-02', 'REF000000001', 5000, '00')])
+        merged_df, _, _, _ = process_reconciliation(uploaded, db)
+
+        candidates = fuzzy_match_unmatched(merged_df, date_tolerance_days=1)
+
+        self.assertEqual(len(candidates), 1)
+        row = candidates.iloc[0]
+        self.assertEqual(row['REF_MATCH'], 'exact')
+        self.assertEqual(row['DATE_DIFF_DAYS'], 1)
+        self.assertAlmostEqual(row['CONFIDENCE'], 0.85)
+
+    def test_outside_tolerances_is_not_a_candidate(self):
+        uploaded = make_uploaded_df([('2023-11-01', 'CWD', 5000, 'REF000000001')])
+        db = make_db_df([('2023-11-04', 'REF000000001', 5000, '00'), ('2023-11-01', 'REF00000001X', 5100, '00')])
+        merged_df, _, _, _ = process_reconciliation(uploaded, db)
+
+        self.assertTrue(fuzzy_match_unmatched(merged_df, date_tolerance_days=1).empty)
+        self.assertEqual(len(fuzzy_match_unmatched(merged_df, date_tolerance_days=3)), 1)
+
+    def test_truncated_reference_matches_on_prefix(self):
+        # The bank sent a shorter reference, pad_strings_with_zeros pads it while the DB one is truncated
+        uploaded = make_uploaded_df([('2023-11-01', 'CWD', 5000, '12345678901')])
+        db = make_db_df([('2023-11-01', '1234567890123', 5000, '00')])
+        merged_df, _, _, _ = process_reconciliation(uploaded, db)
+
+        candidates = fuzzy_match_unmatched(merged_df)
+
+        self.assertEqual(len(candidates), 1)
+        self.assertEqual(candidates.iloc[0]['REF_MATCH'], 'prefix')
+        self.assertEqual(candidates.iloc[0]['BANK_REFERENCE'], '12345678901')
+        self.assertEqual(candidates.iloc[0]['ABC_REFERENCE'], '1234567890123')
+
+    def test_neighbouring_references_keep_their_exact_matches(self):
+        # Sequential references a day off on both rows: the same-day neighbour is not a prefix match
+        uploaded = make_uploaded_df([('2024-01-02', 'CWD', 100, '123456789012'), ('2024-01-03', 'CWD', 100, '123456789013')])
+        db = make_db_df([('2024-01-02', '123456789013', 100, '00'), ('2024-01-01', '123456789012', 100, '00')])
+        merged_df, _, _, _ = process_reconciliation(uploaded, db)
+
+        candidates = fuzzy_match_unmatched(merged_df, date_tolerance_days=1)
+
+        self.assertEqual(sorted(zip(candidates['BANK_REFERENCE'], candidates['ABC_REFERENCE'])),
+                         [('123456789012', '123456789012'), ('123456789013', '123456789013')])
+        self.assertEqual(candidates['REF_MATCH'].tolist(), ['exact', 'exact'])
+
+    def test_exact_reference_scores_above_prefix(self):
+        uploaded = make_uploaded_df([('2023-11-01', 'CWD', 5000, '12345678901')])
+        db = make_db_df([('2023-11-01', '1234567890123', 5000, '00')])
+        merged_df, _, _, _ = process_reconciliation(uploaded, db)
+
+        # A truncated reference on the same day, amount and all, stays below an exact one a day off
+        self.assertLessEqual(fuzzy_match_unmatched(merged_df).iloc[0]['CONFIDENCE'], 0.5)
+
+    def test_taken_rows_fall_back_to_next_best(self):
+        # The truncated bank reference 12345678901 prefixes both ABC rows; ...012 goes to the exact match
+        uploaded = make_uploaded_df([('2023-11-02', 'CWD', 100, '123456789012'), ('2023-11-01', 'CWD', 100, '12345678901')])
+        db = make_db_df([('2023-11-01', '123456789012', 100, '00'), ('2023-11-01', '123456789015', 100, '00')])
+        merged_df, _, _, _ = process_reconciliation(uploaded, db)
+
+        candidates = fuzzy_match_unmatched(merged_df, date_tolerance_days=1)
+
+        self.assertEqual(sorted(zip(candidates['BANK_REFERENCE'], candidates['ABC_REFERENCE'])),
+                         [('12345678901', '123456789015'), ('123456789012', '123456789012')])
+
+    def test_missing_references_are_not_joined(self):
+        # Both become '000000000000', a day apart with the same amount they would pair up on an empty key
+        uploaded = make_uploaded_df([('2023-11-01', 'CWD', 5000, ''), ('2023-11-01', 'CWD', 700, 'REF000000001')])
+        db = make_db_df([('2023-11-02', '', 5000, '00'), ('2023-11-02', 'REF000000001', 700, '00')])
+        merged_df, _, _, _ = process_reconciliation(uploaded, db)
+        self.assertEqual((merged_df['TRN_REF'] == '000000000000').sum(), 2)
+
+        candidates = fuzzy_match_unmatched(merged_df)
+
+        self.assertEqual(candidates['BANK_REFERENCE'].tolist(), ['REF000000001'])
+
+    def test_each_row_is_used_once(self):
+        uploaded = make_uploaded_df([
+            ('2023-11-01', 'CWD', 5000, 'REF000000001'),
+            ('2023-11-03', 'CWD', 5000, 'REF00000000X'),
+        ])
+        db = make_db_df([('2023-11-02', 'REF000000001', 5000, '00')])
+        merged_df, _, _, _ = process_reconciliation(uploaded, db)
+
+        candidates = fuzzy_match_unmatched(merged_df, date_tolerance_days=1)
+
+        self.assertEqual(len(candidates), 1)
+        self.assertEqual(candidates.iloc[0]['BANK_REFERENCE'], 'REF000000001')
+
+
+def fake_reconcile_main(path, bank_code, user, stats=None, progress=None):
+    # Stands in for reconcileMain: records a run with its merged artifact and returns a small result
+    recon_log = ReconLog.objects.create(bank_id=bank_code, user_id=user, feedback="Updated: 0, Inserted: 1",
+                                        rq_date_range="2023-11-01,2023-11-01")
+    if stats is not None:
+        stats['recon_log'] = recon_log.id
+    uploaded = make_uploaded_df([
+        ('2023-11-01', 'CWD', 5000, 'REF000000001'),
+        ('2023-11-01', 'CWD', 100, 'REF000000002'),
+        ('2023-11-01', 'CWD', 700, 'REF000000003'),
+    ])
+    db = make_db_df([('2023-11-01', 'REF000000001', 5000, '00'), ('2023-11-01', 'REF000000003', 700, '05')])
+    merged_df, reconciled, succunreconciled, _ = process_reconciliation(uploaded, db)
+    save_merged_artifact(recon_log, merged_df)
+    reconciled = project(reconciled, RECONCILED_COLUMNS, dates=['DATE_TIME'])
+    succunreconciled = project(succunreconciled, SUCCUNRECONCILED_COLUMNS)
+    exceptions = reconciled[reconciled['RESPONSE_CODE'] != '00']
+    return merged_df, reconciled, succunreconciled, exceptions, recon_log.feedback, 2, 3, "2023-11-01,2023-11-01"
+
+
+class ReconcileViewTestCase(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="teller", password="secret")
+        self.bank = Bank.objects.create(name="Test Bank", swift_code="TESTUGKA", bank_code="130447")
+        UserBankMapping.objects.create(user=self.user, bank=self.bank)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        artifacts_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(artifacts_dir.cleanup)
+        settings_override = override_settings(RECON_ARTIFACTS_DIR=artifacts_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def post(self, content=b"statement bytes", headers=None, **extra):
+        upload = SimpleUploadedFile("statement.xlsx", content)
+        return self.client.post('/recon/reconcile/', {'file': upload, **extra}, format='multipart', **(headers or {}))
+
+
+class UploadDeduplicationTests(ReconcileViewTestCase):
+
+    def test_digest_depends_on_bank(self):
+        self.assertNotEqual(upload_digest([b"abc"], "130447", 0), upload_digest([b"abc"], "730147", 0))
+        self.assertNotEqual(upload_digest([b"abc"], "130447", 0), upload_digest([b"abc"], "130447", 1))
+        self.assertEqual(upload_digest([b"a", b"bc"], "130447", 0), upload_digest([b"abc"], "130447", 0))
+
+    @mock.patch('recon.index.reconcileMain', side_effect=fake_reconcile_main)
+    def test_identical_upload_returns_stored_outcome(self, reconcile_main):
+        first = self.post()
+        second = self.post()
+
+        self.assertEqual(reconcile_main.call_count, 1)
+        self.assertFalse(first.data['duplicate'])
+        self.assertTrue(second.data['duplicate'])
+        self.assertEqual(second.data['recon_log'], first.data['recon_log'])
+        self.assertEqual(json.loads(second.content)['reconciled_data'], json.loads(first.content)['reconciled_data'])
+        self.assertEqual(json.loads(second.content)['succunreconciled_data'], json.loads(first.content)['succunreconciled_data'])
+        self.assertEqual(second.data['reconciledRows'], 2)
+        self.assertEqual(ReconUpload.objects.count(), 1)
+        # Only the summary is stored, the rows come from the merged artifact
+        self.assertNotIn('reconciled_data', json.loads(ReconUpload.objects.get().result))
+
+    @mock.patch('recon.index.reconcileMain', side_effect=fake_reconcile_main)
+    def test_deleted_run_is_reconciled_again(self, reconcile_main):
+        first = self.post()
+        ReconLog.objects.filter(id=first.data['recon_log']).delete()
+        second = self.post()
+
+        self.assertEqual(reconcile_main.call_count, 2)
+        self.assertFalse(second.data['duplicate'])
+        self.assertEqual(ReconUpload.objects.get().recon_log_id, second.data['recon_log'])
+
+    @mock.patch('recon.index.reconcileMain', side_effect=fake_reconcile_main)
+    def test_rules_change_is_reconciled_again(self, reconcile_main):
+        self.addCleanup(invalidate_rules)
+        self.post()
+        invalidate_rules()
+        second = self.post()
+
+        self.assertEqual(reconcile_main.call_count, 2)
+        self.assertFalse(second.data['duplicate'])
+
+    @mock.patch('recon.index.reconcileMain', side_effect=fake_reconcile_main)
+    def test_run_with_an_open_day_is_reconciled_again(self, reconcile_main):
+        first = self.post()
+        # The statement ended on the day the run was made, that day's Transactions were still arriving
+        run_day = timezone.localtime(ReconLog.objects.get(id=first.data['recon_log']).date_time).date()
+        ReconLog.objects.filter(id=first.data['recon_log']).update(rq_date_range=f"2023-11-01,{run_day.isoformat()}")
+        second = self.post()
+
+        self.assertEqual(reconcile_main.call_count, 2)
+        self.assertFalse(second.data['duplicate'])
+
+    @mock.patch('recon.index.reconcileMain', side_effect=fake_reconcile_main)
+    def test_missing_artifact_is_reconciled_again(self, reconcile_main):
+        self.post()
+        os.remove(ReconArtifact.objects.get().path)
+        second = self.post()
+
+        self.assertEqual(reconcile_main.call_count, 2)
+        self.assertFalse(second.data['duplicate'])
+
+    @mock.patch('recon.index.reconcileMain', side_effect=fake_reconcile_main)
+    def test_force_reruns(self, reconcile_main):
+        first = self.post()
+        forced = self.post(force=True)
+
+        self.assertEqual(reconcile_main.call_count, 2)
+        self.assertFalse(forced.data['duplicate'])
+        self.assertNotEqual(forced.data['recon_log'], first.data['recon_log'])
+        self.assertEqual(ReconUpload.objects.get().recon_log_id, forced.data['recon_log'])
+
+    @mock.patch('recon.index.reconcileMain', side_effect=fake_reconcile_main)
+    def test_different_file_is_reconciled(self, reconcile_main):
+        self.post(b"monday")
+        self.post(b"tuesday")
+
+        self.assertEqual(reconcile_main.call_count, 2)
+
+
+def make_workbook(rows, sheet_name="Sheet1"):
+    wb = Workbook(write_only=True)
+    sheet = wb.create_sheet(sheet_name)
+    sheet.append(['Date', 'Transaction type', 'Amount', 'ABC Reference'])
+    for row in rows:
+        sheet.append(row)
+    content = io.BytesIO()
+    wb.save(content)
+    return content.getvalue()
+
+
+class WorkbookIngestTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_superuser(username="ops", password="secret")
+
+    def test_all_rows_are_ingested_in_batches(self):
+        rows = [(dt.datetime(2023, 11, 1, 8, 30), 'CWD', 5000, f'REF{i:09d}') for i in range(25)]
+
+        stats = ingest_recon_workbook(io.BytesIO(make_workbook(rows)), self.user, batch_size=10)
+
+        self.assertEqual(stats['rows_read'], 25)
+        self.assertEqual(stats['rows_inserted'], 25)
+        self.assertEqual(stats['batches'], 3)
+        self.assertEqual(Recon.objects.count(), 25)
+        self.assertEqual(Recon.objects.get(trn_ref='REF000000024').last_modified_by_user, self.user)
+
+    def test_invalid_and_duplicate_rows_are_skipped(self):
+        Recon.objects.create(trn_ref='REF000000001')
+        rows = [
+            (dt.datetime(2023, 11, 1), 'CWD', 5000, 'REF000000001'),  # already in Recon
+            (dt.datetime(2023, 11, 1), 'CWD', 5000, 'REF000000002'),
+            (dt.datetime(2023, 11, 1), 'CWD', 5000, 'REF000000002'),  # repeated in the file
+            ('not a date', 'CWD', 5000, 'REF000000003'),
+            (dt.datetime(2023, 11, 1), 'CWD', 'n/a', 'REF000000004'),
+            (dt.datetime(2023, 11, 1), 'CWD', 5000, None),
+        ]
+
+        stats = ingest_recon_workbook(io.BytesIO(make_workbook(rows)), self.user)
+
+        self.assertEqual(stats['rows_read'], 6)
+        self.assertEqual(stats['rows_inserted'], 1)
+        self.assertEqual(stats['rows_invalid'], 3)
+        self.assertEqual(stats['rows_skipped'], 2)
+
+    def test_upload_endpoint_reports_ingest_stats(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        rows = [(dt.datetime(2023, 11, 1), 'CWD', 100, f'REF{i:09d}') for i in range(12)]
+        upload = SimpleUploadedFile("statement.xlsx", make_workbook(rows))
+
+        with self.settings(MEDIA_ROOT=self.media_root()):
+            response = client.post('/recon/files/files/', {'file': upload}, format='multipart')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['ingest']['rows_inserted'], 12)
+        self.assertEqual(UploadedFile.objects.count(), 1)
+
+    def test_ingest_is_batched(self):
+        rows = [(dt.datetime(2023, 11, 1), 'CWD', 100, f'REF{i:09d}') for i in range(5000)]
+        content = make_workbook(rows)
+
+        with mock.patch.object(Recon.objects, 'bulk_create', wraps=Recon.objects.bulk_create) as bulk_create:
+            stats = ingest_recon_workbook(io.BytesIO(content), self.user, batch_size=1000)
+
+        # The rate depends on the machine, it is only reported
+        logger.info("Ingested %s rows in %ss (%s rows/s)", stats['rows_read'], stats['elapsed_seconds'], stats['rows_per_second'])
+        self.assertEqual(Recon.objects.count(), 5000)
+        self.assertEqual((stats['rows_read'], stats['rows_inserted']), (5000, 5000))
+        self.assertEqual(stats['batches'], 5)
+        self.assertEqual([len(call.args[0]) for call in bulk_create.call_args_list], [1000] * 5)
+
+    def media_root(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        return directory.name
+
+
+class DatabaseHealthTests(TestCase):
+
+    def test_health_endpoint(self):
+        response = APIClient().get('/recon/health/db/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'ok')
+        self.assertIn('latency_ms', response.data)
+
+    def test_unusable_connection_is_reported(self):
+        with mock.patch('django.db.backends.utils.CursorWrapper.execute', side_effect=DatabaseError("login failed for sa on db01")), \
+                self.assertLogs(level='ERROR') as logs:
+            response = APIClient().get('/recon/health/db/')
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.data, {'status': 'unavailable'})
+        self.assertIn('login failed', logs.output[0])
+
+
+class ReplicaRouterTests(SimpleTestCase):
+    aliases = ('recon_primary', 'recon_replica')
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Two local SQLite files standing in for the primary and the replica. They are
+        # registered after SimpleTestCase has wrapped the configured connections.
+        cls.directory = tempfile.TemporaryDirectory()
+        for alias in cls.aliases:
+            connections.settings[alias] = {
+                **connections['default'].settings_dict,
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': f"{cls.directory.name}/{alias}.sqlite3",
+                'OPTIONS': {},
+                'CONN_MAX_AGE': 0,
+            }
+            with connections[alias].schema_editor() as editor:
+                editor.create_model(ReconLog)
+                if alias == 'recon_primary':
+                    editor.create_model(User)
+                    editor.create_model(Recon)
+            create_transactions_table(alias)
+
+    @classmethod
+    def tearDownClass(cls):
+        for alias in cls.aliases:
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+        cls.directory.cleanup()
+        super().tearDownClass()
+
+    def setUp(self):
+        with connections['recon_replica'].cursor() as cursor:
+            cursor.execute('DELETE FROM "Transactions"')
+            cursor.execute('INSERT INTO "Transactions" ("TXN_ID", "TRN_REF") VALUES (%s, %s)', ['1', 'REF000000001'])
+        self.router = ReplicaRouter(primary='recon_primary', replica='recon_replica')
+
+    def test_transactions_reads_use_the_replica(self):
+        with self.settings(DATABASE_ROUTERS=[self.router]):
+            self.assertEqual(list(Transactions.objects.values_list('trn_ref', flat=True)), ['REF000000001'])
+            self.assertEqual(Transactions.objects.using('recon_primary').count(), 0)
+
+    def test_reconlog_reads_stay_on_primary(self):
+        # A run is looked up, and the stats list refilled, right after it is written
+        with self.settings(DATABASE_ROUTERS=[self.router]):
+            self.assertEqual(ReconLog.objects.all().db, 'recon_primary')
+
+    def test_recon_reads_and_writes_stay_on_primary(self):
+        with self.settings(DATABASE_ROUTERS=[self.router]):
+            Recon.objects.create(trn_ref='REF000000001')
+
+            self.assertEqual(Recon.objects.all().db, 'recon_primary')
+            self.assertEqual(Recon.objects.get().trn_ref, 'REF000000001')
+            self.assertEqual(Recon.objects.using('recon_primary').count(), 1)
+        Recon.objects.using('recon_primary').all().delete()
+
+    def test_without_replica_everything_uses_primary(self):
+        router = ReplicaRouter(primary='recon_primary', replica='missing')
+        with self.settings(DATABASE_ROUTERS=[router]):
+            self.assertEqual(Transactions.objects.count(), 0)
+            self.assertEqual(ReconLog.objects.all().db, 'recon_primary')
+
+    def test_replica_is_never_migrated(self):
+        self.assertFalse(self.router.allow_migrate('recon_replica', 'recon'))
+        self.assertIsNone(self.router.allow_migrate('recon_primary', 'recon'))
+
+
+class StartupImportTests(SimpleTestCase):
+
+    def test_url_conf_does_not_load_the_processing_stack(self):
+        script = (
+            "import django, sys; django.setup(); import abc_recon.urls; "
+            "print(','.join(name for name in ('pandas', 'openpyxl', 'recon.index', 'recon.setlement_') if name in sys.modules))"
+        )
+        result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True,
+                                cwd=settings.BASE_DIR)
+
+        self.assertEqual(result.stdout.strip(), '')
+
+
+class ExtractPlannerTests(TestCase):
+
+    def setUp(self):
+        extract_cache.clear()
+        create_transactions_table()
+        rows = [
+            ('1', '2023-10-02 10:00:00', 'REF000000001'),  # the stray old row
+            ('2', '2023-10-15 10:00:00', 'REF000000002'),  # not uploaded
+            ('3', '2023-11-01 09:00:00', 'REF000000003'),
+            ('4', '2023-11-02 18:00:00', 'REF000000004'),
+            ('5', '2023-11-03 12:00:00', 'REF000000005'),  # not uploaded
+            ('6', '2023-11-04 08:00:00', 'REF000000006'),
+        ]
+        with connections['default'].cursor() as cursor:
+            for txn_id, date_time, trn_ref in rows:
+                cursor.execute(
+                    'INSERT INTO "Transactions" ("TXN_ID", "DATE_TIME", "TRN_REF", "ISSUER_CODE", "REQUEST_TYPE", "AMOUNT", "RESPONSE_CODE") '
+                    'VALUES (%s, %s, %s, %s, %s, %s, %s)',
+                    [txn_id, date_time, trn_ref, '130447', '1200', 5000, '00'],
+                )
+
+    def test_plan_date_runs(self):
+        days = [dt.date(2023, 11, 2), dt.date(2023, 10, 2), dt.date(2023, 11, 1), dt.date(2023, 11, 4), dt.date(2023, 11, 1)]
+
+        self.assertEqual(plan_date_runs(days), [
+            (dt.date(2023, 10, 2), dt.date(2023, 10, 2)),
+            (dt.date(2023, 11, 1), dt.date(2023, 11, 2)),
+            (dt.date(2023, 11, 4), dt.date(2023, 11, 4)),
+        ])
+        self.assertEqual(plan_date_runs(days, max_gap_days=1)[1:], [(dt.date(2023, 11, 1), dt.date(2023, 11, 4))])
+        self.assertEqual(plan_date_runs([]), [])
+
+    def test_only_uploaded_days_are_extracted(self):
+        stats = {}
+        days = [dt.date(2023, 10, 2), dt.date(2023, 11, 1), dt.date(2023, 11, 2), dt.date(2023, 11, 4)]
+
+        extract = fetch_extract('130447', days, stats=stats)
+
+        self.assertEqual(sorted(extract['trn_ref']), ['REF000000001', 'REF000000003', 'REF000000004', 'REF000000006'])
+        self.assertEqual(stats['extract']['planned_days'], 4)
+        self.assertEqual(stats['extract']['window_days'], 34)
+        self.assertEqual(stats['extract']['rows_scanned'], 4)
+        self.assertEqual([run['rows'] for run in stats['extract']['runs']], [1, 2, 1])
+
+    def test_iter_extract_streams_the_same_rows(self):
+        days = [dt.date(2023, 10, 2), dt.date(2023, 11, 1), dt.date(2023, 11, 2), dt.date(2023, 11, 4)]
+
+        extract_chunks = list(iter_extract('130447', days, chunk_rows=1))
+
+        self.assertEqual([len(chunk) for chunk in extract_chunks], [1, 1, 1, 1])
+        self.assertEqual(pd.concat(extract_chunks)['trn_ref'].tolist(), sorted(fetch_extract('130447', days)['trn_ref']))
+
+    def test_reconcile_large_command(self):
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        statement = os.path.join(workdir.name, 'statement.xlsx')
+        with open(statement, 'wb') as f:
+            f.write(make_workbook([
+                ('2023-11-01 09:00:00', 'CWD', 5000, 'REF000000003'),
+                ('2023-11-02 18:00:00', 'CWD', 4000, 'REF000000004'),
+                ('2023-11-04 10:00:00', 'CWD', 100, 'REF000000009'),
+            ]))
+        output = os.path.join(workdir.name, 'result')
+
+        call_command('reconcile_large', statement, bank='130447', output=output, chunk_rows=2, stdout=io.StringIO())
+
+        result = read_partitions(output)
+        self.assertEqual(sorted(zip(result['TRN_REF'], result['_merge'])), [
+            ('REF000000003', 'both'), ('REF000000004', 'ABC_only'), ('REF000000004', 'Bank_only'),
+            ('REF000000006', 'ABC_only'), ('REF000000009', 'Bank_only'),
+        ])
+
+    def test_reconcile_main_overlaps_upload_cleaning(self):
+        user = User.objects.create_user(username="teller", password="secret")
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        statement = os.path.join(workdir.name, 'statement.xlsx')
+        with open(statement, 'wb') as f:
+            f.write(make_workbook([
+                (dt.datetime(2023, 11, 1, 9), 'CWD', 5000, 'REF000000003'),
+                (dt.datetime(2023, 11, 2, 18), 'CWD', 5000, 'REF000000004'),
+                (dt.datetime(2023, 11, 4, 10), 'CWD', 100, 'REF000000009'),
+            ]))
+
+        results = {}
+        for overlap in (True, False):
+            stats = {}
+            with self.settings(RECON_OVERLAP_UPLOAD=overlap, RECON_ARTIFACTS_DIR=workdir.name):
+                result = reconcileMain(statement, '130447', user, stats=stats)
+            results[overlap] = result[1]
+            self.assertIsNotNone(stats['recon_log'])
+            self.assertTrue({'read_upload', 'clean_upload', 'extract', 'clean_extract', 'extract_and_clean',
+                             'overlap_saved', 'reconcile', 'write'} <= set(stats['stages']))
+            self.assertGreaterEqual(stats['stages']['overlap_saved'], 0)
+
+        pd.testing.assert_frame_equal(results[True], results[False])
+        self.assertEqual(sorted(results[True]['ABC REFERENCE']), ['REF000000003', 'REF000000004'])
+
+    def reconcile_statement(self, rows, **kwargs):
+        user, _ = User.objects.get_or_create(username="teller")
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        statement = os.path.join(workdir.name, 'statement.xlsx')
+        with open(statement, 'wb') as f:
+            f.write(make_workbook(rows))
+        stats = {}
+        with self.settings(RECON_ARTIFACTS_DIR=workdir.name):
+            result = reconcileMain(statement, '130447', user, stats=stats, **kwargs)
+        return result, stats
+
+    def test_reconcile_main_reports_progress(self):
+        progress = ProgressReporter(str(uuid.uuid4()), user_id=1)
+        rows = [(dt.datetime(2023, 11, 1, 9), 'CWD', 5000, 'REF000000003'), (dt.datetime(2023, 11, 4, 8), 'CWD', 5000, 'REF000000006')]
+
+        (_, reconciled, *_), stats = self.reconcile_statement(rows, progress=progress)
+
+        state = get_progress(progress.progress_id)
+        self.assertTrue(state['done'])
+        self.assertEqual([event['stage'] for event in state['events']], ['parsed', 'extracted', 'matched', 'upserted', 'done'])
+        events = {event['stage']: event for event in state['events']}
+        self.assertEqual(events['parsed']['rows'], 2)
+        self.assertEqual(events['matched']['reconciled'], len(reconciled))
+        self.assertEqual((events['upserted']['done'], events['upserted']['total']), (len(reconciled), len(reconciled)))
+        self.assertEqual(events['done']['recon_log'], stats['recon_log'])
+
+    def test_closed_days_are_served_from_the_extract_cache(self):
+        rows = [(dt.datetime(2023, 11, 1, 9), 'CWD', 5000, 'REF000000003'), (dt.datetime(2023, 11, 4, 8), 'CWD', 5000, 'REF000000006')]
+        first, first_stats = self.reconcile_statement(rows)
+        with connections['default'].cursor() as cursor:
+            cursor.execute('DELETE FROM "Transactions"')
+
+        second, second_stats = self.reconcile_statement(rows)
+
+        self.assertEqual(first_stats['extract']['cached_days'], 0)
+        self.assertEqual(second_stats['extract']['cached_days'], 2)
+        self.assertEqual(second_stats['extract']['runs'], [])
+        self.assertEqual(second_stats['extract']['cache']['hits'], 2)
+        pd.testing.assert_frame_equal(second[0], first[0])
+        self.assertEqual(second[5], first[5])
+
+    def test_open_days_bypass_the_extract_cache(self):
+        now = timezone.localtime().replace(hour=12, minute=0, second=0, microsecond=0)
+        with connections['default'].cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO "Transactions" ("TXN_ID", "DATE_TIME", "TRN_REF", "ISSUER_CODE", "REQUEST_TYPE", "AMOUNT", "RESPONSE_CODE") '
+                'VALUES (%s, %s, %s, %s, %s, %s, %s)',
+                ['7', now.astimezone(dt.timezone.utc).strftime('%Y-%m-%d %H:%M:%S'), 'REF000000007', '130447', '1200', 300, '00'],
+            )
+        rows = [(now.replace(tzinfo=None), 'CWD', 300, 'REF000000007')]
+
+        self.reconcile_statement(rows)
+        _, stats = self.reconcile_statement(rows)
+
+        self.assertEqual(stats['extract']['cached_days'], 0)
+        self.assertEqual(stats['extract']['rows_scanned'], 1)
+        self.assertEqual(stats['extract']['cache']['entries'], 0)
+
+    def test_other_banks_rows_are_not_extracted(self):
+        extract = fetch_extract('730147', [dt.date(2023, 11, 1)])
+
+        self.assertTrue(extract.empty)
+        self.assertEqual(list(extract.columns), ['date_time', 'batch', 'trn_ref', 'txn_type', 'issuer_code', 'acquirer_code', 'amount', 'response_code'])
+
+
+class FrameLRUTests(SimpleTestCase):
+
+    def test_evicts_least_recently_used_by_bytes(self):
+        lru = FrameLRU(max_bytes=100)
+        lru.put('a', 'A', 40)
+        lru.put('b', 'B', 40)
+        self.assertEqual(lru.get('a'), 'A')
+
+        lru.put('c', 'C', 40)
+
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual((lru.get('a'), lru.get('c')), ('A', 'C'))
+        self.assertFalse(lru.put('d', 'D', 101))
+        self.assertEqual(lru.stats(), {
+            'entries': 2, 'bytes': 80, 'max_bytes': 100, 'hits': 3, 'misses': 1, 'evictions': 1, 'hit_rate': 0.75,
+        })
+
+    @override_settings(RECON_EXTRACT_CACHE_MB=0)
+    def test_disabled_by_setting(self):
+        lru = FrameLRU()
+
+        self.assertFalse(lru.put('a', 'A', 1))
+        self.assertIsNone(lru.get('a'))
+
+
+@mock.patch('recon.index.reconcileMain', side_effect=fake_reconcile_main)
+class ColumnarResponseTests(ReconcileViewTestCase):
+
+    def test_arrow_stream(self, reconcile_main):
+        response = self.post(headers={'HTTP_ACCEPT': 'application/vnd.apache.arrow.stream'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/vnd.apache.arrow.stream')
+        table = pa.ipc.open_stream(response.content).read_all()
+        self.assertEqual(table.column('FRAME').to_pylist(), ['reconciled', 'reconciled', 'succunreconciled', 'exceptions'])
+        self.assertEqual(table.column('ABC REFERENCE').to_pylist()[:2], ['REF000000001', 'REF000000003'])
+        self.assertEqual(table.schema.field('DATE_TIME').type, pa.timestamp('ns'))
+        metadata = json.loads(table.schema.metadata[b'recon'])
+        self.assertEqual(metadata['reconciledRows'], 2)
+        self.assertIsNotNone(metadata['recon_log'])
+
+    def test_parquet_via_format_parameter(self, reconcile_main):
+        upload = SimpleUploadedFile("statement.xlsx", b"statement bytes")
+        response = self.client.post('/recon/reconcile/?format=parquet', {'file': upload}, format='multipart')
+
+        self.assertEqual(response['Content-Type'], 'application/vnd.apache.parquet')
+        frame = pq.read_table(io.BytesIO(response.content)).to_pandas()
+        self.assertEqual(frame.groupby('FRAME').size().to_dict(), {'exceptions': 1, 'reconciled': 2, 'succunreconciled': 1})
+
+    def test_binary_request_is_not_served_from_the_json_store(self, reconcile_main):
+        self.post()
+        self.post(headers={'HTTP_ACCEPT': 'application/vnd.apache.arrow.stream'})
+
+        self.assertEqual(reconcile_main.call_count, 2)
+
+    def test_json_is_unchanged(self, reconcile_main):
+        response = self.post(headers={'HTTP_ACCEPT': 'application/json'})
+
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(response.data['reconciledRows'], 2)
+        self.assertEqual(json.loads(response.content)['reconciled_data'][0]['ABC REFERENCE'], 'REF000000001')
+
+    def test_validation_errors_fall_back_to_json(self, reconcile_main):
+        response = self.client.post('/recon/reconcile/', {}, format='multipart',
+                                    HTTP_ACCEPT='application/vnd.apache.arrow.stream')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertIn('file', json.loads(response.content))
+
+
+def read_zip(chunks):
+    return zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+
+
+class StreamingZipTests(SimpleTestCase):
+
+    def setUp(self):
+        self.frames = [
+            ('first.csv', pd.DataFrame({'REF': [f'REF{i:09d}' for i in range(250)], 'AMOUNT': range(250)})),
+            ('empty.csv', pd.DataFrame(columns=['REF', 'AMOUNT'])),
+            ('second.csv', pd.DataFrame({'REF': ['A', 'B'], 'AMOUNT': [1.5, 2.5]})),
+        ]
+
+    def test_members_match_to_csv(self):
+        chunks = list(stream_zip_csv(self.frames, chunk_rows=40, workers=3))
+
+        archive = read_zip(chunks)
+        self.assertEqual(archive.namelist(), ['first.csv', 'empty.csv', 'second.csv'])
+        for name, df in self.frames:
+            self.assertEqual(archive.read(name).decode(), df.to_csv(index=False))
+        self.assertIsNone(archive.testzip())
+
+    def test_archive_is_sent_in_pieces(self):
+        frame = pd.DataFrame({'REF': [f'REF{i:09d}' for i in range(50000)], 'NOTE': [str(i * 7919) for i in range(50000)]})
+        chunks = list(stream_zip_csv([('large.csv', frame)], chunk_rows=5000))
+
+        self.assertGreater(len(chunks), 2)
+        self.assertTrue(all(chunks))
+        self.assertEqual(read_zip(chunks).read('large.csv').decode(), frame.to_csv(index=False))
+
+    def test_members_are_zip64(self):
+        archive = read_zip(stream_zip_csv(self.frames, chunk_rows=40))
+
+        self.assertTrue(all(info.extract_version >= zipfile.ZIP64_VERSION for info in archive.infolist()))
+        self.assertEqual(archive.read('second.csv').decode(), self.frames[2][1].to_csv(index=False))
+
+    def test_failed_chunk_aborts_the_stream(self):
+        chunks = []
+        with mock.patch('recon.exports._render_csv_chunk', side_effect=[b"REF,AMOUNT\n", RuntimeError("disk full")]), \
+                self.assertLogs(level='ERROR') as logs, self.assertRaises(RuntimeError):
+            for chunk in stream_zip_csv(self.frames, chunk_rows=200, workers=1):
+                chunks.append(chunk)
+
+        self.assertIn('first.csv', logs.output[0])
+        with self.assertRaises(zipfile.BadZipFile):
+            read_zip(chunks)
+
+
+@mock.patch('recon.setlement_.setleSabs')
+class SettlementExportTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="settler", password="secret")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_sabs_export_streams_all_frames(self, setle_sabs):
+        unmatched = pd.DataFrame({
+            'TRN_REF2': ['S1', 'D1', 'D2'],
+            '_merge': pd.Categorical(['left_only', 'right_only', 'right_only']),
+        })
+        matched = pd.DataFrame({'TRN_REF2': ['M1']})
+        setle_sabs.return_value = (None, matched, unmatched, unmatched.iloc[:1])
+
+        upload = SimpleUploadedFile("sabs.xlsx", b"sabs bytes")
+        response = self.client.post('/recon/sabsreconcile_csv_file/', {'file': upload, 'batch_number': '42'},
+                                    format='multipart')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        archive = read_zip(response.streaming_content)
+        self.assertEqual(archive.namelist(),
+                         ['matched_setle.csv', 'unmatched_setlesabs.csv', 'unmatched_sabs.csv', 'unmatched_db.csv'])
+        self.assertEqual(pd.read_csv(archive.open('unmatched_sabs.csv'))['TRN_REF2'].tolist(), ['S1'])
+        self.assertEqual(pd.read_csv(archive.open('unmatched_db.csv'))['TRN_REF2'].tolist(), ['D1', 'D2'])
+
+    def test_settlement_export(self, setle_sabs):
+        result = pd.DataFrame({'BANK': ['130447'], 'AMOUNT': [100]})
+        with mock.patch('recon.setlement_.settle', return_value=result):
+            response = self.client.post('/recon/settlementcsv_files/', {'batch_number': '42'}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        archive = read_zip(response.streaming_content)
+        self.assertEqual(archive.read('settlement_result.csv').decode(), result.to_csv(index=False))
+
+
+class SettlementSabsTests(TestCase):
+    # The real setleSabs on a small workbook, against Transactions rows of batch 42
+
+    def setUp(self):
+        create_transactions_table()
+        self.addCleanup(invalidate_rules)
+        invalidate_rules()
+        columns = ['TXN_ID', 'TRN_REF', 'DATE_TIME', 'BATCH', 'TXN_TYPE', 'AMOUNT', 'FEE', 'ABC_COMMISSION',
+                   'ISSUER_CODE', 'REQUEST_TYPE', 'RESPONSE_CODE']
+        rows = [
+            ['1', 'REF000000001', '2023-11-01 10:00:00', '42', 'ACI', 5000, 100, 50, '730147', '1200', '00'],
+            ['2', 'REF000000002', '2023-11-01 11:00:00', '42', 'ACI', 700, 10, 5, '730147', '1200', '00'],
+            ['3', 'REF000000004', '2023-11-01 12:00:00', '42', 'AGENTFLOATINQ', 900, 10, 5, '730147', '1200', '00'],
+        ]
+        placeholders = ", ".join(["%s"] * len(columns))
+        with connections['default'].cursor() as cursor:
+            cursor.executemany(f'INSERT INTO "Transactions" ({", ".join(columns)}) VALUES ({placeholders})', rows)
+
+        self.user = User.objects.create_user(username="settler", password="secret")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def workbook(self):
+        wb = Workbook(write_only=True)
+        sheet = wb.create_sheet('Transaction Report')
+        # Read: reference, date, batch, then type, amount, fee and commission in columns 7, 8, 9 and 11
+        sheet.append(['Reference', 'Date', 'Batch', 'C3', 'C4', 'C5', 'C6', 'Type', 'Amount', 'Fee', 'C10', 'Commission'])
+        for ref, amount in [('REF000000001', 5000), ('REF000000002', 650), ('REF000000003', 300)]:
+            sheet.append([ref, '2023-11-01', '42', '', '', '', '', 'ACI', amount, 10, '', 5])
+        content = io.BytesIO()
+        wb.save(content)
+        return content.getvalue()
+
+    def test_sabs_export_splits_unmatched_by_side(self):
+        upload = SimpleUploadedFile("sabs.xlsx", self.workbook())
+        response = self.client.post('/recon/sabsreconcile_csv_file/', {'file': upload, 'batch_number': '42'},
+                                    format='multipart')
+
+        self.assertEqual(response.status_code, 200)
+        archive = read_zip(response.streaming_content)
+
+        def refs(name):
+            return pd.read_csv(archive.open(name), dtype=str)['TRN_REF'].tolist()
+
+        self.assertEqual(refs('matched_setle.csv'), ['REF000000001', 'REF000000002'])
+        self.assertEqual(refs('unmatched_sabs.csv'), ['REF000000003'])
+        self.assertEqual(refs('unmatched_db.csv'), ['REF000000004'])
+        self.assertIn('REF000000002', refs('unmatched_setlesabs.csv'))
+
+
+class ResponseCacheTests(ReconcileViewTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        Recon.objects.create(trn_ref="REF000000001", amount=100, issuer_code="130447", acquirer_code="200000", excep_flag="Y")
+
+    def test_repeated_polls_are_served_from_cache(self):
+        first = self.client.get('/recon/exceptions/')
+        Recon.objects.create(trn_ref="REF000000002", amount=50, issuer_code="130447", excep_flag="Y")
+        with self.assertNumQueries(2):
+            # Only the user to bank lookup
+            second = self.client.get('/recon/exceptions/')
+
+        self.assertEqual(len(first.data), 1)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_unchanged_poll_is_not_modified(self):
+        first = self.client.get('/recon/exceptions/')
+        second = self.client.get('/recon/exceptions/', HTTP_IF_NONE_MATCH=first['ETag'])
+
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.content, b'')
+        self.assertIn('no-cache', second['Cache-Control'])
+
+    def test_update_reconciliation_invalidates_both_banks(self):
+        first = self.client.get('/recon/exceptions/')
+        df = pd.DataFrame({
+            'DATE_TIME': ['2023-11-01 12:00:00'], 'BATCH': ['1'], 'AMOUNT': [75], 'ABC REFERENCE': ['REF000000009'],
+            # Reconciled by the acquirer, listed for the issuer as well
+            'ISSUER_CODE': ['130447'], 'ACQUIRER_CODE': ['200000'], 'RESPONSE_CODE': ['05'],
+        })
+        with self.captureOnCommitCallbacks(execute=True):
+            update_reconciliation(df, '200000')
+
+        second = self.client.get('/recon/exceptions/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(len(second.data), 2)
+        self.assertNotEqual(second['ETag'], first['ETag'])
+
+    def test_insert_recon_stats_invalidates_stats(self):
+        self.assertEqual(self.client.get('/recon/reconstats/').data, [])
+        with self.captureOnCommitCallbacks(execute=True):
+            insert_recon_stats('130447', self.user, 1, 0, 0, "Updated: 1, Inserted: 0", 1, 1, "2023-11-01")
+
+        self.assertEqual(len(self.client.get('/recon/reconstats/').data), 1)
+
+    def test_other_banks_are_cached_separately(self):
+        other = User.objects.create_user(username="other", password="secret")
+        UserBankMapping.objects.create(user=other, bank=Bank.objects.create(name="Other", swift_code="OTHRUGKA", bank_code="300000"))
+        self.client.get('/recon/exceptions/')
+        self.client.force_authenticate(other)
+
+        self.assertEqual(self.client.get('/recon/exceptions/').data, [])
+
+
+class JSONResponseTests(ReconcileViewTestCase):
+
+    def test_frames_render_as_records(self):
+        df = pd.DataFrame({
+            'DATE_TIME': pd.to_datetime(['2023-11-01', None, '2023-11-02 10:30:00.250'], format='ISO8601'),
+            'AMOUNT': [5000.0, np.nan, np.inf],
+            'COUNT': np.array([1, 2, 3], dtype=np.int64),
+            'MERGE': pd.Categorical(['both', 'left_only', 'both']),
+        })
+
+        records = json.loads(dumps({'rows': df, 'total': np.int64(3)}))
+
+        self.assertEqual(records['total'], 3)
+        self.assertEqual(records['rows'], [
+            {'DATE_TIME': '2023-11-01T00:00:00', 'AMOUNT': 5000.0, 'COUNT': 1, 'MERGE': 'both'},
+            {'DATE_TIME': None, 'AMOUNT': None, 'COUNT': 2, 'MERGE': 'left_only'},
+            {'DATE_TIME': '2023-11-02T10:30:00.250000', 'AMOUNT': None, 'COUNT': 3, 'MERGE': 'both'},
+        ])
+
+    def test_same_output_as_json_renderer(self):
+        data = {
+            'rows': [{'DATE_TIME': pd.Timestamp('2023-11-01'), 'AMOUNT': '5000'}],
+            'when': dt.datetime(2023, 11, 1, 12, 0, 0, 123456, tzinfo=dt.timezone.utc),
+            'id': uuid.UUID(int=1), 'day': dt.date(2023, 11, 1), 'ratio': 0.5, 'name': 'Kampala',
+        }
+        self.assertEqual(dumps(data), JSONRenderer().render(data))
+        df = pd.DataFrame({'DATE_TIME': pd.to_datetime(['2023-11-01', '2023-11-02 10:30:00.250'], format='ISO8601'), 'REF': ['A', 'B']})
+        self.assertEqual(dumps(df), JSONRenderer().render(df.to_dict(orient='records')))
+
+    @override_settings(RECON_COMPRESS_MIN_BYTES=1)
+    @mock.patch('recon.index.reconcileMain', side_effect=fake_reconcile_main)
+    def test_large_response_is_compressed(self, reconcile_main):
+        plain = self.post(headers={'HTTP_ACCEPT': 'application/json'})
+        for encoding, wbits in [('gzip', 31), ('deflate', 15)]:
+            response = self.post(force=True, headers={'HTTP_ACCEPT': 'application/json', 'HTTP_ACCEPT_ENCODING': f'br;q=1, {encoding}'})
+
+            self.assertEqual(response['Content-Encoding'], encoding)
+            self.assertEqual(int(response['Content-Length']), len(response.content))
+            body = json.loads(zlib.decompress(response.content, wbits))
+            self.assertEqual(body['reconciled_data'], json.loads(plain.content)['reconciled_data'])
+
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', plain['Vary'])
+
+    def test_small_and_refused_responses_are_not_compressed(self):
+        self.assertFalse(self.client.get('/recon/exceptions/', HTTP_ACCEPT_ENCODING='gzip').has_header('Content-Encoding'))
+        with override_settings(RECON_COMPRESS_MIN_BYTES=1):
+            self.assertTrue(self.client.get('/recon/exceptions/', HTTP_ACCEPT_ENCODING='gzip').has_header('Content-Encoding'))
+            self.assertFalse(self.client.get('/recon/exceptions/', HTTP_ACCEPT_ENCODING='gzip;q=0, identity').has_header('Content-Encoding'))
+
+    @override_settings(RECON_COMPRESS_MIN_BYTES=1)
+    def test_compressed_etag_still_matches(self):
+        cache.clear()
+        Recon.objects.create(trn_ref="REF000000001", amount=100, issuer_code="130447", acquirer_code="200000", excep_flag="Y")
+        first = self.client.get('/recon/exceptions/', HTTP_ACCEPT_ENCODING='gzip')
+        second = self.client.get('/recon/exceptions/', HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=first['ETag'])
+
+        self.assertTrue(first['ETag'].startswith('W/'))
+        self.assertEqual(second.status_code, 304)
+
+    def test_streams_are_compressed_as_sent(self):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')
+        rows = [f"REF{i:09d},{i}\n".encode() for i in range(1000)]
+        response = CompressionMiddleware(lambda request: StreamingHttpResponse(iter(rows), content_type='text/csv'))(request)
+
+        chunks = list(response.streaming_content)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(zlib.decompress(b"".join(chunks), 31), b"".join(rows))
+
+        events = CompressionMiddleware(lambda request: StreamingHttpResponse(iter(rows), content_type='text/event-stream'))(request)
+        self.assertFalse(events.has_header('Content-Encoding'))
+
+
+class RunArtifactTests(ReconcileViewTestCase):
+
+    def setUp(self):
+        super().setUp()
+        uploaded = make_uploaded_df([
+            ('2023-11-01', 'CWD', 5000, 'REF000000001'),
+            ('2023-11-01', 'CWD', 700, 'REF-00000-0002'),
+            ('2023-11-01', 'CWD', 300, 'REF000000004'),
+        ])
+        db = make_db_df([
+            ('2023-11-01', 'REF000000001', 5000, '00'),
+            ('2023-11-01', 'REF000000002', 700, '05'),
+            ('2023-11-01', 'REF000000003', 900, '00'),
+        ])
+        self.merged_df, _, _, _ = process_reconciliation(uploaded, db)
+        self.recon_log = ReconLog.objects.create(bank_id="130447", user_id=self.user)
+        self.artifact = save_merged_artifact(self.recon_log, self.merged_df)
+
+    def test_round_trip(self):
+        rows = read_merged_artifact(self.artifact)
+
+        self.assertEqual(self.artifact.size, os.path.getsize(self.artifact.path))
+        self.assertEqual(sorted(rows['TRN_REF']), sorted(self.merged_df['TRN_REF']))
+        self.assertEqual(rows.set_index('TRN_REF')['Recon Status'].to_dict(),
+                         self.merged_df.set_index('TRN_REF')['Recon Status'].to_dict())
+
+    def test_lookup_by_reference_as_uploaded(self):
+        rows = read_merged_artifact(self.artifact, ref='REF-00000-0002')
+
+        self.assertEqual(rows['TRN_REF'].tolist(), ['REF000000002'])
+        self.assertEqual(rows['Recon Status'].tolist(), ['Reconciled'])
+        self.assertEqual(normalize_ref('REF-00000-0002'), 'REF000000002')
+
+    def test_endpoint_filters_by_status(self):
+        response = self.client.get(f'/recon/runs/{self.recon_log.id}/', {'status': 'succunreconciled'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['rows'], 2)
+        self.assertEqual([row['TRN_REF'] for row in response.data['data']], ['REF000000003', 'REF000000004'])
+        # Bank_only row, the Transactions columns are empty
+        self.assertIsNone(response.data['data'][1]['RESPONSE_CODE'])
+
+    def test_endpoint_arrow(self):
+        response = self.client.get(f'/recon/runs/{self.recon_log.id}/', {'ref': 'REF000000003'},
+                                   HTTP_ACCEPT='application/vnd.apache.arrow.stream')
+
+        table = pa.ipc.open_stream(response.content).read_all()
+        self.assertEqual(table.column('_merge').to_pylist(), ['ABC_only'])
+        self.assertEqual(json.loads(table.schema.metadata[b'recon'])['rows'], 1)
+
+    def test_other_banks_runs_are_not_found(self):
+        other_log = ReconLog.objects.create(bank_id="300000", user_id=self.user)
+        save_merged_artifact(other_log, self.merged_df)
+
+        self.assertEqual(self.client.get(f'/recon/runs/{other_log.id}/').status_code, 404)
+        self.assertEqual(self.client.get('/recon/runs/999999/').status_code, 404)
+
+    def test_invalid_status(self):
+        response = self.client.get(f'/recon/runs/{self.recon_log.id}/', {'status': 'Lost'})
+
+        self.assertEqual(response.status_code, 400)
+
+
+class RunDeltaTests(ReconcileViewTestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        # First run: 1 reconciled, 6 an exception, 2 and 3 unmatched
+        self.first = self.run_artifact("2023-11-01,2023-11-01", [
+            ('2023-11-01', 'CWD', 5000, 'REF000000001'),
+            ('2023-11-01', 'CWD', 700, 'REF000000002'),
+            ('2023-11-01', 'CWD', 100, 'REF000000006'),
+        ], [
+            ('2023-11-01', 'REF000000001', 5000, '00'),
+            ('2023-11-01', 'REF000000003', 900, '00'),
+            ('2023-11-01', 'REF000000006', 100, '05'),
+        ])
+        # A day later, with the next day: 2 and 3 matched, 6 succeeded, 7 is new
+        self.second = self.run_artifact("2023-11-01,2023-11-02", [
+            ('2023-11-01', 'CWD', 5000, 'REF000000001'),
+            ('2023-11-01', 'CWD', 700, 'REF000000002'),
+            ('2023-11-01', 'CWD', 900, 'REF000000003'),
+            ('2023-11-01', 'CWD', 100, 'REF000000006'),
+            ('2023-11-02', 'CWD', 50, 'REF000000009'),
+        ], [
+            ('2023-11-01', 'REF000000001', 5000, '00'),
+            ('2023-11-01', 'REF000000002', 700, '00'),
+            ('2023-11-01', 'REF000000003', 900, '00'),
+            ('2023-11-01', 'REF000000006', 100, '00'),
+            ('2023-11-01', 'REF000000007', 20, '00'),
+            ('2023-11-02', 'REF000000009', 50, '00'),
+        ])
+
+    def run_artifact(self, date_range, uploaded, db):
+        merged_df, _, _, _ = process_reconciliation(make_uploaded_df(uploaded), make_db_df(db))
+        recon_log = ReconLog.objects.create(bank_id="130447", user_id=self.user, rq_date_range=date_range)
+        save_merged_artifact(recon_log, merged_df)
+        return recon_log
+
+    def refs(self, rows):
+        return sorted(row['TRN_REF'] for row in rows)
+
+    def test_delta_since_previous_run(self):
+        response = self.client.get(f'/recon/runs/{self.second.id}/delta/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['previous'], self.first.id)
+        self.assertEqual(response.data['overlap'], ['2023-11-01', '2023-11-01'])
+        # 9 is on a day the first run did not cover
+        self.assertEqual(self.refs(response.data['newly_reconciled']), ['REF000000002', 'REF000000003'])
+        self.assertEqual(self.refs(response.data['newly_unmatched']), ['REF000000007'])
+        self.assertEqual(self.refs(response.data['resolved_exceptions']), ['REF000000006'])
+        self.assertEqual(response.data['counts'], {'newly_reconciled': 2, 'newly_unmatched': 1, 'resolved_exceptions': 1})
+
+    def test_unchanged_rerun_has_no_delta(self):
+        response = self.client.get(f'/recon/runs/{self.second.id}/delta/', {'previous': self.second.id})
+
+        self.assertEqual(response.data['overlap'], ['2023-11-01', '2023-11-02'])
+        self.assertEqual(response.data['counts'], {'newly_reconciled': 0, 'newly_unmatched': 0, 'resolved_exceptions': 0})
+
+    def test_runs_without_common_days(self):
+        later = self.run_artifact("2023-11-05,2023-11-05", [('2023-11-05', 'CWD', 10, 'REF000000010')],
+                                  [('2023-11-05', 'REF000000010', 10, '00')])
+
+        self.assertEqual(self.client.get(f'/recon/runs/{later.id}/delta/').status_code, 404)
+        self.assertEqual(self.client.get(f'/recon/runs/{later.id}/delta/', {'previous': self.first.id}).status_code, 400)
+        self.assertEqual(self.client.get(f'/recon/runs/{self.first.id}/delta/').status_code, 404)
+
+    def test_other_banks_runs_are_not_compared(self):
+        other = ReconLog.objects.create(bank_id="300000", user_id=self.user, rq_date_range="2023-11-01,2023-11-01")
+
+        response = self.client.get(f'/recon/runs/{self.second.id}/delta/', {'previous': other.id})
+
+        self.assertEqual(response.status_code, 404)
+
+
+def make_reconciliation_dataset(size, seed=7):
+    # Uploaded and extracted rows with every case process_reconciliation distinguishes: matches,
+    # amount and date mismatches, failed responses, rows on one side only and repeated references
+    rng = np.random.default_rng(seed)
+    days = pd.date_range('2023-09-01', periods=90).strftime('%Y-%m-%d')
+    uploaded, db = [], []
+    for i in range(size):
+        ref, day, amount = f"RF{i:010d}", days[i % len(days)], int(rng.integers(1, 500)) * 100
+        case = i % 8
+        if case in (0, 1, 2):
+            uploaded.append((day, 'CWD', amount, ref))
+            db.append((day, ref, amount, '00' if case else '05'))
+        elif case == 3:
+            uploaded.append((day, 'CWD', amount, ref))
+            db.append((day, ref, amount + 100, '00'))
+        elif case == 4:
+            uploaded.append((day, 'CWD', amount, ref))
+            db.append((days[(i + 1) % len(days)], ref, amount, '00'))
+        elif case == 5:
+            uploaded.append((day, 'CWD', amount, ref))
+        elif case == 6:
+            db.append((day, ref, amount, '00' if i % 16 < 8 else '91'))
+        else:
+            # Repeated references, the first row wins on both sides
+            uploaded.extend([(day, 'CWD', amount, ref), (day, 'CWD', amount + 1, ref)])
+            db.extend([(day, ref, amount + 1, '00'), (day, ref, amount, '00')])
+    order = rng.permutation(len(db))
+    return make_uploaded_df(uploaded), make_db_df([db[i] for i in order])
+
+
+def chunks(df, size):
+    return (df.iloc[start:start + size] for start in range(0, len(df), size))
+
+
+class ExternalReconciliationTests(SimpleTestCase):
+
+    def run_external(self, uploaded, db, chunk_rows=700, **kwargs):
+        output_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(output_dir.cleanup)
+        stats = external_reconciliation(chunks(uploaded, chunk_rows), chunks(db, chunk_rows), output_dir.name, **kwargs)
+        return stats, read_partitions(output_dir.name)
+
+    def assert_same_classification(self, uploaded, db, **kwargs):
+        merged_df, reconciled, succunreconciled, exceptions = process_reconciliation(uploaded.copy(), db.copy())
+        stats, external = self.run_external(uploaded, db, **kwargs)
+
+        columns = ['TRN_REF', 'DATE_TIME', 'AMOUNT', '_merge', 'Recon Status', 'RESPONSE_CODE', 'Original_TRN_REF',
+                   'Original_ABC Reference']
+
+        def rows(df):
+            return [tuple(row) for row in df[columns].astype(object).where(df[columns].notna(), None).values]
+
+        self.assertCountEqual(rows(external), rows(merged_df))
+
+        self.assertEqual(stats['counts']['reconciled'], len(reconciled))
+        self.assertEqual(stats['counts']['succunreconciled'], len(succunreconciled))
+        self.assertEqual(stats['counts']['exceptions'], len(exceptions))
+        self.assertEqual(stats['counts']['unreconciled'], int((merged_df['Recon Status'] == 'Unreconciled').sum()))
+        return stats
+
+    def test_same_classification_within_budget(self):
+        uploaded, db = make_reconciliation_dataset(4000)
+
+        stats = self.assert_same_classification(uploaded, db, memory_budget=64 * 1024, partition_rows=1000)
+
+        # The budget forced several sorted runs per side and several result partitions
+        self.assertGreater(stats['runs']['uploaded'], 3)
+        self.assertGreater(stats['runs']['db'], 3)
+        self.assertGreater(len(stats['partitions']), 3)
+
+    def test_same_classification_in_a_single_run(self):
+        uploaded, db = make_reconciliation_dataset(500, seed=11)
+
+        stats = self.assert_same_classification(uploaded, db, memory_budget=1024 ** 3)
+
+        self.assertEqual(stats['runs'], {'uploaded': 1, 'db': 1})
+
+    def test_empty_extract(self):
+        uploaded, _ = make_reconciliation_dataset(40)
+
+        stats, external = self.run_external(uploaded, uploaded.iloc[0:0][[]])
+
+        self.assertEqual(stats['counts']['Bank_only'], uploaded['ABC Reference'].nunique())
+        self.assertEqual(set(external['Recon Status']), {'succunreconciled'})
+
+
+@mock.patch('recon.index.reconcileMain', side_effect=fake_reconcile_main)
+class ProfilingTests(ReconcileViewTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user.is_staff = True
+        self.user.save()
+
+    def test_profiled_run_keeps_trace_linked_to_run(self, reconcile_main):
+        response = self.post(profile=True)
+
+        self.assertEqual(response.status_code, 200)
+        profile = response.data['profile']
+        self.assertGreater(profile['peak_memory_bytes'], 0)
+        self.assertEqual([artifact['kind'] for artifact in profile['artifacts']], ['profile', 'allocations'])
+        artifacts = ReconArtifact.objects.filter(recon_log_id=response.data['recon_log']).exclude(kind='merged')
+        self.assertEqual(artifacts.count(), 2)
+
+        stats = pstats.Stats(artifacts.get(kind='profile').path)
+        self.assertTrue(any(function[2] == 'fake_reconcile_main' for function in stats.stats))
+
+        download = self.client.get(profile['artifacts'][1]['url'])
+        self.assertEqual(download.status_code, 200)
+        self.assertIn(b'allocation sites by size', b''.join(download.streaming_content))
+
+    def test_profiled_request_is_not_served_from_the_store(self, reconcile_main):
+        self.post()
+        self.post(profile=True)
+
+        self.assertEqual(reconcile_main.call_count, 2)
+
+    def test_profiling_is_staff_only(self, reconcile_main):
+        self.user.is_staff = False
+        self.user.save()
+
+        response = self.post(profile=True)
+
+        self.assertEqual(response.status_code, 403)
+        reconcile_main.assert_not_called()
+        self.assertEqual(self.client.get('/recon/artifacts/1/').status_code, 403)
+
+    def test_no_profiler_without_the_flag(self, reconcile_main):
+        with mock.patch('recon.views.RunProfiler') as profiler:
+            response = self.post()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('profile', response.data)
+        profiler.assert_not_called()
+        self.assertFalse(ReconArtifact.objects.exclude(kind='merged').exists())
+
+    def test_one_profiled_request_at_a_time(self, reconcile_main):
+        with _profiling:
+            response = self.post(profile=True)
+
+        self.assertEqual(response.status_code, 409)
+        reconcile_main.assert_not_called()
+
+    def test_profiled_settlement(self, reconcile_main):
+        result = pd.DataFrame({'BANK': ['130447'], 'AMOUNT': [100]})
+        with mock.patch('recon.setlement_.settle', return_value=result):
+            response = self.client.post('/recon/settlementcsv_files/', {'batch_number': '42', 'profile': True}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        artifacts = ReconArtifact.objects.filter(batch='42', recon_log=None)
+        self.assertEqual(response['X-Profile-Artifacts'],
+                         ",".join(f"/recon/artifacts/{artifact.id}/" for artifact in artifacts.order_by('id')))
+        read_zip(response.streaming_content)
+
+    def test_profiler_leaves_outside_tracing_running(self, reconcile_main):
+        tracemalloc.start()
+        self.addCleanup(tracemalloc.stop)
+        with RunProfiler():
+            pass
+
+        self.assertTrue(tracemalloc.is_tracing())
+
+
+class ResultProjectionTests(SimpleTestCase):
+
+    def assert_same_response(self, uploaded, db):
+        _, reconciled, succunreconciled, exceptions = process_reconciliation(uploaded, db)
+
+        legacy = json.loads(legacy_results(reconciled, succunreconciled, exceptions))
+        projected = json.loads(projected_results(reconciled, succunreconciled, exceptions))
+
+        self.assertEqual(projected, legacy)
+        return projected
+
+    def test_same_response_as_legacy_chain(self):
+        body = self.assert_same_response(*make_reconciliation_dataset(800))
+
+        reconciled = body['reconciled_data']
+        self.assertEqual(set(reconciled[0]), {'DATE_TIME', 'ABC REFERENCE', 'BATCH', 'AMOUNT', 'ISSUER_CODE',
+                                              'ACQUIRER_CODE', 'RESPONSE_CODE', 'MERGE', 'STATUS'})
+        self.assertRegex(reconciled[0]['DATE_TIME'], r'^\d{4}-\d{2}-\d{2}T00:00:00$')
+        # Missing values are rendered as text in the succunreconciled records
+        self.assertTrue(all(isinstance(value, str) for row in body['succunreconciled_data'] for value in row.values()))
+        self.assertGreater(body['exceptionsRows'], 0)
+
+    def test_same_response_on_benchmark_frames(self):
+        self.assert_same_response(*make_processed_frames(5000))
+
+    def test_projection_keeps_dtypes(self):
+        _, reconciled, succunreconciled, _ = process_reconciliation(*make_reconciliation_dataset(100))
+
+        projected = project(reconciled, RECONCILED_COLUMNS, dates=['DATE_TIME'])
+
+        self.assertEqual(projected['DATE_TIME'].dtype, 'datetime64[ns]')
+        self.assertEqual(projected['MERGE'].dtype, 'category')
+        with self.assertRaises(CustomTypeError):
+            project(succunreconciled.drop(columns=['Transaction type']), SUCCUNRECONCILED_COLUMNS)
+
+
+def make_recon_rows(refs, issuer, acquirer, failed=()):
+    # Reconciled rows as update_reconciliation receives them from reconcileMain
+    return pd.DataFrame({
+        'DATE_TIME': '2023-11-01 12:00:00', 'BATCH': '1', 'AMOUNT': 100, 'ABC REFERENCE': list(refs),
+        'ISSUER_CODE': issuer, 'ACQUIRER_CODE': acquirer,
+        'RESPONSE_CODE': ['05' if ref in failed else '00' for ref in refs],
+    })
+
+
+class RunLockTests(ReconcileViewTestCase):
+
+    def test_lock_is_exclusive_until_released(self):
+        owner = acquire_lock('bank:130447', ttl=60)
+
+        self.assertIsNotNone(owner)
+        self.assertIsNone(acquire_lock('bank:130447', ttl=60))
+        self.assertIsNotNone(acquire_lock('bank:200000', ttl=60))
+        release_lock('bank:130447', owner)
+        self.assertIsNotNone(acquire_lock('bank:130447', ttl=60))
+
+    def test_expired_lock_is_taken_over(self):
+        stale = acquire_lock('bank:130447', ttl=60)
+        ReconRunLock.objects.filter(name='bank:130447').update(expires_at=timezone.now() - dt.timedelta(seconds=1))
+
+        owner = acquire_lock('bank:130447', ttl=60)
+
+        self.assertIsNotNone(owner)
+        # The crashed holder releasing late does not drop the new lease
+        with self.assertLogs(level='ERROR'):
+            release_lock('bank:130447', stale)
+        self.assertEqual(ReconRunLock.objects.get(name='bank:130447').owner, owner)
+
+    def test_held_lock_reports_retry_after(self):
+        acquire_lock('bank:130447', ttl=120)
+
+        with self.assertRaises(LockNotAcquired) as raised:
+            with db_lock('bank:130447', ttl=120):
+                pass
+        self.assertTrue(0 < raised.exception.retry_after <= 120)
+
+    @mock.patch('recon.index.reconcileMain', side_effect=fake_reconcile_main)
+    def test_concurrent_run_for_same_bank_conflicts(self, reconcile_main):
+        with bank_run_lock('130447'):
+            response = self.post()
+
+        self.assertEqual(response.status_code, 409)
+        self.assertIn('Retry-After', response)
+        reconcile_main.assert_not_called()
+        self.assertFalse(ReconRunLock.objects.exists())
+        self.assertEqual(self.post().status_code, 200)
+
+    def test_rerun_is_idempotent(self):
+        df = make_recon_rows(['REF000000001', 'REF000000002', 'REF000000002'], '130447', '200000', failed={'REF000000002'})
+
+        self.assertEqual(update_reconciliation(df, '130447'), "Updated: 0, Inserted: 2")
+        flagged = dict(Recon.objects.values_list('trn_ref', 'iss_flg_date'))
+        self.assertEqual(update_reconciliation(df, '130447'), "Updated: 2, Inserted: 0")
+
+        self.assertEqual(Recon.objects.count(), 2)
+        # The flag date records the first reconciliation, it is not moved by reruns
+        self.assertEqual(dict(Recon.objects.values_list('trn_ref', 'iss_flg_date')), flagged)
+        self.assertEqual(Recon.objects.get(trn_ref='REF000000002').excep_flag, 'Y')
+
+    def test_lost_insert_race_is_updated(self):
+        Recon.objects.create(trn_ref='REF000000001', issuer_code='130447', acquirer_code='200000',
+                             iss_flg='1', acq_flg='0', excep_flag='N')
+        df = make_recon_rows(['REF000000001', 'REF000000002'], '130447', '200000', failed={'REF000000001'})
+
+        # The other bank's run inserted the reference between our lookup and our insert
+        with mock.patch('recon.utils.recorded_refs', return_value=set()):
+            feedback = update_reconciliation(df, '200000')
+
+        self.assertEqual(feedback, "Updated: 1, Inserted: 1")
+        raced = Recon.objects.get(trn_ref='REF000000001')
+        self.assertEqual((raced.iss_flg, raced.acq_flg, raced.excep_flag), ('1', '1', 'Y'))
+
+
+class LockLeaseTests(TransactionTestCase):
+    # Committed rows, the renewer works on its own connection
+
+    def test_lease_is_renewed_while_held(self):
+        with db_lock('bank:130447', ttl=0.6):
+            time.sleep(1.5)
+            # Past the ttl, still held
+            self.assertGreater(ReconRunLock.objects.get(name='bank:130447').expires_at, timezone.now())
+            self.assertIsNone(acquire_lock('bank:130447', ttl=60))
+        self.assertFalse(ReconRunLock.objects.exists())
+
+    def test_lost_lease_is_logged(self):
+        with self.assertLogs(level='ERROR') as logs:
+            with db_lock('bank:130447', ttl=60):
+                ReconRunLock.objects.filter(name='bank:130447').update(owner='other run')
+
+        self.assertIn("Lock 'bank:130447' was lost", logs.output[0])
+        self.assertEqual(ReconRunLock.objects.get().owner, 'other run')
+
+
+class AdmissionControlTests(ReconcileViewTestCase):
+
+    def heavy_slots(self):
+        return list(ReconRunLock.objects.filter(name__startswith='heavy:').values_list('name', flat=True))
+
+    def test_slots_are_bounded(self):
+        first = acquire_slot('heavy:all', 2, ttl=60)
+        second = acquire_slot('heavy:all', 2, ttl=60)
+
+        self.assertNotEqual(first[0], second[0])
+        self.assertIsNone(acquire_slot('heavy:all', 2, ttl=60))
+        release_lock(*first)
+        self.assertEqual(acquire_slot('heavy:all', 2, ttl=60)[0], first[0])
+
+    @mock.patch('recon.index.reconcileMain', side_effect=fake_reconcile_main)
+    def test_bank_over_quota_gets_429(self, reconcile_main):
+        acquire_lock('heavy:bank:130447:0', ttl=60)
+
+        response = self.post()
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], str(settings.RECON_ADMISSION_RETRY_AFTER))
+        reconcile_main.assert_not_called()
+        # No global slot is kept by the rejected request
+        self.assertEqual(self.heavy_slots(), ['heavy:bank:130447:0'])
+
+    @override_settings(RECON_HEAVY_RUNS=1)
+    def test_global_limit_covers_settlement(self):
+        acquire_lock('heavy:all:0', ttl=60)
+        settler = User.objects.create_user(username="settler", password="secret")
+        self.client.force_authenticate(settler)
+
+        with mock.patch('recon.setlement_.settle') as settle:
+            response = self.client.post('/recon/settlementcsv_files/', {'batch_number': '42'}, format='json')
+
+        self.assertEqual(response.status_code, 429)
+        settle.assert_not_called()
+
+    @mock.patch('recon.index.reconcileMain', side_effect=fake_reconcile_main)
+    def test_slots_are_released_after_the_run(self, reconcile_main):
+        self.assertEqual(self.post().status_code, 200)
+        self.assertEqual(self.heavy_slots(), [])
+
+        reconcile_main.side_effect = ValueError("bad statement")
+        with self.assertRaises(CustomReconciliationError):
+            self.post(force=True)
+        self.assertEqual(self.heavy_slots(), [])
+
+    def test_streamed_export_holds_its_slot_until_closed(self):
+        settler = User.objects.create_user(username="settler", password="secret")
+        self.client.force_authenticate(settler)
+        result = pd.DataFrame({'BANK': ['130447'], 'AMOUNT': [100]})
+
+        with mock.patch('recon.setlement_.settle', return_value=result):
+            response = self.client.post('/recon/settlementcsv_files/', {'batch_number': '42'}, format='json')
+        # Nothing generated yet, the export still counts against the limit
+        self.assertEqual(len(self.heavy_slots()), 1)
+
+        read_zip(response.streaming_content)
+        self.assertEqual(self.heavy_slots(), [])
+
+    def test_light_endpoints_are_not_limited(self):
+        acquire_lock('heavy:bank:130447:0', ttl=60)
+        acquire_lock('heavy:all:0', ttl=60)
+        acquire_lock('heavy:all:1', ttl=60)
+
+        self.assertEqual(self.client.get('/recon/exceptions/').status_code, 200)
+
+
+class ProgressTests(ReconcileViewTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.progress_id = str(uuid.uuid4())
+
+    def report(self):
+        progress = ProgressReporter(self.progress_id, self.user.id)
+        progress.stage('parsed', rows=3)
+        progress.stage('matched', reconciled=2)
+        progress.finish(recon_log=7)
+
+    def sse_events(self, response):
+        body = (b"".join(read_stream(response)) if response.streaming else response.content).decode()
+        events = []
+        for block in body.strip().split("\n\n"):
+            fields = dict(line.split(": ", 1) for line in block.split("\n") if not line.startswith(":"))
+            if 'event' in fields:
+                events.append((fields['event'], fields.get('id'), json.loads(fields['data'])))
+        return events
+
+    @override_settings(RECON_PROGRESS_INTERVAL=60)
+    def test_updates_are_throttled(self):
+        progress = ProgressReporter(self.progress_id, self.user.id)
+        progress.stage('matched')
+        for done in range(1, 1001):
+            progress.update('upserted', done=done, total=1000)
+
+        self.assertEqual([event['stage'] for event in get_progress(self.progress_id)['events']], ['matched'])
+        progress.finish()
+        events = get_progress(self.progress_id)['events']
+        # Only the last update is kept, before the end
+        self.assertEqual([(event['stage'], event.get('done')) for event in events], [('matched', None), ('upserted', 1000), ('done', None)])
+
+    def test_reporter_without_id_does_nothing(self):
+        with mock.patch('recon.progress.cache') as progress_cache:
+            progress = ProgressReporter()
+            progress.stage('parsed', rows=3)
+            progress.update('upserted', done=1, total=2)
+            progress.finish()
+
+        progress_cache.set.assert_not_called()
+
+    @mock.patch('recon.index.reconcileMain', side_effect=fake_reconcile_main)
+    def test_reconcile_passes_the_reporter(self, reconcile_main):
+        self.post(progress_id=self.progress_id)
+
+        progress = reconcile_main.call_args.kwargs['progress']
+        self.assertEqual((progress.progress_id, progress.user_id), (self.progress_id, self.user.id))
+
+    def final_event(self):
+        state = get_progress(self.progress_id)
+        self.assertTrue(state['done'])
+        return state['events'][-1]
+
+    @mock.patch('recon.index.reconcileMain', side_effect=fake_reconcile_main)
+    def test_duplicate_upload_finishes_the_progress(self, reconcile_main):
+        first = self.post()
+
+        self.assertTrue(self.post(progress_id=self.progress_id).data['duplicate'])
+        self.assertEqual(self.final_event(), {'seq': 1, 'stage': 'duplicate', 'recon_log': first.data['recon_log']})
+
+    @mock.patch('recon.index.reconcileMain', side_effect=fake_reconcile_main)
+    def test_locked_bank_finishes_the_progress(self, reconcile_main):
+        acquire_lock('bank:130447', ttl=60)
+
+        self.assertEqual(self.post(progress_id=self.progress_id).status_code, 409)
+        event = self.final_event()
+        self.assertEqual(event['stage'], 'rejected')
+        self.assertGreater(event['retry_after'], 0)
+
+    @mock.patch('recon.index.reconcileMain', side_effect=fake_reconcile_main)
+    def test_busy_profiler_finishes_the_progress(self, reconcile_main):
+        self.user.is_staff = True
+        self.user.save()
+
+        with mock.patch('recon.views.RunProfiler') as profiler:
+            profiler.return_value.__enter__.side_effect = ProfilerBusy("Another request is being profiled.")
+            response = self.post(progress_id=self.progress_id, profile=True)
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.final_event()['stage'], 'rejected')
+
+    @mock.patch('recon.index.reconcileMain', side_effect=fake_reconcile_main)
+    def test_admission_reject_finishes_the_progress(self, reconcile_main):
+        acquire_lock('heavy:bank:130447:0', ttl=60)
+
+        self.assertEqual(self.post(progress_id=self.progress_id).status_code, 429)
+        event = self.final_event()
+        self.assertEqual(event['stage'], 'rejected')
+        self.assertEqual(event['retry_after'], settings.RECON_ADMISSION_RETRY_AFTER)
+        reconcile_main.assert_not_called()
+
+    def test_polling(self):
+        self.report()
+
+        response = self.client.get(f'/recon/progress/{self.progress_id}/', {'after': 1})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['done'])
+        self.assertEqual([event['stage'] for event in response.data['events']], ['matched', 'done'])
+
+    def get_asgi(self, **headers):
+        # The test client goes through the WSGI handler, the ASGI one is called directly
+        request = ASGIRequest({
+            'type': 'http', 'method': 'GET', 'path': f'/recon/progress/{self.progress_id}/', 'query_string': b'',
+            'headers': [(b'accept', b'text/event-stream'), *((name.encode(), value.encode()) for name, value in headers.items())],
+        }, io.BytesIO())
+        force_authenticate(request, self.user)
+        return ProgressView.as_view()(request, progress_id=uuid.UUID(self.progress_id))
+
+    def test_event_stream(self):
+        self.report()
+
+        response = self.get_asgi(**{'last-event-id': '1'})
+
+        self.assertTrue(response.is_async)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        events = self.sse_events(response)
+        self.assertEqual([(event, seq) for event, seq, _ in events], [('progress', '2'), ('progress', '3'), ('end', None)])
+        self.assertEqual(events[1][2]['recon_log'], 7)
+
+    @override_settings(RECON_PROGRESS_INTERVAL=0.01)
+    def test_stream_waits_for_the_run(self):
+        threading.Timer(0.2, self.report).start()
+
+        response = self.get_asgi()
+
+        self.assertEqual([event for event, _, _ in self.sse_events(response)], ['progress', 'progress', 'progress', 'end'])
+
+    def test_wsgi_answers_with_the_events_so_far(self):
+        response = self.client.get(f'/recon/progress/{self.progress_id}/', HTTP_ACCEPT='text/event-stream')
+        self.assertFalse(response.streaming)
+        self.assertTrue(response.content.startswith(f"retry: {int(settings.RECON_PROGRESS_POLL_SECONDS * 1000)}".encode()))
+        self.assertEqual(self.sse_events(response), [])
+
+        self.report()
+        response = self.client.get(f'/recon/progress/{self.progress_id}/', HTTP_ACCEPT='text/event-stream',
+                                   HTTP_LAST_EVENT_ID='2')
+        self.assertEqual([(event, seq) for event, seq, _ in self.sse_events(response)], [('progress', '3'), ('end', None)])
+
+    def test_local_cache_is_reported(self):
+        self.assertEqual([warning.id for warning in shared_cache_check(None)], ['recon.W001'])
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://cache:6379'}}):
+            self.assertEqual(shared_cache_check(None), [])
+
+    def test_other_users_progress_is_not_found(self):
+        self.report()
+        other = User.objects.create_user(username="other", password="secret")
+        self.client.force_authenticate(other)
+
+        self.assertEqual(self.client.get(f'/recon/progress/{self.progress_id}/').status_code, 404)
+        response = self.client.get(f'/recon/progress/{self.progress_id}/', HTTP_ACCEPT='text/event-stream')
+        self.assertEqual([event for event, _, _ in self.sse_events(response)], ['error'])
+
+
+class ChunkedUploadTests(ReconcileViewTestCase):
+    CHUNK = 256 * 1024
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(RECON_UPLOADS_DIR=directory.name))
+        self.content = os.urandom(2 * self.CHUNK + 1000)
+
+    def start(self, content=None, sha256=None):
+        content = self.content if content is None else content
+        response = self.client.post('/recon/uploads/', {
+            'filename': 'statement.xlsx', 'size': len(content),
+            'sha256': sha256 or hashlib.sha256(content).hexdigest(), 'chunk_size': self.CHUNK,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.data['upload_id']
+
+    def put_chunk(self, upload_id, offset, data=None, **headers):
+        data = self.content[offset:offset + self.CHUNK] if data is None else data
+        return self.client.put(f'/recon/uploads/{upload_id}/{offset}/', data, content_type='application/octet-stream', **headers)
+
+    def complete(self, upload_id):
+        return self.client.post(f'/recon/uploads/{upload_id}/complete/')
+
+    def test_retry_sends_only_missing_chunks(self):
+        upload_id = self.start()
+        self.assertEqual(self.put_chunk(upload_id, 2 * self.CHUNK).status_code, 204)
+        self.assertEqual(self.put_chunk(upload_id, 0).status_code, 204)
+
+        upload = self.client.get(f'/recon/uploads/{upload_id}/').data
+        self.assertEqual(upload['missing'], [self.CHUNK])
+        self.assertEqual(upload['received_bytes'], len(self.content) - self.CHUNK)
+        self.assertEqual(self.complete(upload_id).status_code, 400)
+
+        self.assertEqual(self.put_chunk(upload_id, self.CHUNK).status_code, 204)
+        response = self.complete(upload_id)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['complete'])
+        with open(ChunkedUpload.objects.get(id=upload_id).path, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertEqual(self.put_chunk(upload_id, 0).status_code, 409)
+
+    def test_bad_chunks_are_not_kept(self):
+        upload_id = self.start()
+
+        self.assertEqual(self.put_chunk(upload_id, 0, self.content[:100]).status_code, 400)
+        self.assertEqual(self.put_chunk(upload_id, 100).status_code, 400)
+        response = self.put_chunk(upload_id, 0, HTTP_X_CHUNK_SHA256=hashlib.sha256(b"other").hexdigest())
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(self.client.get(f'/recon/uploads/{upload_id}/').data['missing']), 3)
+
+        chunk = self.content[:self.CHUNK]
+        response = self.put_chunk(upload_id, 0, HTTP_X_CHUNK_SHA256=hashlib.sha256(chunk).hexdigest())
+        self.assertEqual(response.status_code, 204)
+
+    def test_checksum_mismatch_is_rejected(self):
+        upload_id = self.start(sha256=hashlib.sha256(b"other").hexdigest())
+        for offset in range(0, len(self.content), self.CHUNK):
+            self.put_chunk(upload_id, offset)
+
+        response = self.complete(upload_id)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(response.data['missing']), 3)
+        self.assertIsNone(ChunkedUpload.objects.get(id=upload_id).completed_at)
+
+    @mock.patch('recon.index.reconcileMain', side_effect=fake_reconcile_main)
+    def test_reconcile_from_assembled_file(self, reconcile_main):
+        upload_id = self.start()
+        for offset in range(0, len(self.content), self.CHUNK):
+            self.put_chunk(upload_id, offset)
+        self.complete(upload_id)
+        path = ChunkedUpload.objects.get(id=upload_id).path
+
+        response = self.client.post('/recon/reconcile/', {'upload_id': upload_id}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(reconcile_main.call_args[0][0], path)
+        # Kept, so that a failed run is retried without sending the file again
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(ReconUpload.objects.get().digest, upload_digest([self.content], self.bank.bank_code, rules_version()))
+
+    def test_uploads_are_private(self):
+        upload_id = self.start()
+        other = User.objects.create_user(username="other", password="secret")
+        self.client.force_authenticate(other)
+
+        self.assertEqual(self.client.get(f'/recon/uploads/{upload_id}/').status_code, 404)
+        self.assertEqual(self.put_chunk(upload_id, 0).status_code, 404)
+
+    def test_reconcile_needs_file_or_upload(self):
+        incomplete = self.start()
+        self.assertEqual(self.client.post('/recon/reconcile/', {}, format='json').status_code, 400)
+        self.assertEqual(self.client.post('/recon/reconcile/', {'upload_id': incomplete}, format='json').status_code, 400)
+        both = self.client.post('/recon/reconcile/', {
+            'file': SimpleUploadedFile("statement.xlsx", b"x"), 'upload_id': incomplete,
+        }, format='multipart')
+        self.assertEqual(both.status_code, 400)
+
+
+class ConcurrentReconciliationTests(SimpleTestCase):
+    alias = 'recon_stress'
+    banks = ['100000', '200000', '300000']
+    runs_per_bank = 2
+    refs = 600
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # A local SQLite file shared by the worker threads, each on its own connection
+        cls.directory = tempfile.TemporaryDirectory()
+        connections.settings[cls.alias] = {
+            **connections['default'].settings_dict,
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': f"{cls.directory.name}/stress.sqlite3",
+            'OPTIONS': {'timeout': 30},
+            'CONN_MAX_AGE': 0,
+        }
+        with connections[cls.alias].schema_editor() as editor:
+            editor.create_model(User)
+            editor.create_model(Recon)
+            editor.create_model(ReconRunLock)
+
+    @classmethod
+    def tearDownClass(cls):
+        connections[cls.alias].close()
+        del connections[cls.alias]
+        del connections.settings[cls.alias]
+        cls.directory.cleanup()
+        super().tearDownClass()
+
+    def test_parallel_runs_leave_consistent_recon(self):
+        # Every reference is issued by one bank and acquired by the next, every tenth one failed
+        pairs = {f"REF{i:09d}": (self.banks[i % 3], self.banks[(i + 1) % 3]) for i in range(self.refs)}
+        failed = {ref for i, ref in enumerate(pairs) if i % 10 == 0}
+        router = ReplicaRouter(primary=self.alias, replica='missing')
+        start = threading.Barrier(len(self.banks) * self.runs_per_bank)
+        errors, held = [], []
+
+        def run(bank_code, window):
+            refs = [ref for ref, banks in pairs.items() if bank_code in banks][window::self.runs_per_bank]
+            # Overlapping windows: each run also carries the first half of the other's references
+            refs = refs + [ref for ref, banks in pairs.items() if bank_code in banks][:len(refs) // 2]
+            df = pd.concat([
+                make_recon_rows([ref], *pairs[ref], failed=failed) for ref in refs
+            ], ignore_index=True)
+            try:
+                start.wait()
+                with bank_run_lock(bank_code, wait=60):
+                    acquired = time.monotonic()
+                    update_reconciliation(df, bank_code)
+                    held.append((bank_code, acquired, time.monotonic()))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        with self.settings(DATABASE_ROUTERS=[router]):
+            threads = [
+                threading.Thread(target=run, args=(bank_code, window))
+                for bank_code in self.banks for window in range(self.runs_per_bank)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            self.assertEqual(errors, [])
+            rows = {row['trn_ref']: row for row in Recon.objects.values('trn_ref', 'iss_flg', 'acq_flg', 'excep_flag')}
+            self.assertFalse(ReconRunLock.objects.exists())
+
+        self.assertEqual(set(rows), set(pairs))
+        self.assertTrue(all(row['iss_flg'] == '1' and row['acq_flg'] == '1' for row in rows.values()))
+        self.assertEqual({ref for ref, row in rows.items() if row['excep_flag'] == 'Y'}, failed)
+        # Runs of the same bank never held the lock at the same time
+        for bank_code in self.banks:
+            spans = sorted((start, end) for code, start, end in held if code == bank_code)
+            self.assertEqual(len(spans), self.runs_per_bank)
+            self.assertTrue(all(previous[1] <= following[0] for previous, following in zip(spans, spans[1:])))
+
+
+class ReferenceKeyTests(ReconcileViewTestCase):
+
+    def setUp(self):
+        super().setUp()
+        create_transactions_table()
+        self.insert_transaction('1', '2023-11-01 09:00:00', 'ab-000/123', '130447')
+        self.insert_transaction('2', '2023-11-01 10:00:00', 'REF000000002', '200000')
+
+    def insert_transaction(self, txn_id, date_time, trn_ref, issuer_code):
+        with connections['default'].cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO "Transactions" ("TXN_ID", "DATE_TIME", "TRN_REF", "ISSUER_CODE", "REQUEST_TYPE", "AMOUNT", "RESPONSE_CODE") '
+                'VALUES (%s, %s, %s, %s, %s, %s, %s)',
+                [txn_id, date_time, trn_ref, issuer_code, '1200', 5000, '00'],
+            )
+
+    def build(self, **options):
+        out = io.StringIO()
+        call_command('build_ref_keys', stdout=out, **options)
+        return json.loads(out.getvalue())
+
+    def test_normalize_refs_matches_pre_processing_and_lookups(self):
+        refs = pd.Series(['ab-000/123', '', None, 1234.0, 'X' * 20, '##', 'REF000000002'], dtype=object)
+
+        keys = normalize_refs(refs)
+
+        self.assertEqual(keys.tolist(), [normalize_ref(ref) for ref in refs])
+        self.assertEqual(keys.tolist(), [
+            '0000ab000123', '000000000000', '00000000None', '000000012340', 'X' * 12, '000000000000', 'REF000000002',
+        ])
+        self.assertEqual(pre_processing(pd.DataFrame({'TRN_REF': refs}))['TRN_REF'].tolist(), keys.tolist())
+
+    def test_build_is_incremental(self):
+        self.assertEqual(self.build(), {'since': None, 'scanned': 2, 'created': 2, 'updated': 0})
+        self.insert_transaction('3', '2023-11-02 08:00:00', 'REF000000003', '130447')
+
+        counts = self.build(batch_size=1)
+
+        # Only the rows from the latest keyed timestamp on are scanned again
+        self.assertEqual((counts['scanned'], counts['created']), (2, 1))
+        self.assertEqual(TransactionRefKey.objects.get(txn_id='1').ref_key, '0000ab000123')
+
+    def test_rescan_refreshes_changed_references(self):
+        self.build()
+        with connections['default'].cursor() as cursor:
+            cursor.execute('UPDATE "Transactions" SET "TRN_REF" = %s WHERE "TXN_ID" = %s', ['REF000000009', '1'])
+
+        counts = self.build(since='2023-11-01')
+
+        self.assertEqual((counts['scanned'], counts['created'], counts['updated']), (2, 0, 1))
+        self.assertEqual(TransactionRefKey.objects.get(txn_id='1').ref_key, 'REF000000009')
+
+    def test_lookup_finds_reference_everywhere(self):
+        self.build()
+        Recon.objects.create(trn_ref='ab-000/123', issuer_code='130447', acquirer_code='200000', iss_flg='1',
+                             tran_date=timezone.make_aware(dt.datetime(2023, 11, 1)))
+        covering = ReconLog.objects.create(bank_id='130447', user_id=self.user, rq_date_range='2023-10-30,2023-11-02')
+        ReconLog.objects.create(bank_id='130447', user_id=self.user, rq_date_range='2023-11-05,2023-11-06')
+        ReconLog.objects.create(bank_id='200000', user_id=self.user, rq_date_range='2023-10-30,2023-11-02')
+        ReconArtifact.objects.create(recon_log=covering, kind='merged', path='/nonexistent', size=0)
+
+        # Typed with different separators, found through the normalized key
+        response = self.client.get('/recon/refs/ab.000.123/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['ref_key'], '0000ab000123')
+        self.assertEqual([txn['txn_id'] for txn in response.data['transactions']], ['1'])
+        self.assertEqual([row['trn_ref'] for row in response.data['recon']], ['ab-000/123'])
+        self.assertEqual([run['recon_log'] for run in response.data['runs']], [covering.id])
+        self.assertIn(f'/recon/runs/{covering.id}/?ref=ab.000.123', response.data['runs'][0]['rows'])
+
+    def test_lookup_is_scoped_to_the_bank(self):
+        self.build()
+
+        response = self.client.get('/recon/refs/REF000000002/')
+
+        self.assertEqual(response.data['transactions'], [])
+        self.assertEqual(response.data['runs'], [])
+
+    def test_lookup_cap_counts_the_banks_rows_only(self):
+        self.insert_transaction('3', '2023-11-01 11:00:00', 'REF-000000002', '130447')
+        self.build()
+
+        with mock.patch.object(ReferenceLookupView, 'max_matches', 1):
+            response = self.client.get('/recon/refs/REF000000002/')
+
+        self.assertEqual([txn['txn_id'] for txn in response.data['transactions']], ['3'])
+
+
+INQUIRY_PROCESSING_CODES = ['320000', '340000', '510000', '370000', '180000', '360000']
+
+# The filters the seeded rules replaced
+LEGACY_RULE_FILTERS = {
+    ExclusionRule.RECONCILE: Q(request_type='1200') & ~(
+        Q(txn_type__in=['BI', 'MINI']) & ~Q(amount=0) & ~Q(processing_code__in=INQUIRY_PROCESSING_CODES)
+    ),
+    ExclusionRule.REVERSALS: Q(request_type__in=['1420', '1421']) & ~Q(txn_type__in=['BI', 'MINI'])
+    & ~Q(processing_code__in=INQUIRY_PROCESSING_CODES) & ~Q(amount='0'),
+    ExclusionRule.SETTLEMENT: Q(issuer_code='730147', txn_type__in=['ACI', 'AGENTFLOATINQ'])
+    & ~Q(request_type__in=['1420', '1421']),
+}
+
+
+class ExclusionRuleTests(TestCase):
+
+    def setUp(self):
+        create_transactions_table()
+        self.addCleanup(invalidate_rules)
+        invalidate_rules()
+        columns = ['TXN_ID', 'REQUEST_TYPE', 'TXN_TYPE', 'AMOUNT', 'PROCESSING_CODE', 'ISSUER_CODE', 'RESPONSE_CODE', 'BATCH']
+        values = [
+            ['1200', '1420', '1421', None],
+            ['CWD', 'BI', 'MINI', 'ACI', 'AGENTFLOATINQ', None],
+            [0, 500, None],
+            ['320000', '010000', None],
+            ['730147', '130447'],
+        ]
+        rows = [
+            [str(i), request_type, txn_type, amount, processing_code, issuer_code, '00', '7']
+            for i, (request_type, txn_type, amount, processing_code, issuer_code) in enumerate(
+                (a, b, c, d, e) for a in values[0] for b in values[1] for c in values[2] for d in values[3] for e in values[4]
+            )
+        ]
+        placeholders = ", ".join(["%s"] * len(columns))
+        with connections['default'].cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO "Transactions" ({", ".join(columns)}) VALUES ({placeholders})', rows
+            )
+
+    def ids(self, q):
+        return set(Transactions.objects.filter(q).values_list('txn_id', flat=True))
+
+    def test_seeded_rules_keep_the_legacy_rows(self):
+        for use_case, legacy in LEGACY_RULE_FILTERS.items():
+            with self.subTest(use_case=use_case):
+                self.assertEqual(self.ids(compiled_rules(use_case).q), self.ids(legacy))
+
+    def test_masks_keep_the_same_rows_as_the_filters(self):
+        frame = pd.DataFrame.from_records(list(Transactions.objects.values()))
+        upper = frame.rename(columns={field.attname: field.column for field in Transactions._meta.concrete_fields})
+
+        for use_case in LEGACY_RULE_FILTERS:
+            with self.subTest(use_case=use_case):
+                rules = compiled_rules(use_case)
+                expected = self.ids(rules.q)
+                self.assertEqual(set(frame['txn_id'][rules.mask(frame)]), expected)
+                self.assertEqual(set(upper['TXN_ID'][rules.mask(upper)]), expected)
+
+    def test_rules_are_compiled_once_until_changed(self):
+        rules = compiled_rules(ExclusionRule.SETTLEMENT)
+        with self.assertNumQueries(0):
+            self.assertIs(compiled_rules(ExclusionRule.SETTLEMENT), rules)
+
+        rule = ExclusionRule.objects.get(use_case=ExclusionRule.SETTLEMENT, name='agent float')
+        with self.captureOnCommitCallbacks(execute=True):
+            ExclusionCondition.objects.filter(rule=rule, field='txn_type').update(values='ACI')
+            # Only saves signal, update() does not
+            rule.save()
+
+        changed = compiled_rules(ExclusionRule.SETTLEMENT)
+        self.assertIsNot(changed, rules)
+        self.assertEqual(self.ids(changed.q), self.ids(Q(issuer_code='730147', txn_type='ACI') & ~Q(request_type__in=['1420', '1421'])))
+
+    def test_change_in_another_worker_is_seen(self):
+        rules = compiled_rules(ExclusionRule.SETTLEMENT)
+        # Another worker: the version row changes, this worker's signal handlers do not run
+        ExclusionRule.objects.filter(use_case=ExclusionRule.SETTLEMENT).update(active=False)
+        ExclusionRulesVersion.objects.filter(pk=1).update(version=F('version') + 1)
+
+        self.assertIs(compiled_rules(ExclusionRule.SETTLEMENT), rules)
+        with override_settings(RECON_RULES_CHECK_SECONDS=0):
+            self.assertEqual(compiled_rules(ExclusionRule.SETTLEMENT).rules, [])
+
+    def test_inactive_rules_are_ignored(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ExclusionRule.objects.filter(use_case=ExclusionRule.REVERSALS).update(active=False)
+            ExclusionRule.objects.filter(use_case=ExclusionRule.REVERSALS).first().save()
+
+        self.assertEqual(self.ids(compiled_rules(ExclusionRule.REVERSALS).q), self.ids(Q()))
+
+    def test_condition_must_name_a_transactions_field(self):
+        rule = ExclusionRule.objects.first()
+
+        with self.assertRaises(ValidationError):
+            ExclusionCondition(rule=rule, field='no_such_field', values='1').full_clean()
+        with self.assertRaises(ValidationError):
+            ExclusionCondition(rule=rule, field='txn_type', values=' , ').full_clean()
+
+    def test_settlement_file_uses_rules_and_column_names(self):
+        datafile = select_setle_file('7')
+
+        self.assertEqual(set(datafile['TXN_ID']), self.ids(LEGACY_RULE_FILTERS[ExclusionRule.SETTLEMENT]))
+        self.assertTrue({'AMOUNT', 'ISSUER', 'ACQUIRER', 'TRN_REF', 'DATE_TIME', 'FEE', 'ABC_COMMISSION'} <= set(datafile.columns))
+
+    def test_rule_change_retires_cached_extracts(self):
+        day = dt.date(2023, 11, 1)
+        version = rules_version()
+        store_extract_day('130447', day, (None, np.zeros(0, dtype=bool)), version)
+        self.assertEqual(cached_extract_days('130447', [day], version)[1], [])
+
+        invalidate_rules()
+
+        self.assertEqual(cached_extract_days('130447', [day], rules_version())[1], [day])
+
+
+def read_stream(response):
+    async def collect():
+        return [chunk async for chunk in response.streaming_content]
+    return async_to_sync(collect)()
+
+
+class AsyncListTests(ReconcileViewTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        create_transactions_table()
+        self.client.force_authenticate(None)
+        # The async views authenticate the bearer token themselves
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+        for i in range(3):
+            Recon.objects.create(trn_ref=f"REF00000000{i}", amount=100 + i, issuer_code="130447", acquirer_code="200000", excep_flag="Y")
+        insert_recon_stats('130447', self.user, 1, 0, 0, "Updated: 1, Inserted: 0", 1, 1, "2023-11-01")
+        Transactions.objects.create(
+            txn_id='1', trn_ref='REF000000001', date_time=current_day, amount=100, issuer_code='130447',
+            acquirer_code='200000', response_code='05', request_type='1420', txn_type='CWD',
+        )
+
+    def get_async(self, path, **extra):
+        response = self.client.get(path, **extra)
+        body = b"".join(read_stream(response)) if response.streaming else response.content
+        return response, body
+
+    def test_same_lists_as_the_sync_views(self):
+        for name in ('exceptions', 'reconstats', 'reversals'):
+            with self.subTest(name=name):
+                expected = self.client.get(f'/recon/{name}/')
+                response, body = self.get_async(f'/recon/async/{name}/')
+
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response['Content-Type'], 'application/json')
+                self.assertTrue(expected.data)
+                self.assertEqual(json.loads(body), json.loads(expected.content))
+
+    def test_rows_are_streamed_in_chunks(self):
+        with mock.patch('recon.async_views.AsyncExceptionsView.chunk_size', 2):
+            response = self.client.get('/recon/async/exceptions/')
+            chunks = read_stream(response)
+
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual(len(json.loads(b"".join(chunks))), 3)
+
+    def test_unchanged_poll_is_not_modified(self):
+        self.get_async('/recon/async/exceptions/')
+        cached, body = self.get_async('/recon/async/exceptions/')
+        with self.assertNumQueries(2):
+            # Only the token's user and its bank
+            second, _ = self.get_async('/recon/async/exceptions/', HTTP_IF_NONE_MATCH=cached['ETag'])
+
+        self.assertEqual(len(json.loads(body)), 3)
+        self.assertEqual(second.status_code, 304)
+        self.assertIn('no-cache', second['Cache-Control'])
+
+    def test_requires_a_token_and_a_bank(self):
+        self.client.credentials()
+        self.assertEqual(self.client.get('/recon/async/exceptions/').status_code, 401)
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer not-a-token")
+        self.assertEqual(self.client.get('/recon/async/exceptions/').status_code, 401)
+
+        other = User.objects.create_user(username="unmapped", password="secret")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(other)}")
+        self.assertEqual(self.client.get('/recon/async/exceptions/').status_code, 403)
@@ -0,0 +1,161 @@
+import datetime as dt
+import hashlib
+import os
+import shutil
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import ChunkedUpload
+
+# Bytes read from the request and from the chunk files at a time
+COPY_BUFFER = 1024 * 1024
+
+
+class CustomUploadError(Exception):
+    def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
+
+
+def read_file_chunks(path):
+    with open(path, 'rb') as f:
+        while data := f.read(COPY_BUFFER):
+            yield data
+
+
+def upload_dir(upload):
+    return Path(settings.RECON_UPLOADS_DIR) / str(upload.id)
+
+
+def chunk_path(upload, offset):
+    return upload_dir(upload) / f"{offset}.chunk"
+
+
+def chunk_offsets(upload):
+    return range(0, upload.size, upload.chunk_size)
+
+
+def chunk_length(upload, offset):
+    return min(upload.chunk_size, upload.size - offset)
+
+
+def received_offsets(upload):
+    """
+    The offsets of the chunks already stored, whole ones only.
+    """
+    return [
+        offset for offset in chunk_offsets(upload)
+        if chunk_path(upload, offset).is_file() and chunk_path(upload, offset).stat().st_size == chunk_length(upload, offset)
+    ]
+
+
+def missing_offsets(upload):
+    received = set(received_offsets(upload))
+    return [offset for offset in chunk_offsets(upload) if offset not in received]
+
+
+def write_chunk(upload, offset, stream, sha256=None):
+    """
+    Store one chunk of an upload from a request body, without holding it in memory.
+
+    The chunk is written under a temporary name and renamed, so a chunk is either absent or
+    whole, even when the connection drops or the same chunk is sent twice at once.
+
+    Parameters:
+    upload (ChunkedUpload): The upload.
+    offset (int): Position of the chunk in the file, a multiple of the chunk size.
+    stream (file-like): The request body.
+    sha256 (str): Optional hex sha256 of the chunk, checked before it is kept.
+
+    Raises:
+    CustomUploadError: On a bad offset, a wrong length or a checksum mismatch.
+    """
+    if offset < 0 or offset >= upload.size or offset % upload.chunk_size:
+        raise CustomUploadError(f"Offset {offset} is not the start of a chunk of {upload.chunk_size} bytes.")
+    expected = chunk_length(upload, offset)
+
+    path = chunk_path(upload, offset)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_name(f"{path.name}.{uuid.uuid4().hex}.part")
+    digest = hashlib.sha256()
+    written = 0
+    try:
+        with open(partial, 'wb') as f:
+            # One byte more than expected, to tell an oversized chunk from a whole one
+            while written <= expected:
+                data = stream.read(min(COPY_BUFFER, expected + 1 - written))
+                if not data:
+                    break
+                f.write(data)
+                digest.update(data)
+                written += len(data)
+        if written != expected:
+            raise CustomUploadError(f"Chunk at offset {offset} must be {expected} bytes, got {written}.")
+        if sha256 and digest.hexdigest() != sha256.lower():
+            raise CustomUploadError(f"Checksum mismatch for the chunk at offset {offset}.")
+        os.replace(partial, path)
+    finally:
+        if partial.exists():
+            partial.unlink()
+
+
+def assemble(upload):
+    """
+    Put the chunks of an upload together and check the file against its sha256. The chunks are
+    removed once the file is assembled; after a mismatch they are removed too, as the bad one
+    cannot be told apart, and the upload is sent again.
+
+    Returns:
+    ChunkedUpload: The upload, completed, with the path of the file.
+
+    Raises:
+    CustomUploadError: When chunks are missing or the checksum does not match.
+    """
+    if upload.completed_at is not None:
+        return upload
+
+    missing = missing_offsets(upload)
+    if missing:
+        raise CustomUploadError(f"{len(missing)} chunks are missing.")
+
+    directory = upload_dir(upload)
+    path = directory / f"statement{Path(upload.filename).suffix.lower()}"
+    digest = hashlib.sha256()
+    with open(path, 'wb') as out:
+        for offset in chunk_offsets(upload):
+            with open(chunk_path(upload, offset), 'rb') as chunk:
+                while data := chunk.read(COPY_BUFFER):
+                    out.write(data)
+                    digest.update(data)
+
+    for offset in chunk_offsets(upload):
+        chunk_path(upload, offset).unlink()
+    if digest.hexdigest() != upload.sha256.lower():
+        path.unlink()
+        raise CustomUploadError("Checksum mismatch, the file has to be sent again.")
+
+    upload.path = str(path)
+    upload.completed_at = timezone.now()
+    upload.save(update_fields=['path', 'completed_at'])
+    return upload
+
+
+def purge_expired_uploads():
+    """
+    Remove the uploads, complete or not, started more than RECON_UPLOAD_TTL_HOURS ago.
+
+    Returns:
+    int: The number of uploads removed.
+    """
+    expired = ChunkedUpload.objects.filter(
+        created_at__lt=timezone.now() - dt.timedelta(hours=settings.RECON_UPLOAD_TTL_HOURS)
+    )
+    count = 0
+    for upload in expired:
+        shutil.rmtree(upload_dir(upload), ignore_errors=True)
+        upload.delete()
+        count += 1
+    return count
@@ -1,4 +1,5 @@
-from .views import ExceptionsView, ReconStatsView, ReconcileView, ReversalsView, SettlementView, UploadedFilesViewset, sabsreconcile_csv_filesView
+from .views import UploadChunkView, ChunkedUploadCompleteView, ChunkedUploadDetailView, ChunkedUploadView, DatabaseHealthView, ExtractCacheStatsView, ProgressView, ReferenceLookupView, ReconArtifactView, ExceptionsView, ReconRunDeltaView, ReconRunView, ReconStatsView, ReconcileView, ReversalsView, SettlementView, UploadedFilesViewset, sabsreconcile_csv_filesView
+from .async_views import AsyncExceptionsView, AsyncReconStatsView, AsyncReversalsView
 from rest_framework.routers import DefaultRouter
 from django.urls import path,include
 
@@ -13,5 +14,19 @@ urlpatterns = [
     path('exceptions/', ExceptionsView.as_view(), name='exceptions'),
     path('settlementcsv_files/', SettlementView.as_view(), name='settlement-csv-files'),
     path('sabsreconcile_csv_file/', sabsreconcile_csv_filesView.as_view(), name='ssabsreconcile_csv_file'),
+    path('uploads/', ChunkedUploadView.as_view(), name='uploads'),
+    path('uploads/<uuid:upload_id>/', ChunkedUploadDetailView.as_view(), name='upload-detail'),
+    path('uploads/<uuid:upload_id>/<int:offset>/', UploadChunkView.as_view(), name='upload-chunk'),
+    path('uploads/<uuid:upload_id>/complete/', ChunkedUploadCompleteView.as_view(), name='upload-complete'),
+    path('runs/<int:recon_log_id>/', ReconRunView.as_view(), name='recon-run'),
+    path('runs/<int:recon_log_id>/delta/', ReconRunDeltaView.as_view(), name='recon-run-delta'),
+    path('artifacts/<int:artifact_id>/', ReconArtifactView.as_view(), name='recon-artifact'),
+    path('progress/<uuid:progress_id>/', ProgressView.as_view(), name='progress'),
+    path('refs/<str:ref>/', ReferenceLookupView.as_view(), name='ref-lookup'),
+    path('async/reconstats/', AsyncReconStatsView.as_view(), name='async-reconstats'),
+    path('async/reversals/', AsyncReversalsView.as_view(), name='async-reversals'),
+    path('async/exceptions/', AsyncExceptionsView.as_view(), name='async-exceptions'),
+    path('health/db/', DatabaseHealthView.as_view(), name='db-health'),
+    path('health/extract-cache/', ExtractCacheStatsView.as_view(), name='extract-cache-stats'),
 
 ]
\ No newline at end of file
@@ -1,14 +1,18 @@
+import hashlib
 import logging
-import math
 import re
+import time
 import pandas as pd
 import datetime as dt
-from .models import ReconLog ,Recon, Transactions
-from django.db import transaction,IntegrityError
+from openpyxl import load_workbook
+from .models import ExclusionRule, ReconLog ,Recon, Transactions
+from .rules import compiled_rules
+from django.db import router, transaction,IntegrityError
 from django.core.exceptions import ObjectDoesNotExist
+from django.utils import timezone
 
+from .cache import invalidate_banks
 
-logging.basicConfig(level=logging.DEBUG)
 
 current_date = dt.date.today().strftime('%Y-%m-%d')
 
@@ -29,6 +33,21 @@ class CustomValueError(ValueError):
 class CustomTypeError(TypeError):
     pass
 
+def normalize_refs(refs):
+    """
+    Normalize references the way pre_processing does: alphanumerics only ('0' when nothing is left),
+    left-padded with zeros or truncated to 12 characters.
+
+    Parameters:
+    refs (pandas.Series): Raw references, of any type.
+
+    Returns:
+    pandas.Series: The 12-character keys, same index.
+    """
+    cleaned = refs.astype(str).str.replace(r'[^0-9a-zA-Z]', '', regex=True)
+    cleaned = cleaned.mask(cleaned == '', '0')
+    return cleaned.str.rjust(12, '0').str[:12]
+
 def pre_processing(df):
     try:
         def clean_amount(value):
@@ -46,18 +65,6 @@ def pre_processing(df):
             except (TypeError, AttributeError):
                 raise CustomTypeError(f"Error removing special characters for value: {value}")
 
-        def pad_strings_with_zeros(input_str):
-            try:
-                input_str = str(input_str)
-                if len(input_str) < 12:
-                    num_zeros = 12 - len(input_str)
-                    padded_str = '0' * num_zeros + input_str
-                    return padded_str
-                else:
-                    return input_str[:12]
-            except (TypeError, ValueError):
-                raise CustomTypeError(f"Error padding string with zeros for value: {input_str}")
-
         def clean_date(value):
             try:
                 date_value = pd.to_datetime(value, errors='coerce').date()
@@ -73,69 +80,51 @@ def pre_processing(df):
                 df[column] = df[column].apply(clean_date)
             elif column in ['Amount', 'AMOUNT']:
                 df[column] = df[column].apply(clean_amount)
+            elif column in ['ABC Reference', 'TRN_REF']:
+                # remo_spec_x then padded to 12, on the whole column at once
+                df[column] = normalize_refs(df[column])
             else:
                 df[column] = df[column].apply(remo_spec_x)
 
-            if column in ['ABC Reference', 'TRN_REF']:
-                df[column] = df[column].apply(pad_strings_with_zeros)
-
         return df
     except (CustomValueError, CustomTypeError) as e:
         # Handle the custom exceptions here
         print(f"Custom Error: {e}")
         return None
 
-def use_cols(df):
-    try:
-        # Rename columns
-        df = df.rename(columns={'TXN_TYPE_x': 'TXN_TYPE', 'Original_TRN_REF': 'ABC REFERENCE', '_merge': 'MERGE',
-                                'Recon Status': 'STATUS'})
-
-        # Convert 'DATE_TIME' to datetime
-        df['DATE_TIME'] = pd.to_datetime(df['DATE_TIME'].astype(str), format='%Y%m%d')
+# Result projections of reconcileMain: (output column, merged_df column)
+RECONCILED_COLUMNS = [
+    ('DATE_TIME', 'DATE_TIME'), ('ABC REFERENCE', 'Original_TRN_REF'), ('BATCH', 'BATCH'), ('AMOUNT', 'AMOUNT'),
+    ('ISSUER_CODE', 'ISSUER_CODE'), ('ACQUIRER_CODE', 'ACQUIRER_CODE'), ('RESPONSE_CODE', 'RESPONSE_CODE'),
+    ('MERGE', '_merge'), ('STATUS', 'Recon Status'),
+]
+SUCCUNRECONCILED_COLUMNS = [
+    ('DATE', 'DATE_TIME'), ('TXN TYPE', 'Transaction type'), ('AMOUNT', 'AMOUNT'), ('TRN_REF', 'TRN_REF'),
+    ('MERGE', '_merge'), ('STATUS', 'Recon Status'),
+]
+
+def project(df, columns, dates=()):
+    """
+    Select and rename the result columns of a reconciliation frame in a single copy, keeping dtypes.
 
-        # Select and retain only the desired columns
-        selected_columns = ['DATE_TIME', 'ABC REFERENCE', 'BATCH','AMOUNT', 'ISSUER_CODE', 'ACQUIRER_CODE', 'RESPONSE_CODE',
-                            'MERGE', 'STATUS']
-        df_selected = df[selected_columns]
+    Parameters:
+    df (pandas.DataFrame): A frame returned by process_reconciliation.
+    columns (list of (str, str)): Output and source column names, e.g. RECONCILED_COLUMNS.
+    dates (iterable of str): Output columns holding pre_processing's YYYYMMDD strings, parsed to datetime64.
 
-        return df_selected
+    Returns:
+    pandas.DataFrame: The projected frame. Values are only formatted when the response is rendered (recon.renderers).
+    """
+    try:
+        projected = pd.DataFrame({target: df[source] for target, source in columns})
+        for column in dates:
+            projected[column] = pd.to_datetime(projected[column], format='%Y%m%d')
+        return projected
     except KeyError:
         raise CustomTypeError("Missing columns in the DataFrame")
     except (ValueError, TypeError):
         raise CustomTypeError("Invalid data format")
 
-def use_cols_succunr(df):
-    try:
-        # List of columns to select
-        columns_to_select = ['DATE_TIME', 'Transaction type', 'AMOUNT', 'TRN_REF', '_merge', 'Recon Status']
-
-        # Check if all required columns exist
-        if not all(col in df.columns for col in columns_to_select):
-            raise CustomValueError("Missing columns in the DataFrame")
-
-        # Create a new DataFrame with selected columns
-        new_df = df[columns_to_select]
-        # Replace NaN values with "UNKWN" in the entire DataFrame
-        new_df = new_df.apply(lambda col: col.astype(str).fillna("NULL"))
-
-        # Rename the columns
-        new_df = new_df.rename(columns={
-            'DATE_TIME': 'DATE',
-            'Transaction type': 'TXN TYPE',
-            'AMOUNT': 'AMOUNT',
-            'TRN_REF': 'TRN_REF',
-            '_merge': 'MERGE',
-            'Recon Status': 'STATUS'
-        })
-
-        # # Replace NaN values with "UNKWN" in the entire DataFrame
-        # new_df = new_df.apply(lambda col: col.astype(str).fillna("NULL"))
-
-        return new_df
-    except CustomValueError as e:
-        raise e
-
 def backup_refs(df, reference_column):
     try:
         df['Original_' + reference_column] = df[reference_column]
@@ -191,90 +180,197 @@ def process_reconciliation(DF1: pd.DataFrame, DF2: pd.DataFrame) -> (pd.DataFram
         # Handle exceptions and raise CustomValueError with additional context
         raise CustomValueError(f"Error in process_reconciliation: {str(e)}") from e
 
-def update_reconciliation(df, bank_code):
-    try:
-        if df.empty:
-            logging.warning("No Records to Update.")
-            return "No records to update"
-
-        update_count = 0
-        insert_count = 0
-        current_datetime = dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+def fuzzy_match_unmatched(merged_df: pd.DataFrame, date_tolerance_days: int = 1, amount_tolerance: float = 0,
+                          ref_prefix_length: int = 10) -> pd.DataFrame:
+    """
+    Second matching pass over the rows that process_reconciliation left as Bank_only/ABC_only.
 
-        # Extract all unique ABC REFERENCE values from your DataFrame
-        unique_refs = df['ABC REFERENCE'].unique()
+    Rows are joined on a normalized reference key (leading zeros stripped, first
+    `ref_prefix_length` characters). A pair is a candidate when the references are equal
+    or one is a truncation of the other, within the date and amount tolerances. Exact
+    references score above 0.5, truncated ones at most 0.5. Each Bank_only and ABC_only
+    row appears in at most one candidate: pairs are taken best first, a row whose best
+    pair went to another row gets its next best.
 
-        # Fetch existing trn_ref values from the database based on ABC REFERENCE
-        existing_refs = Recon.objects.filter(trn_ref__in=unique_refs).values_list('trn_ref', flat=True)
+    Returns:
+    pandas.DataFrame: One row per candidate match with a CONFIDENCE score between 0 and 1.
+    """
+    candidate_columns = ['BANK_REFERENCE', 'ABC_REFERENCE', 'BANK_DATE', 'ABC_DATE', 'BANK_AMOUNT', 'ABC_AMOUNT',
+                         'DATE_DIFF_DAYS', 'AMOUNT_DIFF', 'REF_MATCH', 'CONFIDENCE']
+    try:
+        bank_only = merged_df[merged_df['_merge'] == 'Bank_only']
+        abc_only = merged_df[merged_df['_merge'] == 'ABC_only']
+
+        if bank_only.empty or abc_only.empty:
+            return pd.DataFrame(columns=candidate_columns)
+
+        def side(df, prefix, reference_column):
+            refs = df['TRN_REF'].astype(str)
+            keys = refs.str.lstrip('0').str[:ref_prefix_length]
+            # All-zero references (pre_processing's '0' for a missing one) have no key, they would
+            # all join with each other
+            df, refs, keys = df[keys != ''], refs[keys != ''], keys[keys != '']
+            return pd.DataFrame({
+                'REF_KEY': keys.values,
+                prefix + 'TRN_REF': refs.values,
+                prefix + 'REFERENCE': df[reference_column].values,
+                prefix + 'DATE': df['DATE_TIME'].values,
+                prefix + 'PARSED_DATE': pd.to_datetime(df['DATE_TIME'], format='%Y%m%d', errors='coerce').values,
+                prefix + 'AMOUNT': pd.to_numeric(df['AMOUNT'], errors='coerce').values,
+            })
+
+        left = side(bank_only, 'BANK_', 'Original_ABC Reference')
+        right = side(abc_only, 'ABC_', 'Original_TRN_REF')
+        left['BANK_ROW'] = range(len(left))
+        right['ABC_ROW'] = range(len(right))
+
+        # Hash join on the normalized key, then apply the tolerances to the (few) candidate pairs
+        candidates = left.merge(right, on='REF_KEY', how='inner')
+        candidates['DATE_DIFF_DAYS'] = (candidates['BANK_PARSED_DATE'] - candidates['ABC_PARSED_DATE']).dt.days.abs()
+        candidates['AMOUNT_DIFF'] = (candidates['BANK_AMOUNT'] - candidates['ABC_AMOUNT']).abs()
+        # A shared key alone is not enough, neighbouring sequential references (RRNs) share it
+        truncated = [
+            bank.startswith(abc) or abc.startswith(bank)
+            for bank, abc in zip(candidates['BANK_TRN_REF'].str.lstrip('0'), candidates['ABC_TRN_REF'].str.lstrip('0'))
+        ]
+        candidates = candidates[
+            (candidates['DATE_DIFF_DAYS'] <= date_tolerance_days) & (candidates['AMOUNT_DIFF'] <= amount_tolerance)
+            & truncated
+        ]
+
+        if candidates.empty:
+            return pd.DataFrame(columns=candidate_columns)
+
+        exact_ref = candidates['BANK_TRN_REF'] == candidates['ABC_TRN_REF']
+        candidates = candidates.assign(
+            DATE_DIFF_DAYS=candidates['DATE_DIFF_DAYS'].astype(int),
+            REF_MATCH=exact_ref.map({True: 'exact', False: 'prefix'}),
+        )
+        # The date and amount scores are above 0, so any exact reference scores above any truncated one
+        ref_score = exact_ref.astype(float)
+        date_score = 1 - candidates['DATE_DIFF_DAYS'] / (date_tolerance_days + 1)
+        amount_score = 1 - candidates['AMOUNT_DIFF'] / (amount_tolerance + 1)
+        candidates['CONFIDENCE'] = (0.5 * ref_score + 0.3 * date_score + 0.2 * amount_score).round(3)
+
+        # Greedy one-to-one assignment, best candidate first, skipping the pairs of rows already taken
+        candidates = candidates.sort_values('CONFIDENCE', ascending=False, kind='mergesort')
+        bank_taken, abc_taken, assigned = set(), set(), []
+        for position, (bank_row, abc_row) in enumerate(zip(candidates['BANK_ROW'], candidates['ABC_ROW'])):
+            if bank_row not in bank_taken and abc_row not in abc_taken:
+                bank_taken.add(bank_row)
+                abc_taken.add(abc_row)
+                assigned.append(position)
+
+        return candidates.iloc[assigned][candidate_columns].reset_index(drop=True)
+    except Exception as e:
+        # Handle exceptions and raise CustomValueError with additional context
+        raise CustomValueError(f"Error in fuzzy_match_unmatched: {str(e)}") from e
 
-        # Create a set for faster membership testing
-        existing_refs_set = set(existing_refs)
+# References per IN (...) query, below SQL Server's 2100 parameters per statement
+REF_QUERY_CHUNK = 1000
 
-        with transaction.atomic():
-            for index, row in df.iterrows():
-                date_time = row['DATE_TIME']
-                batch = row['BATCH']
-                amount = row['AMOUNT']
-                abc_ref = row['ABC REFERENCE']
-                issuer_code = row['ISSUER_CODE']
-                acquirer_code = row['ACQUIRER_CODE']
-                response_code = row['RESPONSE_CODE']
-
-                if pd.isnull(abc_ref):
-                    logging.warning(f"No References to run Update {index}.")
-                    continue
+def _ref_chunks(refs):
+    refs = list(refs)
+    for start in range(0, len(refs), REF_QUERY_CHUNK):
+        yield refs[start:start + REF_QUERY_CHUNK]
 
-                # Check if the ABC REFERENCE exists in the database
-                if abc_ref in existing_refs_set:
-                    try:
-                        # Try to retrieve the record with the same abc_ref from the database
-                        existing_record = Recon.objects.get(trn_ref=abc_ref)
+def recorded_refs(refs, using):
+    # The references already in Recon, looked up REF_QUERY_CHUNK at a time
+    found = set()
+    for chunk in _ref_chunks(refs):
+        found.update(Recon.objects.using(using).filter(trn_ref__in=chunk).values_list('trn_ref', flat=True))
+    return found
 
-                        # Update recon_obj fields conditionally
-                        if response_code != '00':
-                            if existing_record.excep_flag == 'N':
-                                existing_record.excep_flag = 'Y'
+def update_reconciliation(df, bank_code, progress=None):
+    """
+    Record the reconciled rows of a bank in Recon: insert the references not seen yet and
+    set the bank's flag (and the exception flag) on the others. The references written so
+    far are reported to `progress` (recon.progress.ProgressReporter) as 'upserted'.
 
-                        if existing_record.iss_flg is None or existing_record.iss_flg == 0 or existing_record.iss_flg != 1:
-                            if existing_record.issuer_code == bank_code:
-                                existing_record.iss_flg = 1
-                                existing_record.iss_flg_date = current_datetime
+    Safe to run concurrently with other runs touching the same references: inserts that lose
+    a race are retried as updates, and updates only change the flags still unset, so running
+    the same rows twice leaves Recon as running them once.
 
-                        if existing_record.acq_flg is None or existing_record.acq_flg == 0 or existing_record.acq_flg != 1:
-                            if existing_record.acquirer_code == bank_code:
-                                existing_record.acq_flg = 1
-                                existing_record.acq_flg_date = current_datetime
+    Returns:
+    str: Feedback with the number of updated and inserted references.
+    """
+    try:
+        if df.empty:
+            logging.warning("No Records to Update.")
+            return "No records to update"
 
-                        existing_record.save()
-                        update_count += 1
+        current_datetime = timezone.now()
+        using = router.db_for_write(Recon)
+
+        for index in df.index[df['ABC REFERENCE'].isna()]:
+            logging.warning(f"No References to run Update {index}.")
+        # One row per reference, the first one wins
+        rows = df[df['ABC REFERENCE'].notna()].drop_duplicates(subset='ABC REFERENCE', keep='first')
+        refs = rows['ABC REFERENCE'].tolist()
+
+        existing_refs = recorded_refs(refs, using)
+
+        def new_record(row):
+            return Recon(
+                date_time=current_datetime,
+                tran_date=row.DATE_TIME,
+                batch=row.BATCH,
+                amount=row.AMOUNT,
+                trn_ref=row.ref,
+                issuer_code=row.ISSUER_CODE,
+                acquirer_code=row.ACQUIRER_CODE,
+                iss_flg=1 if row.ISSUER_CODE == bank_code else 0,
+                iss_flg_date=current_datetime if row.ISSUER_CODE == bank_code else None,
+                acq_flg=1 if row.ACQUIRER_CODE == bank_code else 0,
+                acq_flg_date=current_datetime if row.ACQUIRER_CODE == bank_code else None,
+                excep_flag='Y' if row.RESPONSE_CODE != '00' else 'N'
+            )
+
+        new_rows = list(
+            rows[~rows['ABC REFERENCE'].isin(existing_refs)]
+            .rename(columns={'ABC REFERENCE': 'ref'})
+            .itertuples(index=False)
+        )
 
-                    except Recon.DoesNotExist:
-                        # Handle the case where the record no longer exists
-                        pass
-                else:
-                    # If the ABC REFERENCE doesn't exist, insert a new record
+        with transaction.atomic(using=using):
+            inserted_refs = set()
+            try:
+                with transaction.atomic(using=using):
+                    for start in range(0, len(new_rows), REF_QUERY_CHUNK):
+                        Recon.objects.using(using).bulk_create([new_record(row) for row in new_rows[start:start + REF_QUERY_CHUNK]])
+                        if progress is not None:
+                            progress.update('upserted', done=min(start + REF_QUERY_CHUNK, len(new_rows)), total=len(refs))
+                inserted_refs = {row.ref for row in new_rows}
+            except IntegrityError:
+                # A concurrent run inserted some of them first: insert one by one, the others are updated below
+                for row in new_rows:
                     try:
-                        Recon.objects.create(
-                            date_time=current_datetime,
-                            tran_date=date_time,
-                            batch=batch,
-                            amount=amount,
-                            trn_ref=abc_ref,
-                            issuer_code=issuer_code,
-                            acquirer_code=acquirer_code,
-                            iss_flg=1 if issuer_code == bank_code else 0,
-                            iss_flg_date=current_datetime if issuer_code == bank_code else None,
-                            acq_flg=1 if acquirer_code == bank_code else 0,
-                            acq_flg_date=current_datetime if acquirer_code == bank_code else None,
-                            excep_flag='Y' if response_code != '00' else 'N'
-                        )
-                        insert_count += 1
+                        with transaction.atomic(using=using):
+                            new_record(row).save(using=using, force_insert=True)
+                        inserted_refs.add(row.ref)
                     except IntegrityError:
-                        # Another thread/process inserted a record with the same abc_ref simultaneously
-                        logging.warning(f"IntegrityError encountered for ABC REFERENCE: {abc_ref}. Skipping insertion.")
                         pass
-
-        feedback = f"Updated: {update_count}, Inserted: {insert_count}"
+                logging.warning(f"{len(new_rows) - len(inserted_refs)} references were inserted concurrently, updating them instead.")
+
+            # Conditional updates instead of read-modify-write, so runs of the issuing and the
+            # acquiring bank on the same reference can't overwrite each other's flag
+            update_refs = [ref for ref in refs if ref not in inserted_refs]
+            failed_refs = set(rows.loc[rows['RESPONSE_CODE'] != '00', 'ABC REFERENCE'])
+            done = len(inserted_refs)
+            for chunk in _ref_chunks(update_refs):
+                recon_rows = Recon.objects.using(using).filter(trn_ref__in=chunk)
+                recon_rows.filter(trn_ref__in=[ref for ref in chunk if ref in failed_refs], excep_flag='N').update(excep_flag='Y')
+                recon_rows.filter(issuer_code=bank_code).exclude(iss_flg='1').update(iss_flg=1, iss_flg_date=current_datetime)
+                recon_rows.filter(acquirer_code=bank_code).exclude(acq_flg='1').update(acq_flg=1, acq_flg_date=current_datetime)
+                done += len(chunk)
+                if progress is not None:
+                    progress.update('upserted', done=done, total=len(refs))
+
+            # Exceptions are listed for both the issuing and the acquiring bank
+            touched_banks = {bank_code, *df['ISSUER_CODE'].dropna(), *df['ACQUIRER_CODE'].dropna()}
+            transaction.on_commit(lambda: invalidate_banks(touched_banks), using=using)
+
+        feedback = f"Updated: {len(update_refs)}, Inserted: {len(inserted_refs)}"
         logging.info(feedback)
 
         return feedback
@@ -286,7 +382,7 @@ def insert_recon_stats(bank_id,User, reconciled_rows, unreconciled_rows, excepti
                         requested_rows, uploaded_rows, date_range_str):
     try:
         # Create a new ReconLog instance and save it to the database
-        current_datetime = dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        current_datetime = timezone.now()
         recon_log = ReconLog(
             date_time=current_datetime,
             bank_id=bank_id,
@@ -300,17 +396,93 @@ def insert_recon_stats(bank_id,User, reconciled_rows, unreconciled_rows, excepti
             feedback=feedback
         )
         recon_log.save()
+        transaction.on_commit(lambda: invalidate_banks([bank_id]))
+        return recon_log
     except Exception as e:
         # Handle exceptions and raise CustomValueError with additional context
         raise CustomValueError(f"Error in insert_recon_stats: {str(e)}") from e
 
-def unserializable_floats(df: pd.DataFrame) -> pd.DataFrame:
+def ingest_recon_workbook(file, user, batch_size=1000, sheet_name="Sheet1"):
+    """
+    Load the rows of an uploaded workbook (time, transaction type, amount, ABC reference) into Recon.
+
+    The sheet is streamed in read-only mode and handled in batches of `batch_size` rows:
+    each batch is validated at once, references already in Recon (or repeated in the file)
+    are skipped and the rest is written with a single bulk_create.
+
+    Returns:
+    dict: Ingest statistics (rows read/inserted/invalid/skipped, batches, elapsed seconds, rows per second).
+    """
+    stats = {'rows_read': 0, 'rows_inserted': 0, 'rows_invalid': 0, 'rows_skipped': 0, 'batches': 0}
+    started = time.perf_counter()
+
+    def ingest_batch(rows):
+        batch = pd.DataFrame(rows, columns=['TIME', 'TRANSACTION_TYPE', 'AMOUNT', 'ABC_REFERENCE'])
+        times = pd.to_datetime(batch['TIME'], errors='coerce')
+        refs = batch['ABC_REFERENCE'].astype(str).str.strip()
+        amounts = pd.to_numeric(batch['AMOUNT'], errors='coerce')
+        valid = times.notna() & batch['ABC_REFERENCE'].notna() & (refs != '') & amounts.notna()
+        stats['rows_invalid'] += int((~valid).sum())
+
+        refs = refs[valid].drop_duplicates(keep='first')
+        existing_refs = set(Recon.objects.filter(trn_ref__in=list(refs)).values_list('trn_ref', flat=True))
+        new_refs = refs[~refs.isin(existing_refs)]
+        stats['rows_skipped'] += int(valid.sum()) - len(new_refs)
+
+        records = []
+        for index, ref in new_refs.items():
+            date_time = times[index].to_pydatetime()
+            if timezone.is_naive(date_time):
+                date_time = timezone.make_aware(date_time)
+            records.append(Recon(date_time=date_time, last_modified_by_user=user, trn_ref=ref))
+
+        with transaction.atomic():
+            Recon.objects.bulk_create(records, batch_size=batch_size)
+        stats['rows_inserted'] += len(records)
+        stats['batches'] += 1
+
     try:
-        df = df.replace({math.nan: "NaN", math.inf: "Infinity", -math.inf: "-Infinity"})
-        return df
+        wb = load_workbook(file, read_only=True, data_only=True)
+        try:
+            sheet = wb[sheet_name] if sheet_name in wb.sheetnames else wb.active
+            rows = []
+            for row in sheet.iter_rows(min_row=2, max_col=4, values_only=True):
+                # read-only sheets can report trailing empty rows
+                if all(value is None for value in row):
+                    continue
+                rows.append(tuple(row) + (None,) * (4 - len(row)))
+                stats['rows_read'] += 1
+                if len(rows) >= batch_size:
+                    ingest_batch(rows)
+                    rows = []
+            if rows:
+                ingest_batch(rows)
+        finally:
+            wb.close()
     except Exception as e:
-        # Handle exceptions and raise CustomTypeError with additional context
-        raise CustomTypeError(f"Error in unserializable_floats: {str(e)}") from e
+        # Handle exceptions and raise CustomValueError with additional context
+        raise CustomValueError(f"Error in ingest_recon_workbook: {str(e)}") from e
+
+    stats['elapsed_seconds'] = round(time.perf_counter() - started, 3)
+    stats['rows_per_second'] = round(stats['rows_read'] / stats['elapsed_seconds']) if stats['elapsed_seconds'] else stats['rows_read']
+    return stats
+
+def upload_digest(chunks, bank_code, rules_version):
+    """
+    Content hash of an upload: the bank code and the exclusion rules version followed by the file bytes.
+
+    Parameters:
+    chunks (iterable of bytes): The file content, e.g. UploadedFile.chunks().
+    bank_code (str): The bank the file was uploaded for.
+    rules_version (int): recon.rules.rules_version(), the same file is reconciled again under other rules.
+
+    Returns:
+    str: The hex sha256 digest.
+    """
+    digest = hashlib.sha256(f"{bank_code}\0{rules_version}\0".encode())
+    for chunk in chunks:
+        digest.update(chunk)
+    return digest.hexdigest()
 
 ####***************************************************####
 #### ***************Settlemt file**********************####
@@ -396,14 +568,14 @@ def select_setle_file(batch):
     try:
         # Query the Transactions table using Django's database API
         datafile = Transactions.objects.filter(
-            RESPONSE_CODE='00',
-            BATCH=batch,
-            ISSUER_CODE__exact='730147',  # Assuming this is the issuer code to exclude
-            TXN_TYPE__in=['ACI', 'AGENTFLOATINQ']
-        ).exclude(REQUEST_TYPE__in=['1420', '1421'])
+            compiled_rules(ExclusionRule.SETTLEMENT).q,
+            response_code='00',
+            batch=batch,
+        )
 
-        # Convert the QuerySet to a DataFrame
-        datafile = pd.DataFrame(datafile.values())
+        # Convert the QuerySet to a DataFrame, with the column names the settlement steps use (AMOUNT, ISSUER...)
+        columns = {field.attname: field.column for field in Transactions._meta.concrete_fields}
+        datafile = pd.DataFrame.from_records(list(datafile.values()), columns=list(columns)).rename(columns=columns)
 
         return datafile
     except Exception as e:
@@ -415,10 +587,10 @@ def select_setle_file(batch):
 #### ***************Recon Setle file**********************####
 ####***************************************************####    
 
-def read_excel_file(self):
+def read_excel_file(file_path, sheet_name):
         try:
-            with pd.ExcelFile(self.file_path) as xlsx:
-                df = pd.read_excel(xlsx, sheet_name=self.sheet_name, usecols=[0, 1, 2, 7, 8, 9, 11], skiprows=0)
+            with pd.ExcelFile(file_path) as xlsx:
+                df = pd.read_excel(xlsx, sheet_name=sheet_name, usecols=[0, 1, 2, 7, 8, 9, 11], skiprows=0)
             # Rename the columns
             df.columns = ['TRN_REF', 'DATE_TIME', 'BATCH', 'TXN_TYPE', 'AMOUNT', 'FEE', 'ABC_COMMISSION']
             return df
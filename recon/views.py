@@ -1,31 +1,48 @@
-import io
 import json
 import logging
 import os
+import uuid
 import datetime as dt
-from zipfile import ZipFile
+from contextlib import nullcontext
+from pathlib import Path
 
-from django.http import FileResponse, HttpResponse, Http404
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, HttpResponse, Http404, StreamingHttpResponse
 from django.views import View
+from django.db import router
 from django.db.models import Q, F, Case, When, Value, CharField
 from django.db.models.functions import Cast
 from django.http import HttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import urlencode
 
-import pandas as pd
-from openpyxl import load_workbook
 from rest_framework import generics, status, viewsets
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 
-from recon.index import reconcileMain
-from recon.setlement_ import setleSabs, settle
-from recon.utils import unserializable_floats
-from .models import Recon, ReconLog, UploadedFile, Bank, UserBankMapping, Transactions
+from recon.admission import AdmissionControlMixin
+from recon.artifacts import normalize_ref, save_profile_artifacts
+from recon.cache import BankCachedListMixin
+from recon.exports import stream_zip_csv
+from recon.extract_cache import extract_cache
+from recon.health import database_health
+from recon.locks import LockNotAcquired, bank_run_lock, db_lock
+from recon.profiling import ProfilerBusy, RunProfiler
+from recon.rules import compiled_rules, rules_version
+from recon.progress import ProgressReporter, aevent_stream, event_snapshot, events_after, get_progress
+from recon.renderers import ArrowStreamRenderer, DataFrameRenderer, EventStreamRenderer, ParquetRenderer, dumps
+from recon.uploads import CustomUploadError, assemble, chunk_length, chunk_offsets, missing_offsets, purge_expired_uploads, read_file_chunks, write_chunk
+from .models import ChunkedUpload, ExclusionRule, Recon, ReconArtifact, ReconLog, ReconUpload, TransactionRefKey, UploadedFile, Bank, UserBankMapping, Transactions
 from .serializers import (
-    ReconcileSerializer, ReconciliationSerializer, SabsSerializer,
+    ChunkedUploadSerializer, ProgressQuerySerializer, ReconcileSerializer, ReconciliationSerializer, RunDeltaQuerySerializer, RunQuerySerializer, SabsSerializer,
     SettlementSerializer, UploadedFileSerializer, LogSerializer, TransactionSerializer
 )
+# pandas, openpyxl and the reconciliation/settlement modules are imported inside the views
+# that use them, so workers and management commands only load them on first use.
 
 current_date = dt.date.today().strftime('%Y-%m-%d')
 # Get the current date and time
@@ -59,64 +76,166 @@ def get_bank_code_from_request(request):
     
     return bank_code
 
+def find_bank_code_from_request(request):
+    # None for users mapped to no bank, e.g. the staff running settlements
+    mapping = UserBankMapping.objects.select_related('bank').filter(user=request.user).first()
+    return mapping.bank.bank_code if mapping is not None else None
+
 def get_username_from_request(request):
     user = request.user
     username = user.username
     return username
 
+def profile_forbidden(request, profile):
+    # Profiling exposes code paths and timings, it is for staff only
+    if profile and not request.user.is_staff:
+        return Response({"detail": "Profiling is only available to staff users."}, status=status.HTTP_403_FORBIDDEN)
+    return None
+
+def progress_reporter(request, validated_data):
+    progress_id = validated_data.get('progress_id')
+    return ProgressReporter(str(progress_id) if progress_id else None, request.user.id)
+
+def user_upload(request, upload_id):
+    # The user's own chunked uploads only
+    upload = ChunkedUpload.objects.filter(id=upload_id, user=request.user).first()
+    if upload is None:
+        raise Http404("No upload with this id.")
+    return upload
+
+def completed_upload(request, upload_id):
+    return ChunkedUpload.objects.filter(id=upload_id, user=request.user, completed_at__isnull=False).first()
+
+def stored_result(previous_upload):
+    # The stored summary with the rows read back from the run's merged artifact; None when the run
+    # or its artifact has since been deleted, or when the run saw a day still open, the upload is
+    # then reconciled again
+    from recon.artifacts import MERGED, read_run_results
+
+    recon_log = None
+    if previous_upload.recon_log_id is not None:
+        recon_log = ReconLog.objects.filter(id=previous_upload.recon_log_id).first()
+    if recon_log is None:
+        return None
+    # Transactions of the last day of the range were still arriving when the run was made on or before it
+    last_day = (recon_log.rq_date_range or '').partition(',')[2]
+    if not last_day or last_day >= timezone.localtime(recon_log.date_time).date().isoformat():
+        return None
+
+    artifact = ReconArtifact.objects.filter(recon_log=recon_log, kind=MERGED).first()
+    if artifact is None or not os.path.exists(artifact.path):
+        return None
+
+    reconciled_data, succunreconciled_data = read_run_results(artifact)
+    return {
+        **json.loads(previous_upload.result),
+        "reconciled_data": reconciled_data,
+        "succunreconciled_data": succunreconciled_data.astype(str),
+        "recon_log": previous_upload.recon_log_id,
+        "duplicate": True,
+    }
+
+def profile_summary(profiler, artifacts):
+    return {
+        **profiler.summary(),
+        "artifacts": [
+            {"id": artifact.id, "kind": artifact.kind, "size": artifact.size,
+             "url": reverse('recon-artifact', args=[artifact.id])}
+            for artifact in artifacts
+        ],
+    }
+
 class UploadedFilesViewset(viewsets.ModelViewSet):
     queryset = UploadedFile.objects.all()
     serializer_class = UploadedFileSerializer
     def create(self, request, *args, **kwargs):
+        from recon.utils import ingest_recon_workbook
+
         user = request.user
         file = request.FILES['file']
-        wb = load_workbook(file)
-        sheet = wb.get_sheet_by_name("Sheet1")
-        start_row = 2
-        count = 0
-        for _ in sheet.iter_rows(min_row=start_row,max_row=10):
-            row_no = start_row+count
-            time = sheet.cell(row_no,1).value
-            transaction_type = sheet.cell(row_no,2).value
-            amount = sheet.cell(row_no,3).value
-            abc_reference = sheet.cell(row_no,4).value
-            recon = Recon(
-                date_time=time,
-                last_modified_by_user=user,
-                trn_ref=abc_reference,
-                )
-            recon.save()
-            print(time,transaction_type,amount,abc_reference)
-            count+=1
-        
-        return super().create(request, *args, **kwargs) 
+        ingest_stats = ingest_recon_workbook(file, user, batch_size=settings.RECON_INGEST_BATCH_SIZE)
+        file.seek(0)
+
+        response = super().create(request, *args, **kwargs)
+        response.data['ingest'] = ingest_stats
+        return response
 
-class ReconcileView(APIView):
+class ReconcileView(AdmissionControlMixin, APIView):
     serializer_class = ReconcileSerializer
     permission_classes = [IsAuthenticated]
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, ArrowStreamRenderer, ParquetRenderer]
+    bank_code_from_request = staticmethod(find_bank_code_from_request)
 
     def post(self, request):
+        import pandas as pd
+        from recon.index import reconcileMain
+        from recon.utils import fuzzy_match_unmatched, upload_digest
+
         serializer = self.serializer_class(data=request.data)
         user = request.user
         if serializer.is_valid():
-            uploaded_file = serializer.validated_data['file']
+            # Every return before the run finishes the reporter too, a client following it must
+            # not wait for events that never come
+            progress = progress_reporter(request, serializer.validated_data)
+            uploaded_file = serializer.validated_data.get('file')
+            upload = None
+            if serializer.validated_data.get('upload_id'):
+                upload = completed_upload(request, serializer.validated_data['upload_id'])
+                if upload is None:
+                    progress.finish('rejected', detail="No complete upload with this id.")
+                    return Response({"upload_id": ["No complete upload with this id."]}, status=status.HTTP_400_BAD_REQUEST)
+            fuzzy_match = serializer.validated_data['fuzzy_match']
+            profile = serializer.validated_data['profile']
+            forbidden = profile_forbidden(request, profile)
+            if forbidden is not None:
+                progress.finish('rejected', detail=forbidden.data['detail'])
+                return forbidden
             bank_code = get_bank_code_from_request(request)
 
+            # Columnar clients (Arrow/Parquet) get the frames themselves instead of JSON records
+            binary_format = isinstance(request.accepted_renderer, DataFrameRenderer)
+
+            # Same file already reconciled for this bank: hand back the stored outcome.
+            # The fuzzy pass and the columnar formats need the whole merged frame, and a profiled
+            # request needs the run itself, so they always recompute.
+            digest = upload_digest(read_file_chunks(upload.path) if upload else uploaded_file.chunks(), bank_code, rules_version())
+            if not serializer.validated_data['force'] and not fuzzy_match and not binary_format and not profile:
+                previous_upload = ReconUpload.objects.filter(digest=digest).first()
+                data = stored_result(previous_upload) if previous_upload is not None else None
+                if data is not None:
+                    progress.finish('duplicate', recon_log=data['recon_log'])
+                    return Response(data, status=status.HTTP_200_OK)
+
             # Save the uploaded file temporarily
-            temp_file_path = "temp_file.xlsx"
+            # Unique per request, concurrent uploads must not overwrite each other's file.
+            # An assembled chunked upload is read in place and kept, a failed run is retried without sending it again.
+            temp_file_path = upload.path if upload else f"temp_file-{uuid.uuid4().hex}.xlsx"
             try:
-                with open(temp_file_path, "wb") as buffer:
-                    buffer.write(uploaded_file.read())
+                if upload is None:
+                    with open(temp_file_path, "wb") as buffer:
+                        for chunk in uploaded_file.chunks():
+                            buffer.write(chunk)
 
                 try:
                     # Call the main function with the path of the saved file and the swift code
-                    merged_df, reconciled_data, succunreconciled_data, exceptions, feedback, requestedRows, UploadedRows, date_range_str = reconcileMain(
-                        temp_file_path, bank_code, user)
+                    run_stats = {}
+                    profiler = RunProfiler() if profile else None
+                    # One run per bank at a time, a concurrent upload for the same bank gets a 409
+                    with bank_run_lock(bank_code), profiler or nullcontext():
+                        merged_df, reconciled_data, succunreconciled_data, exceptions, feedback, requestedRows, UploadedRows, date_range_str = reconcileMain(
+                            temp_file_path, bank_code, user, stats=run_stats, progress=progress)
 
                     # Perform clean up: remove the temporary file after processing
-                    os.remove(temp_file_path)
+                    if upload is None:
+                        os.remove(temp_file_path)
 
-                    data = {
+                    profile_info = None
+                    if profiler is not None:
+                        # The run was just written, read it back from the primary
+                        recon_log = ReconLog.objects.using(router.db_for_write(ReconLog)).filter(id=run_stats.get('recon_log')).first()
+                        profile_info = profile_summary(profiler, save_profile_artifacts(profiler, recon_log=recon_log))
+
+                    summary = {
                         "reconciledRows": len(reconciled_data) if reconciled_data is not None else 0,
                         "unreconciledRows": len(succunreconciled_data) if succunreconciled_data is not None else 0,
                         "exceptionsRows": len(exceptions) if exceptions is not None else 0, 
@@ -124,14 +243,80 @@ class ReconcileView(APIView):
                         "RequestedRows": requestedRows,
                         "UploadedRows": UploadedRows,
                         "min_max_DateRange": date_range_str,
-                        "reconciled_data": reconciled_data.to_dict(orient='records') if isinstance(reconciled_data, pd.DataFrame) else reconciled_data,
-                        "succunreconciled_data": succunreconciled_data.to_dict(orient='records') if isinstance(succunreconciled_data, pd.DataFrame) else succunreconciled_data
                     }
+
+                    # Optional second pass over the Bank_only/ABC_only rows
+                    fuzzy_candidates = None
+                    if fuzzy_match and isinstance(merged_df, pd.DataFrame):
+                        fuzzy_candidates = fuzzy_match_unmatched(
+                            merged_df,
+                            date_tolerance_days=serializer.validated_data['date_tolerance_days'],
+                            amount_tolerance=serializer.validated_data['amount_tolerance'],
+                        )
+
+                    if binary_format:
+                        frames = None
+                        if isinstance(reconciled_data, pd.DataFrame):
+                            frames = {
+                                "reconciled": reconciled_data,
+                                "succunreconciled": succunreconciled_data,
+                                "exceptions": exceptions,
+                            }
+                            if fuzzy_candidates is not None:
+                                frames["fuzzy_candidates"] = fuzzy_candidates
+                        metadata = {**summary, "extract": run_stats.get('extract'), "stages": run_stats.get('stages'), "recon_log": run_stats.get('recon_log')}
+                        if profile_info is not None:
+                            metadata["profile"] = profile_info
+                        return Response({"frames": frames, "metadata": metadata}, status=status.HTTP_200_OK)
+
+                    data = {
+                        **summary,
+                        # Frames are encoded as records by the renderer, the succunreconciled values as text
+                        "reconciled_data": reconciled_data,
+                        "succunreconciled_data": succunreconciled_data.astype(str) if isinstance(succunreconciled_data, pd.DataFrame) else succunreconciled_data,
+                        "extract": run_stats.get('extract'),
+                        "stages": run_stats.get('stages'),
+                    }
+
+                    # Only successful runs are kept, a failed run is retried on the next upload.
+                    # The rows are not stored, they are read back from the run's merged artifact.
+                    if run_stats.get('recon_log') is not None:
+                        ReconUpload.objects.update_or_create(
+                            digest=digest,
+                            defaults={
+                                'bank_id': bank_code,
+                                'recon_log_id': run_stats['recon_log'],
+                                'result': dumps({**summary, "extract": run_stats.get('extract'), "stages": run_stats.get('stages')}).decode(),
+                                'date_time': timezone.now(),
+                            }
+                        )
+                    data["recon_log"] = run_stats.get('recon_log')
+                    data["duplicate"] = False
+                    if profile_info is not None:
+                        data["profile"] = profile_info
+
+                    if fuzzy_candidates is not None:
+                        data["fuzzyCandidateRows"] = len(fuzzy_candidates)
+                        data["fuzzy_candidates"] = fuzzy_candidates
+
                     return Response(data, status=status.HTTP_200_OK)
 
+                except ProfilerBusy as e:
+                    if upload is None and os.path.exists(temp_file_path):
+                        os.remove(temp_file_path)
+                    progress.finish('rejected', detail=str(e))
+                    return Response({"detail": str(e)}, status=status.HTTP_409_CONFLICT)
+
+                except LockNotAcquired as e:
+                    if upload is None and os.path.exists(temp_file_path):
+                        os.remove(temp_file_path)
+                    detail = f"A reconciliation for bank {bank_code} is already running."
+                    progress.finish('rejected', detail=detail, retry_after=e.retry_after)
+                    return Response({"detail": detail}, status=status.HTTP_409_CONFLICT, headers={"Retry-After": str(e.retry_after)})
+
                 except Exception as e:
                     # If there's an error during the process, ensure the temp file is removed
-                    if os.path.exists(temp_file_path):
+                    if upload is None and os.path.exists(temp_file_path):
                         os.remove(temp_file_path)
 
                     # Handle the specific exceptions and raise custom exceptions with additional context
@@ -145,108 +330,132 @@ class ReconcileView(APIView):
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+def reversals_queryset(bank_code):
+    # Today's failed reversals of the bank, used by ReversalsView and its async version
+    queryset = Transactions.objects.filter(
+        compiled_rules(ExclusionRule.REVERSALS).q &
+        (Q(issuer_code=bank_code) | Q(acquirer_code=bank_code)) & ~Q(response_code='00') & Q(date_time=current_day) 
+    ).annotate(
+        Reversal_type=Case(
+            When(request_type='1420', then=Value('Reversal')),
+            When(request_type='1421', then=Value('Repeat Reversal')),
+            default=Value(None),
+            output_field=CharField()
+        ),
+        Status=Case(
+            When(response_code=None, then=Value('Pending')),
+            When(response_code='00', then=Value('Successful')),
+            default=Value('Failed'),
+            output_field=CharField()
+        )
+    ).values(
+        'date_time',
+        'txn_id',
+        'trn_ref',
+        'amount',
+        'issuer',
+        'acquirer',
+        'txn_type',
+        'Reversal_type',
+        'Status'
+    ).distinct()
+    
+    return queryset
+
 class ReversalsView(generics.ListAPIView):
     serializer_class = TransactionSerializer
 
     def get_queryset(self):
-        bank_code = get_bank_code_from_request(self.request)        
-
-        queryset = Transactions.objects.filter(
-            Q(request_type__in=['1420', '1421']) &
-            ~Q(txn_type__in=['BI', 'MINI']) & 
-            ~Q(processing_code__in=['320000', '340000', '510000', '370000', '180000','360000']) & ~Q(amount='0') & 
-            (Q(issuer_code=bank_code) | Q(acquirer_code=bank_code)) & ~Q(response_code='00') & Q(date_time=current_day) 
-        ).annotate(
-            Reversal_type=Case(
-                When(request_type='1420', then=Value('Reversal')),
-                When(request_type='1421', then=Value('Repeat Reversal')),
-                default=Value(None),
-                output_field=CharField()
-            ),
-            Status=Case(
-                When(response_code=None, then=Value('Pending')),
-                When(response_code='00', then=Value('Successful')),
-                default=Value('Failed'),
-                output_field=CharField()
-            )
-        ).values(
-            'date_time',
-            'txn_id',
-            'trn_ref',
-            'amount',
-            'issuer',
-            'acquirer',
-            'txn_type',
-            'Reversal_type',
-            'Status'
-        ).distinct()
-        
-        return queryset
+        return reversals_queryset(get_bank_code_from_request(self.request))
 
-class ExceptionsView(generics.ListAPIView):
+def exceptions_queryset(bank_code):
+    return Recon.objects.filter(Q(excep_flag="Y")& (Q(issuer_code = bank_code)|Q(acquirer_code = bank_code)))
+
+def recon_stats_queryset(bank_code):
+    return ReconLog.objects.filter(Q(bank_id=bank_code))
+
+class ExceptionsView(BankCachedListMixin, generics.ListAPIView):
        
     serializer_class = ReconciliationSerializer
     """
     Retrieve Exceptions data.
     """
 
+    bank_code_from_request = staticmethod(get_bank_code_from_request)
+
     def get_queryset(self):
         # Use values from .env for database connection
-        bank_code = get_bank_code_from_request(self.request)
-        return Recon.objects.filter(Q(excep_flag="Y")& (Q(issuer_code = bank_code)|Q(acquirer_code = bank_code)))
+        return exceptions_queryset(self.get_bank_code())
 
-class ReconStatsView(generics.ListAPIView):
+class ReconStatsView(BankCachedListMixin, generics.ListAPIView):
     serializer_class = LogSerializer
     """
     Retrieve Stats data.
     """
 
+    bank_code_from_request = staticmethod(get_bank_code_from_request)
+
     def get_queryset(self):
         # Use values from .env for database connection
-        bank_code = get_bank_code_from_request(self.request)
-        return ReconLog.objects.filter(Q(bank_id=bank_code))  
+        return recon_stats_queryset(self.get_bank_code())
         
-class sabsreconcile_csv_filesView(APIView):
-
+def zip_response(members, filename):
+    """
+    Send DataFrames as CSV members of a zip archive, streamed to the client while it is built.
+    """
+    response = StreamingHttpResponse(
+        stream_zip_csv(members, chunk_rows=settings.RECON_EXPORT_CHUNK_ROWS, workers=settings.RECON_EXPORT_WORKERS),
+        content_type='application/zip',
+    )
+    response['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+class sabsreconcile_csv_filesView(AdmissionControlMixin, APIView):
+    permission_classes = [IsAuthenticated]
     serializer_class = SabsSerializer
+    bank_code_from_request = staticmethod(find_bank_code_from_request)
 
     def post(self, request):
+        from recon.setlement_ import setleSabs
+
         serializer = self.serializer_class(data=request.data)
         if serializer.is_valid():
-            uploaded_file = serializer.validated_data['file']
+            uploaded_file = serializer.validated_data.get('file')
             batch_number = serializer.validated_data['batch_number']
+            upload = None
+            if serializer.validated_data.get('upload_id'):
+                upload = completed_upload(request, serializer.validated_data['upload_id'])
+                if upload is None:
+                    return Response({"upload_id": ["No complete upload with this id."]}, status=status.HTTP_400_BAD_REQUEST)
 
             # Save the uploaded file temporarily
-            temp_file_path = "temp_file.xlsx"
-            with open(temp_file_path, "wb") as buffer:
-                buffer.write(uploaded_file.read())
+            # Unique per request, concurrent uploads must not overwrite each other's file.
+            # An assembled chunked upload is read in place and kept.
+            temp_file_path = upload.path if upload else f"temp_file-{uuid.uuid4().hex}.xlsx"
+            if upload is None:
+                with open(temp_file_path, "wb") as buffer:
+                    buffer.write(uploaded_file.read())
 
             try:
-                # Assume setleSabs returns dataframes as one of its outputs
-                _, matched_setle, _, unmatched_setlesabs = setleSabs(temp_file_path, batch_number)
-                
-                # Perform clean up: remove the temporary file after processing
-                os.remove(temp_file_path)
+                progress = progress_reporter(request, serializer.validated_data)
+                _, matched_setle, unmatched_setle, unmatched_setlesabs = setleSabs(temp_file_path, batch_number, progress=progress)
 
-                matched_csv = matched_setle.to_csv(index=False)
-                unmatched_csv = unmatched_setlesabs.to_csv(index=False)
+                # Perform clean up: remove the temporary file after processing
+                if upload is None:
+                    os.remove(temp_file_path)
 
-                # Create a zip file in memory
-                memory_file = io.BytesIO()
-                with ZipFile(memory_file, 'w') as zf:
-                    zf.writestr('matched_setle.csv', matched_csv)
-                    zf.writestr('unmatched_setlesabs.csv', unmatched_csv)
-                
-                # u will figure ou how to retun a zipped file here
-                memory_file.seek(0)
+                # unmatched_setle holds both sides of the outer merge, split it by origin
+                members = [
+                    ('matched_setle.csv', matched_setle),
+                    ('unmatched_setlesabs.csv', unmatched_setlesabs),
+                    ('unmatched_sabs.csv', unmatched_setle[unmatched_setle['_merge'] == 'left_only']),
+                    ('unmatched_db.csv', unmatched_setle[unmatched_setle['_merge'] == 'right_only']),
+                ]
+                return zip_response(members, 'Settlement_.zip')
 
-                response = FileResponse(memory_file, content_type='application/zip')
-                response['Content-Disposition'] = 'attachment; filename=Settlement_.zip'
-                return response            
-            
             except Exception as e:
                 # If there's an error during the process, ensure the temp file is removed
-                if os.path.exists(temp_file_path):
+                if upload is None and os.path.exists(temp_file_path):
                     os.remove(temp_file_path)
                 
                 # Return error as response
@@ -254,40 +463,344 @@ class sabsreconcile_csv_filesView(APIView):
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-class SettlementView(APIView):
+class SettlementView(AdmissionControlMixin, APIView):
+    permission_classes = [IsAuthenticated]
     serializer_class = SettlementSerializer
+    bank_code_from_request = staticmethod(find_bank_code_from_request)
 
     def post(self, request):
+        from recon.setlement_ import settle
+
         serializer = self.serializer_class(data=request.data)
         if serializer.is_valid():
             batch_number = serializer.validated_data['batch_number']
+            profile = serializer.validated_data['profile']
+            forbidden = profile_forbidden(request, profile)
+            if forbidden is not None:
+                return forbidden
 
             try:
                 # Assume the settle function is defined and available here
-                settlement_result = settle(batch_number)
+                profiler = RunProfiler() if profile else None
+                with profiler or nullcontext():
+                    settlement_result = settle(batch_number)
+
+                profile_info = None
+                if profiler is not None:
+                    profile_info = profile_summary(profiler, save_profile_artifacts(profiler, batch=batch_number))
 
                 # Handle case where no records were found or an error occurred in settle
                 if settlement_result is None or settlement_result.empty:
-                    return Response({"detail": "No records for processing found or an error occurred."},
-                                    status=status.HTTP_400_BAD_REQUEST)
-
-                # Convert the DataFrame to CSV
-                settlement_csv = settlement_result.to_csv(index=False)
-
-                # Create a zip file in memory
-                memory_file = io.BytesIO()
-                with ZipFile(memory_file, 'w') as zf:
-                    zf.writestr('settlement_result.csv', settlement_csv)
-
-                memory_file.seek(0)
-
-                response = FileResponse(memory_file, content_type='application/zip')
-                response['Content-Disposition'] = 'attachment; filename=Settlement_.zip'
+                    data = {"detail": "No records for processing found or an error occurred."}
+                    if profile_info is not None:
+                        data["profile"] = profile_info
+                    return Response(data, status=status.HTTP_400_BAD_REQUEST)
+
+                response = zip_response([('settlement_result.csv', settlement_result)], 'Settlement_.zip')
+                if profile_info is not None:
+                    # The body is the archive, the trace is announced in a header
+                    response['X-Profile-Artifacts'] = ",".join(artifact["url"] for artifact in profile_info["artifacts"])
                 return response
 
+            except ProfilerBusy as e:
+                return Response({"detail": str(e)}, status=status.HTTP_409_CONFLICT)
+
             except Exception as e:
                 # Handle other unexpected errors
                 return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+def upload_status(upload):
+    missing = missing_offsets(upload) if upload.completed_at is None else []
+    return {
+        "upload_id": upload.id,
+        "filename": upload.filename,
+        "size": upload.size,
+        "chunk_size": upload.chunk_size,
+        "chunks": len(chunk_offsets(upload)),
+        # Offsets still to PUT, a retry sends only these
+        "missing": missing,
+        "received_bytes": upload.size - sum(chunk_length(upload, offset) for offset in missing),
+        "complete": upload.completed_at is not None,
+    }
+
+class ChunkedUploadView(APIView):
+    """
+    Start a resumable upload of a statement: {filename, size, sha256[, chunk_size]}. The chunks are
+    then PUT to uploads/<id>/<offset>/ in any order, uploads/<id>/ lists the missing ones, and
+    uploads/<id>/complete/ assembles and checks the file. The upload_id is then sent to
+    reconcile/ (or sabsreconcile_csv_file/) instead of the file.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = ChunkedUploadSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        purge_expired_uploads()
+        upload = ChunkedUpload.objects.create(
+            user=request.user,
+            filename=serializer.validated_data['filename'],
+            size=serializer.validated_data['size'],
+            sha256=serializer.validated_data['sha256'].lower(),
+            chunk_size=serializer.validated_data.get('chunk_size') or settings.RECON_UPLOAD_CHUNK_MB * 1024 * 1024,
+        )
+        return Response(upload_status(upload), status=status.HTTP_201_CREATED)
+
+class ChunkedUploadDetailView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, upload_id):
+        return Response(upload_status(user_upload(request, upload_id)), status=status.HTTP_200_OK)
+
+class UploadChunkView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def put(self, request, upload_id, offset):
+        # The body is the raw chunk, read from the stream: it is never parsed nor held in memory
+        upload = user_upload(request, upload_id)
+        if upload.completed_at is not None:
+            return Response({"detail": "The upload is already complete."}, status=status.HTTP_409_CONFLICT)
+        if request.stream is None:
+            return Response({"detail": "The chunk is empty."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            write_chunk(upload, offset, request.stream, sha256=request.headers.get('X-Chunk-SHA256'))
+        except CustomUploadError as e:
+            return Response({"detail": e.message}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+class ChunkedUploadCompleteView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, upload_id):
+        upload = user_upload(request, upload_id)
+        try:
+            # Two completes at once would write the same file
+            with db_lock(f"upload:{upload.id}", ttl=settings.RECON_RUN_LOCK_TTL):
+                upload.refresh_from_db()
+                upload = assemble(upload)
+        except LockNotAcquired as e:
+            return Response({"detail": "The upload is being assembled."}, status=status.HTTP_409_CONFLICT,
+                            headers={"Retry-After": str(e.retry_after)})
+        except CustomUploadError as e:
+            return Response({"detail": e.message, **upload_status(upload)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(upload_status(upload), status=status.HTTP_200_OK)
+
+class ReconRunView(APIView):
+    """
+    Query the kept merged frame of a past run: ?ref= for one reference, ?status= for a recon status.
+    """
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, ArrowStreamRenderer, ParquetRenderer]
+    bank_code_from_request = staticmethod(get_bank_code_from_request)
+
+    def get(self, request, recon_log_id):
+        from recon.artifacts import MERGED, read_merged_artifact
+
+        serializer = RunQuerySerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        # Runs of other banks are reported as missing
+        recon_log = ReconLog.objects.filter(id=recon_log_id, bank_id=get_bank_code_from_request(request)).first()
+        artifact = ReconArtifact.objects.filter(recon_log=recon_log, kind=MERGED).first() if recon_log else None
+        if artifact is None:
+            raise Http404("No kept result for this run.")
+
+        rows = read_merged_artifact(artifact, **serializer.validated_data)
+        metadata = {"recon_log": recon_log.id, "date_time": recon_log.date_time, "rows": len(rows)}
+
+        if isinstance(request.accepted_renderer, DataFrameRenderer):
+            return Response({"frames": {MERGED: rows}, "metadata": metadata}, status=status.HTTP_200_OK)
+
+        # Missing values come back as <NA>, which JSON renders as null
+        records = rows.astype(object).where(rows.notna(), None).to_dict(orient='records')
+        return Response({**metadata, "data": records}, status=status.HTTP_200_OK)
+
+class ReconRunDeltaView(APIView):
+    """
+    What changed since the previous run of the bank on the days both runs covered: the references
+    newly reconciled, newly unmatched, and the exceptions resolved. ?previous= picks the earlier run.
+    """
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, ArrowStreamRenderer, ParquetRenderer]
+
+    def get(self, request, recon_log_id):
+        from recon.artifacts import MERGED
+        from recon.delta import date_overlap, previous_run, run_delta
+
+        serializer = RunDeltaQuerySerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        bank_code = get_bank_code_from_request(request)
+        recon_log = ReconLog.objects.filter(id=recon_log_id, bank_id=bank_code).first()
+        artifact = ReconArtifact.objects.filter(recon_log=recon_log, kind=MERGED).first() if recon_log else None
+        if artifact is None:
+            raise Http404("No kept result for this run.")
+
+        if 'previous' in serializer.validated_data:
+            previous_log = ReconLog.objects.filter(id=serializer.validated_data['previous'], bank_id=bank_code).first()
+            previous_artifact = ReconArtifact.objects.filter(recon_log=previous_log, kind=MERGED).first() if previous_log else None
+            if previous_artifact is None:
+                raise Http404("No kept result for the previous run.")
+            overlap = date_overlap(recon_log.rq_date_range, previous_log.rq_date_range)
+            if overlap is None:
+                return Response({"detail": "The two runs have no day in common."}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            found = previous_run(recon_log)
+            if found is None:
+                raise Http404("No earlier run of this bank covers the same days.")
+            previous_log, previous_artifact, overlap = found
+
+        frames = run_delta(artifact, previous_artifact, overlap)
+        metadata = {
+            "recon_log": recon_log.id,
+            "previous": previous_log.id,
+            "previous_date_time": previous_log.date_time,
+            "overlap": [dt.datetime.strptime(day, '%Y%m%d').date().isoformat() for day in overlap],
+            "counts": {name: len(rows) for name, rows in frames.items()},
+        }
+
+        if isinstance(request.accepted_renderer, DataFrameRenderer):
+            return Response({"frames": frames, "metadata": metadata}, status=status.HTTP_200_OK)
+
+        data = {
+            name: rows.astype(object).where(rows.notna(), None).to_dict(orient='records')
+            for name, rows in frames.items()
+        }
+        return Response({**metadata, **data}, status=status.HTTP_200_OK)
+
+class ProgressView(APIView):
+    """
+    Progress of a run started with progress_id=<id>: Server-Sent Events with Accept: text/event-stream
+    (resuming after Last-Event-ID), otherwise the events so far as JSON, after ?after=<seq>.
+
+    The events are only streamed as they come when served through ASGI (abc_recon.asgi). Through
+    WSGI the events so far are sent and EventSource reconnects every RECON_PROGRESS_POLL_SECONDS.
+    Either way the progress is read from the cache, which has to be shared between workers (recon.W001).
+    """
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, EventStreamRenderer]
+
+    def get(self, request, progress_id):
+        serializer = ProgressQuerySerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        after = serializer.validated_data['after']
+        progress_id = str(progress_id)
+
+        if isinstance(request.accepted_renderer, EventStreamRenderer):
+            last_event_id = request.headers.get('Last-Event-ID', '')
+            if last_event_id.isdigit():
+                after = int(last_event_id)
+            if isinstance(request._request, ASGIRequest):
+                response = StreamingHttpResponse(aevent_stream(progress_id, request.user.id, after), content_type='text/event-stream')
+            else:
+                # A WSGI worker would be held by the stream, the client polls through EventSource's reconnects
+                response = HttpResponse(event_snapshot(progress_id, request.user.id, after), content_type='text/event-stream')
+            response['Cache-Control'] = 'no-cache'
+            # nginx would otherwise buffer the events
+            response['X-Accel-Buffering'] = 'no'
+            return response
+
+        state = get_progress(progress_id)
+        if state is None or state['user'] != request.user.id:
+            raise Http404("No progress for this id.")
+        return Response({"progress_id": progress_id, "done": state['done'], "events": events_after(state, after)})
+
+class ReferenceLookupView(APIView):
+    """
+    Find a reference, as typed or normalized, in the bank's Transactions, in Recon and in the runs
+    that covered it. Transactions are found through the TransactionRefKey index (build_ref_keys).
+    """
+    permission_classes = [IsAuthenticated]
+    max_matches = 100
+
+    def get(self, request, ref):
+        from recon.artifacts import MERGED
+
+        bank_code = get_bank_code_from_request(request)
+        ref_key = normalize_ref(ref)
+        bank_rows = Q(issuer_code=bank_code) | Q(acquirer_code=bank_code)
+
+        # The bank's rows are capped, not the key's: other banks' rows would crowd them out
+        keyed = TransactionRefKey.objects.filter(ref_key=ref_key).values('txn_id')
+        transactions = list(Transactions.objects.filter(bank_rows, txn_id__in=keyed)[:self.max_matches])
+
+        # Recon holds the references as extracted, look up every spelling found
+        refs = {ref, *(txn.trn_ref for txn in transactions if txn.trn_ref)}
+        recon = list(Recon.objects.filter(bank_rows, trn_ref__in=refs))
+
+        # The runs of the bank whose requested range covers a day of the reference
+        days = {
+            timezone.localtime(value).date() if timezone.is_aware(value) else value.date()
+            for value in [txn.date_time for txn in transactions] + [row.tran_date for row in recon] if value
+        }
+        runs = []
+        if days:
+            # A run can only cover days before it
+            first_day = timezone.make_aware(dt.datetime.combine(min(days), dt.time()))
+            for recon_log in ReconLog.objects.filter(bank_id=bank_code, date_time__gte=first_day).order_by('-date_time'):
+                start, _, end = (recon_log.rq_date_range or '').partition(',')
+                if any(start <= day.isoformat() <= end for day in days):
+                    runs.append(recon_log)
+        artifacts = dict(
+            ReconArtifact.objects.filter(recon_log__in=runs, kind=MERGED).values_list('recon_log_id', 'id')
+        ) if runs else {}
+
+        return Response({
+            "ref": ref,
+            "ref_key": ref_key,
+            "transactions": TransactionSerializer(transactions, many=True).data,
+            "recon": ReconciliationSerializer(recon, many=True).data,
+            "runs": [
+                {
+                    "recon_log": recon_log.id,
+                    "date_time": recon_log.date_time,
+                    "rq_date_range": recon_log.rq_date_range,
+                    # The run's kept rows for this reference, see ReconRunView
+                    "rows": request.build_absolute_uri(reverse('recon-run', args=[recon_log.id])) + "?" + urlencode({"ref": ref})
+                    if recon_log.id in artifacts else None,
+                }
+                for recon_log in runs
+            ],
+        }, status=status.HTTP_200_OK)
+
+class ReconArtifactView(APIView):
+    """
+    Download a kept artifact (merged frame, profile, allocation report). Staff only.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, artifact_id):
+        artifact = ReconArtifact.objects.filter(id=artifact_id).first()
+        if artifact is None or not os.path.exists(artifact.path):
+            raise Http404("No such artifact.")
+        return FileResponse(open(artifact.path, 'rb'), as_attachment=True, filename=Path(artifact.path).name)
+
+class DatabaseHealthView(APIView):
+    """
+    Connection health check for load balancers and monitoring.
+    """
+    permission_classes = [AllowAny]
+    authentication_classes = []
+
+    def get(self, request):
+        health = database_health()
+        if health["status"] != "ok":
+            # Callers are anonymous, the cause is in the logs
+            return Response({"status": health["status"]}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response(health, status=status.HTTP_200_OK)
+
+
+class ExtractCacheStatsView(APIView):
+    """
+    Counters of this worker's extract cache (recon.extract_cache). Each worker process has its own.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({"pid": os.getpid(), **extract_cache.stats()}, status=status.HTTP_200_OK)